@@ -0,0 +1,25 @@
+"""chat session rolling summary columns
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+init_db() still runs create_all on startup, so new databases already have
+these columns; IF NOT EXISTS keeps the migration safe on both.
+"""
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary TEXT")
+    op.execute("ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary_message_id INTEGER DEFAULT 0")
+
+
+def downgrade():
+    op.execute("ALTER TABLE chat_sessions DROP COLUMN IF EXISTS summary_message_id")
+    op.execute("ALTER TABLE chat_sessions DROP COLUMN IF EXISTS summary")
@@ -0,0 +1,25 @@
+"""design area and description columns
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-17
+
+Databases migrated before this revision was split out of 0001 already
+have these columns; IF NOT EXISTS keeps it safe on those too.
+"""
+from alembic import op
+
+revision = "0001a"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE designs ADD COLUMN IF NOT EXISTS area DOUBLE PRECISION")
+    op.execute("ALTER TABLE designs ADD COLUMN IF NOT EXISTS description TEXT")
+
+
+def downgrade():
+    op.execute("ALTER TABLE designs DROP COLUMN IF EXISTS description")
+    op.execute("ALTER TABLE designs DROP COLUMN IF EXISTS area")
@@ -0,0 +1,29 @@
+"""pg_trgm indexes for material name/brand search
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for column in ("name", "brand"):
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_materials_{column}_trgm "
+                f"ON materials USING gin ({column} gin_trgm_ops)"
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for column in ("name", "brand"):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS ix_materials_{column}_trgm")
@@ -0,0 +1,30 @@
+"""Unique (supplier, purchase_url) on materials for bulk ingest upserts
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep the newest row of any existing duplicates so the index can be built
+    op.execute(
+        "DELETE FROM materials a USING materials b "
+        "WHERE a.supplier = b.supplier AND a.purchase_url = b.purchase_url AND a.id < b.id"
+    )
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_materials_supplier_purchase_url "
+            "ON materials (supplier, purchase_url)"
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_materials_supplier_purchase_url")
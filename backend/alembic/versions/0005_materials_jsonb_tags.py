@@ -0,0 +1,35 @@
+"""Store material styles/colors as JSONB with GIN indexes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+TAG_COLUMNS = ("styles", "colors")
+
+
+def upgrade():
+    # Rewrites the table under an exclusive lock; run in a maintenance window on large catalogs
+    for column in TAG_COLUMNS:
+        op.execute(f"ALTER TABLE materials ALTER COLUMN {column} TYPE jsonb USING {column}::jsonb")
+    with op.get_context().autocommit_block():
+        for column in TAG_COLUMNS:
+            # Default jsonb_ops: serves ?| (any), ?& and @> (all)
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_materials_{column}_gin "
+                f"ON materials USING gin ({column})"
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for column in TAG_COLUMNS:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS ix_materials_{column}_gin")
+    for column in TAG_COLUMNS:
+        op.execute(f"ALTER TABLE materials ALTER COLUMN {column} TYPE json USING {column}::json")
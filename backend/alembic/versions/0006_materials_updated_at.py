@@ -0,0 +1,32 @@
+"""Track material updates for the vector index catalog version
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A non-volatile default is stored once, so existing rows are not rewritten
+    op.execute(
+        "ALTER TABLE materials ADD COLUMN IF NOT EXISTS updated_at timestamp "
+        "DEFAULT (now() AT TIME ZONE 'utc')"
+    )
+    op.execute("ALTER TABLE materials ALTER COLUMN updated_at DROP DEFAULT")
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_materials_updated_at "
+            "ON materials (updated_at)"
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_materials_updated_at")
+    op.execute("ALTER TABLE materials DROP COLUMN IF EXISTS updated_at")
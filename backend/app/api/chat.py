@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
+from datetime import datetime
+import json
 
-from app.core.database import get_db
+from app.core.database import get_db, async_session
 from app.services.chat_service import ChatService
+from app.services.chat_channel import ChatChannel
+from app.services.faq_index import faq_index
 
 router = APIRouter()
 
@@ -15,11 +20,20 @@ class ChatMessageCreate(BaseModel):
 
 
 class ChatMessageResponse(BaseModel):
-    id: int
+    id: Optional[int] = None  # None until a write-behind batch is written
     role: str
     content: str
     message_type: str
     metadata: Optional[dict] = None
+    created_at: Optional[datetime] = None
+
+
+class ChatMessagePage(BaseModel):
+    messages: List[ChatMessageResponse]
+    before: Optional[str] = None  # cursor for older messages
+    after: Optional[str] = None   # cursor for newer messages
+    has_more_before: Optional[bool] = None
+    has_more_after: Optional[bool] = None
 
 
 @router.post("/projects/{project_id}/sessions")
@@ -43,35 +57,128 @@ async def send_message(
     """Send a message and get AI response"""
     service = ChatService(db)
     
-    # Save user message
-    await service.save_message(session_id, "user", message.content, message.message_type)
+    # Queue user message
+    service.queue_message(session_id, "user", message.content, message.message_type)
     
     # Get AI response
     response = await service.get_ai_response(session_id, message.content)
     
-    # Save AI response
-    ai_message = await service.save_message(
+    # Queue AI response, then write the whole turn at once
+    service.queue_message(
         session_id, 
         "assistant", 
         response["content"],
         response.get("message_type", "text"),
         response.get("metadata")
     )
+    ai_message = (await service.commit_turn())[-1]
     
-    return ai_message
+    return ChatMessageResponse(
+        id=ai_message["id"],
+        role=ai_message["role"],
+        content=ai_message["content"],
+        message_type=ai_message["message_type"],
+        metadata=ai_message["message_metadata"],
+        created_at=ai_message["created_at"]
+    )
 
 
-@router.get("/sessions/{session_id}/messages")
+@router.post("/sessions/{session_id}/messages/stream")
+async def send_message_stream(
+    session_id: int,
+    message: ChatMessageCreate
+):
+    """Send a message and stream the AI response as server-sent events"""
+    
+    async def event_stream():
+        # The response outlives the request dependencies, so the stream
+        # manages its own DB session.
+        async with async_session() as db:
+            service = ChatService(db)
+            try:
+                service.queue_message(session_id, "user", message.content, message.message_type)
+                async for event in service.stream_ai_response(session_id, message.content):
+                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    """Multiplexed chat and quiz sessions over one connection; see ChatChannel for the protocol"""
+    await ChatChannel(websocket).run()
+
+
+@router.get("/sessions/{session_id}/messages", response_model=ChatMessagePage)
 async def get_messages(
     session_id: int,
-    skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get chat history"""
+    """Get chat history (newest page by default; page with before/after cursors)"""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
     service = ChatService(db)
-    messages = await service.get_messages(session_id, skip, limit)
-    return messages
+    try:
+        page = await service.get_messages(session_id, limit=limit, before=before, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page["messages"] = [
+        ChatMessageResponse(
+            id=m.id,
+            role=m.role,
+            content=m.content,
+            message_type=m.message_type,
+            metadata=m.message_metadata,
+            created_at=m.created_at
+        )
+        for m in page["messages"]
+    ]
+    return page
+
+
+@router.post("/messages/{message_id}/approve", response_model=ChatMessageResponse)
+async def approve_message(
+    message_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Approve an assistant answer so repeat questions are answered from the FAQ index"""
+    service = ChatService(db)
+    message = await service.approve_message(message_id)
+    if message is None:
+        raise HTTPException(status_code=404, detail="Assistant message with a preceding question not found")
+    return ChatMessageResponse(
+        id=message.id,
+        role=message.role,
+        content=message.content,
+        message_type=message.message_type,
+        metadata=message.message_metadata,
+        created_at=message.created_at
+    )
+
+
+@router.get("/faq/search")
+async def search_faq(q: str, k: int = Query(3, ge=1, le=20)):
+    """Top FAQ matches with scores, for tuning FAQ_MATCH_THRESHOLD"""
+    if faq_index is None:
+        raise HTTPException(status_code=404, detail="FAQ index is disabled")
+    return {
+        "threshold": faq_index.threshold,
+        "results": [
+            {"id": entry["id"], "source": entry["source"], "score": round(score, 4), "answer": entry["answer"]}
+            for entry, score in faq_index.search(q, k)
+        ]
+    }
 
 
 @router.post("/projects/{project_id}/style-quiz")
@@ -81,26 +188,8 @@ async def start_style_quiz(
 ):
     """Start a style discovery quiz"""
     service = ChatService(db)
-    quiz_session = await service.create_session(project_id, "style_quiz")
-    
-    # Initial quiz question
-    first_question = {
-        "content": "让我们通过几个简单的问题，找到最适合你的装修风格！\n\n首先，你喜欢家里整体氛围是：",
-        "suggestions": [
-            {"id": "bright", "text": "☀️ 明亮通透，阳光充足", "icon": "☀️"},
-            {"id": "warm", "text": "🕯️ 温馨舒适，暖色调", "icon": "🕯️"},
-            {"id": "minimal", "text": "⚪ 简约干净，少即是多", "icon": "⚪"},
-            {"id": "luxury", "text": "✨ 精致奢华，品质感", "icon": "✨"}
-        ]
-    }
-    
-    await service.save_message(
-        quiz_session.id,
-        "assistant",
-        first_question["content"],
-        "quiz",
-        {"suggestions": first_question["suggestions"], "step": 1}
-    )
+    quiz_session, first_question = await service.start_quiz(project_id)
+    await service.commit_turn()
     
     return {"session_id": quiz_session.id, "first_question": first_question}
 
@@ -114,4 +203,5 @@ async def answer_quiz_question(
     """Process quiz answer and return next question or result"""
     service = ChatService(db)
     result = await service.process_quiz_answer(session_id, answer)
+    await service.commit_turn()
     return result
\ No newline at end of file
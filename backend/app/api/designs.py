@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 
 from app.core.database import get_db
@@ -14,6 +14,12 @@ class StyleAdjustment(BaseModel):
     adjustments: dict  # {"brightness": 0.8, "color_warmth": 0.6, "minimalism": 0.9}
 
 
+class DescriptionBatchRequest(BaseModel):
+    rooms: Optional[List[dict]] = None  # [{"room_type": "主卧", "area": 18}] or floorplan rooms
+    style: Optional[str] = None
+    bypass_cache: bool = False
+
+
 @router.get("/projects/{project_id}")
 async def get_project_designs(
     project_id: int,
@@ -25,6 +31,25 @@ async def get_project_designs(
     return designs
 
 
+@router.post("/projects/{project_id}/descriptions")
+async def generate_descriptions(
+    project_id: int,
+    request: DescriptionBatchRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Generate design descriptions for all rooms of a project"""
+    service = DesignService(db)
+    result = await service.generate_descriptions(
+        project_id,
+        rooms=request.rooms,
+        style=request.style,
+        bypass_cache=request.bypass_cache
+    )
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+
 @router.post("/{design_id}/adjust-style")
 async def adjust_style(
     design_id: int,
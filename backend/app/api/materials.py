@@ -1,14 +1,30 @@
-from fastapi import APIRouter, Depends, Query
+import os
+import uuid
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_db, async_session
 from app.services.material_service import MaterialService
+from app.services.material_cache import material_result_cache
+from app.services.material_ingest import start_ingest_job, get_ingest_job
 
 router = APIRouter()
 
 
+async def cached(endpoint: str, params: dict, compute, casefold=()):
+    """Serve a material endpoint from the versioned result cache when enabled"""
+    async def run():
+        return jsonable_encoder(await compute())
+    if material_result_cache is None:
+        return await run()
+    return await material_result_cache.get_or_compute(endpoint, params, run, casefold)
+
+
 @router.get("/search")
 async def search_materials(
     query: Optional[str] = None,
@@ -19,21 +35,61 @@ async def search_materials(
     supplier: Optional[str] = None,
     skip: int = 0,
     limit: int = 50,
+    styles: List[str] = Query([]),
+    colors: List[str] = Query([]),
+    style_match: str = Query("any", pattern="^(any|all)$"),
+    color_match: str = Query("any", pattern="^(any|all)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Search materials with filters; repeat styles/colors for multi-tag any/all matching"""
+    service = MaterialService(db)
+    params = {
+        "query": query,
+        "category": category,
+        "style": style,
+        "min_price": min_price,
+        "max_price": max_price,
+        "supplier": supplier,
+        "skip": skip,
+        "limit": limit,
+        "styles": styles,
+        "colors": colors,
+        "style_match": style_match,
+        "color_match": color_match
+    }
+    return await cached("search", params, lambda: service.search_materials(**params), casefold=("query",))
+
+
+@router.get("/faceted-search")
+async def faceted_search(
+    query: Optional[str] = None,
+    category: List[str] = Query([]),
+    styles: List[str] = Query([]),
+    colors: List[str] = Query([]),
+    supplier: List[str] = Query([]),
+    price_bucket: List[str] = Query([]),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    skip: int = 0,
+    limit: int = Query(50, ge=1, le=200),
     db: AsyncSession = Depends(get_db)
 ):
-    """Search materials with filters"""
+    """Search materials and return facet counts for every filter in one call"""
     service = MaterialService(db)
-    materials = await service.search_materials(
+    return await service.faceted_search(
         query=query,
-        category=category,
-        style=style,
+        filters={
+            "category": category,
+            "styles": styles,
+            "colors": colors,
+            "supplier": supplier,
+            "price": price_bucket
+        },
         min_price=min_price,
         max_price=max_price,
-        supplier=supplier,
         skip=skip,
         limit=limit
     )
-    return materials
 
 
 @router.get("/categories")
@@ -42,8 +98,7 @@ async def get_categories(
 ):
     """Get all material categories"""
     service = MaterialService(db)
-    categories = await service.get_categories()
-    return categories
+    return await cached("categories", {}, service.get_categories)
 
 
 @router.get("/budget-options")
@@ -66,21 +121,95 @@ async def get_budget_options(
 async def match_materials_for_project(
     project_id: int,
     budget_tier: str = "standard",  # economy, standard, premium
+    alternatives: int = Query(3, ge=0, le=10),
     db: AsyncSession = Depends(get_db)
 ):
     """Match materials for a project based on style and budget"""
     service = MaterialService(db)
-    matched_materials = await service.match_materials(project_id, budget_tier)
+    matched_materials = await service.match_materials(project_id, budget_tier, alternatives)
+    if "error" in matched_materials:
+        status_code = 404 if matched_materials["error"] == "Project not found" else 400
+        raise HTTPException(status_code=status_code, detail=matched_materials["error"])
     return matched_materials
 
 
+@router.post("/ingest")
+async def ingest_catalog(
+    file: UploadFile = File(...),
+    supplier: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),  # csv or jsonl; default from the file name
+    embed: bool = Form(True)
+):
+    """Upload a supplier catalog and upsert it in the background"""
+    if format not in (None, "csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="format must be csv or jsonl")
+    os.makedirs(settings.MATERIAL_INGEST_DIR, exist_ok=True)
+    path = os.path.join(settings.MATERIAL_INGEST_DIR, f"{uuid.uuid4().hex}_{os.path.basename(file.filename or 'catalog')}")
+    with open(path, "wb") as out:
+        while chunk := await file.read(1024 * 1024):
+            out.write(chunk)
+    job_id = start_ingest_job(async_session, path, format, supplier, embed, remove_source=True)
+    return {"job_id": job_id}
+
+
+@router.get("/ingest/{job_id}")
+async def get_ingest_progress(job_id: str):
+    """Progress of a catalog ingest started on this worker"""
+    job = get_ingest_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
+
+@router.get("/by-color")
+async def search_by_color(
+    color: str,  # color tag (walnut, grey, ...), #rrggbb or r,g,b
+    category: Optional[str] = None,
+    k: int = Query(20, ge=1, le=100),
+    min_share: float = Query(0.15, ge=0.0, le=1.0),  # ignore colors covering less of the image
+    max_distance: Optional[float] = Query(None, gt=0),  # delta E
+    db: AsyncSession = Depends(get_db)
+):
+    """Find materials whose images have a dominant color close to the given one"""
+    service = MaterialService(db)
+    result = await service.search_by_color(color, category, k, min_share, max_distance)
+    if "error" in result:
+        status_code = 400 if result["error"].startswith("Unrecognized") else 503
+        raise HTTPException(status_code=status_code, detail=result["error"])
+    return result
+
+
+@router.get("/{material_id}/similar-colors")
+async def get_similar_colors(
+    material_id: int,
+    k: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Find materials with a similar overall color distribution"""
+    service = MaterialService(db)
+    result = await service.get_similar_colors(material_id, k)
+    if "error" in result:
+        status_code = 404 if result["error"] == "Material has no color features" else 503
+        raise HTTPException(status_code=status_code, detail=result["error"])
+    return result
+
+
 @router.get("/{material_id}/alternatives")
 async def get_alternatives(
     material_id: int,
     same_price_range: bool = True,
+    style: Optional[str] = None,
+    k: int = Query(5, ge=1, le=50),
+    tolerance: float = Query(0.2, ge=0.0, le=1.0),  # price window, fraction of the material's price
     db: AsyncSession = Depends(get_db)
 ):
     """Get alternative materials"""
     service = MaterialService(db)
-    alternatives = await service.get_alternatives(material_id, same_price_range)
-    return alternatives
\ No newline at end of file
+    params = {
+        "material_id": material_id,
+        "same_price_range": same_price_range,
+        "style": style,
+        "k": k,
+        "tolerance": tolerance
+    }
+    return await cached("alternatives", params, lambda: service.get_alternatives(**params))
\ No newline at end of file
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import redis.asyncio as aioredis
+
+
+def make_cache_key(namespace: str, payload: Any) -> str:
+    """Stable key for a JSON-serializable payload"""
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class TTLCache:
+    """
+    In-process LRU cache with per-entry expiry.
+
+    With sliding=True every hit pushes the expiry back, so `ttl` acts as an
+    idle timeout.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, sliding: bool = False):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sliding = sliding
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        if self.sliding:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Look up without touching LRU order, expiry or hit/miss counters"""
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-process TTLCache in front of Redis.
+
+    Redis is optional and best-effort; if it is unreachable the cache keeps
+    working from memory and counts the error instead of failing the caller.
+    Values must be JSON-serializable.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        maxsize: int = 1024,
+        ttl: float = 300.0,
+        redis_url: Optional[str] = None
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.redis_url = redis_url
+        self._redis = None
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+
+    @property
+    def redis(self):
+        if self._redis is None and self.redis_url:
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._redis
+
+    def key(self, payload: Any) -> str:
+        return make_cache_key(self.namespace, payload)
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None or self.redis is None:
+            return value
+
+        try:
+            raw = await self.redis.get(key)
+        except Exception:
+            self.redis_errors += 1
+            return None
+        if raw is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(
+                key,
+                json.dumps(value, ensure_ascii=False),
+                ex=int(ttl or self.ttl)
+            )
+        except Exception:
+            self.redis_errors += 1
+
+    async def delete(self, key: str):
+        self.local.delete(key)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.delete(key)
+        except Exception:
+            self.redis_errors += 1
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    def stats(self) -> Dict:
+        local = self.local.stats()
+        hits = local["hits"] + self.redis_hits
+        lookups = local["hits"] + local["misses"]
+        return {
+            "namespace": self.namespace,
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "local": local,
+            "redis": {
+                "enabled": self.redis_url is not None,
+                "hits": self.redis_hits,
+                "misses": self.redis_misses,
+                "errors": self.redis_errors
+            }
+        }
@@ -0,0 +1,122 @@
+import asyncio
+import enum
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class CircuitState(str, enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker over a rolling window of recent calls.
+
+    The circuit opens when, over the last `window_size` calls (and at least
+    `min_calls`), the failure rate or the slow-call rate crosses its
+    threshold. While open, `allow()` raises CircuitOpenError so callers can
+    fall back immediately. After `open_seconds` the breaker goes half-open
+    and runs `probe` in the background; a successful probe closes the
+    circuit, a failed one re-opens it. User traffic is never used as the
+    probe.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        probe: Optional[Callable[[], Awaitable[None]]] = None,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_call_rate_threshold: float = 0.8,
+        window_size: int = 20,
+        min_calls: int = 5,
+        open_seconds: float = 30.0
+    ):
+        self.name = name
+        self.probe = probe
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CircuitState.CLOSED
+        self._window: deque = deque(maxlen=window_size)
+        self._probe_task: Optional[asyncio.Task] = None
+        self._changed_at = time.time()
+        self.rejected = 0
+        self.transitions: Dict[str, int] = {}
+
+    def allow(self):
+        if self.state != CircuitState.CLOSED:
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is {self.state.value}")
+
+    def record_success(self, latency: float):
+        self._record(failed=False, latency=latency)
+
+    def record_failure(self, latency: float):
+        self._record(failed=True, latency=latency)
+
+    def _record(self, failed: bool, latency: float):
+        if self.state != CircuitState.CLOSED:
+            return
+        self._window.append((failed, latency >= self.slow_call_seconds))
+        if len(self._window) < self.min_calls:
+            return
+
+        calls = len(self._window)
+        failure_rate = sum(1 for f, _ in self._window if f) / calls
+        slow_rate = sum(1 for _, s in self._window if s) / calls
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._open()
+
+    def _transition(self, state: CircuitState):
+        key = f"{self.state.value}->{state.value}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.state = state
+        self._changed_at = time.time()
+
+    def _open(self):
+        self._transition(CircuitState.OPEN)
+        self._window.clear()
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+
+    async def _probe_loop(self):
+        while self.state == CircuitState.OPEN:
+            await asyncio.sleep(self.open_seconds)
+            self._transition(CircuitState.HALF_OPEN)
+            try:
+                if self.probe is not None:
+                    await self.probe()
+            except Exception:
+                self._transition(CircuitState.OPEN)
+            else:
+                self._transition(CircuitState.CLOSED)
+
+    def reset(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        self._window.clear()
+        if self.state != CircuitState.CLOSED:
+            self._transition(CircuitState.CLOSED)
+
+    def stats(self) -> Dict:
+        calls = len(self._window)
+        return {
+            "state": self.state.value,
+            "state_since": self._changed_at,
+            "window_calls": calls,
+            "window_failure_rate": round(sum(1 for f, _ in self._window if f) / calls, 4) if calls else 0.0,
+            "window_slow_rate": round(sum(1 for _, s in self._window if s) / calls, 4) if calls else 0.0,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions)
+        }
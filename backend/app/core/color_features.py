@@ -0,0 +1,375 @@
+import hashlib
+import io
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Canonical color tags (see material_tags.COLOR_ALIASES) as sRGB, so
+# color queries accept the same names as the tag filters
+COLOR_NAMES = {
+    "white": (245, 245, 240), "beige": (222, 205, 175), "grey": (150, 150, 150), "black": (30, 30, 30),
+    "wood": (190, 145, 95), "walnut": (95, 65, 45), "brown": (120, 80, 50), "gold": (200, 165, 80),
+    "silver": (190, 190, 195), "blue": (60, 100, 170), "green": (80, 130, 80), "red": (180, 50, 45),
+    "yellow": (230, 200, 80), "pink": (230, 170, 180)
+}
+
+# Histogram bin edges in Lab: lightness quarters, and a/b split around the
+# neutral axis where most finishes (woods, stones, greys) sit
+HIST_EDGES = (
+    np.array([25.0, 50.0, 75.0]),
+    np.array([-20.0, 0.0, 20.0]),
+    np.array([-20.0, 0.0, 20.0])
+)
+HIST_BINS = 64
+
+_HEX = re.compile(r"^#?([0-9a-f]{3}|[0-9a-f]{6})$")
+_D65 = np.array([0.95047, 1.0, 1.08883])
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041]
+])
+
+
+def srgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """CIE Lab (D65) of (..., 3) sRGB values in 0-255"""
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _RGB_TO_XYZ.T / _D65
+    f = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def parse_color(value: str) -> Optional[np.ndarray]:
+    """Lab of a color tag name, "#rrggbb"/"#rgb" or "r,g,b"; None if unrecognized"""
+    value = value.strip().lower()
+    if value in COLOR_NAMES:
+        return srgb_to_lab(COLOR_NAMES[value])
+    match = _HEX.match(value)
+    if match:
+        digits = match.group(1)
+        if len(digits) == 3:
+            digits = "".join(d * 2 for d in digits)
+        return srgb_to_lab([int(digits[i:i + 2], 16) for i in (0, 2, 4)])
+    parts = value.split(",")
+    if len(parts) == 3:
+        try:
+            channels = [float(part) for part in parts]
+        except ValueError:
+            return None
+        if all(0 <= channel <= 255 for channel in channels):
+            return srgb_to_lab(channels)
+    return None
+
+
+def url_hash(url: str) -> int:
+    """64-bit fingerprint of an image URL; a changed URL means re-extracting"""
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def kmeans(
+    points: np.ndarray,
+    weights: np.ndarray,
+    k: int,
+    iterations: int = 12,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Centers and total weights of weighted k-means over distinct (n, 3)
+    points, k-means++ seeded with a fixed seed so a given image always
+    gives the same palette. At most len(points) centers come back.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(points))
+    norms = (points ** 2).sum(axis=1)
+
+    def assign(centers):
+        return (norms[:, None] - 2 * points @ centers.T + (centers ** 2).sum(axis=1)).argmin(axis=1)
+
+    centers = np.empty((k, 3))
+    centers[0] = points[rng.choice(len(points), p=weights / weights.sum())]
+    nearest = ((points - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        # Points are distinct, so some point is always left at a nonzero distance
+        spread = weights * nearest
+        centers[i] = points[rng.choice(len(points), p=spread / spread.sum())]
+        nearest = np.minimum(nearest, ((points - centers[i]) ** 2).sum(axis=1))
+
+    for _ in range(iterations):
+        labels = assign(centers)
+        totals = np.bincount(labels, weights, minlength=k)
+        sums = np.stack([np.bincount(labels, weights * points[:, axis], minlength=k) for axis in range(3)], axis=1)
+        # An emptied cluster keeps its previous center
+        moved = np.where(totals[:, None] > 0, sums / np.maximum(totals, 1e-12)[:, None], centers)
+        converged = np.allclose(moved, centers, atol=0.05)
+        centers = moved
+        if converged:
+            break
+    return centers, np.bincount(assign(centers), weights, minlength=k)
+
+
+def merge_close(centers: np.ndarray, totals: np.ndarray, distance: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Fold centers closer than `distance` (delta E) into the larger one, so one surface is one color"""
+    centers, totals = list(centers), list(totals)
+    while len(centers) > 1:
+        pairs = [
+            (np.linalg.norm(centers[i] - centers[j]), i, j)
+            for i in range(len(centers)) for j in range(i + 1, len(centers))
+        ]
+        gap, i, j = min(pairs)
+        if gap >= distance:
+            break
+        total = totals[i] + totals[j]
+        centers[i] = (centers[i] * totals[i] + centers[j] * totals[j]) / total
+        totals[i] = total
+        del centers[j], totals[j]
+    return np.array(centers), np.array(totals)
+
+
+def lab_histogram(lab: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Normalized 4x4x4 Lab histogram of weighted (n, 3) colors"""
+    bins = [np.searchsorted(edges, lab[:, axis]) for axis, edges in enumerate(HIST_EDGES)]
+    counts = np.bincount(bins[0] * 16 + bins[1] * 4 + bins[2], weights, minlength=HIST_BINS)
+    return counts / max(counts.sum(), 1)
+
+
+def extract_color_features(
+    image_bytes: bytes,
+    palette_size: int = 5,
+    max_side: int = 96,
+    merge_distance: float = 8.0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Dominant colors of an image: (palette_size, 3) Lab centers sorted by
+    share, their pixel shares (zero-padded when the image has fewer
+    colors) and a HIST_BINS Lab histogram. The image is downscaled to
+    max_side first and fully transparent pixels are ignored. Clustering
+    runs over distinct 5-bit-per-channel colors weighted by pixel count,
+    and centers within merge_distance delta E are merged.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # JPEG can decode straight to a reduced size, much cheaper than full decode + resize
+        image.draft("RGB", (max_side * 2, max_side * 2))
+        image = image.convert("RGBA")
+        image.thumbnail((max_side, max_side))
+        pixels = np.asarray(image).reshape(-1, 4)
+    pixels = pixels[pixels[:, 3] > 0, :3]
+    if not len(pixels):
+        raise ValueError("image has no opaque pixels")
+
+    quantized = pixels.astype(np.int32) >> 3
+    _, inverse, counts = np.unique(
+        quantized[:, 0] << 10 | quantized[:, 1] << 5 | quantized[:, 2], return_inverse=True, return_counts=True
+    )
+    weights = counts.astype(np.float64)
+    # Each distinct color is the mean of its pixels, not the bin center
+    rgb = np.stack([np.bincount(inverse, pixels[:, axis], len(counts)) for axis in range(3)], axis=1) / weights[:, None]
+    lab = srgb_to_lab(rgb)
+
+    centers, totals = merge_close(*kmeans(lab, weights, palette_size), merge_distance)
+    order = np.argsort(-totals, kind="stable")
+    palette = np.zeros((palette_size, 3), dtype=np.float32)
+    shares = np.zeros(palette_size, dtype=np.float32)
+    palette[:len(order)] = centers[order]
+    shares[:len(order)] = totals[order] / totals.sum()
+    return palette, shares, lab_histogram(lab, weights).astype(np.float32)
+
+
+class ColorFeatureStore:
+    """
+    Compact per-material color features in one .npz file.
+
+    Parallel arrays: material id, image URL hash, palette (Lab), palette
+    shares and histogram. Palettes and shares are slot-major, (palette
+    size, rows), so a color query is a few contiguous passes. On disk
+    palettes are float16 and shares and histograms uint8, around 120
+    bytes per material. Failed extractions are recorded by URL hash too,
+    so reruns skip them until the image URL changes.
+    """
+
+    def __init__(self, palette_size: int = 5):
+        self.palette_size = palette_size
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._hashes = np.zeros(0, dtype=np.int64)
+        self._palettes = np.zeros((palette_size, 0, 3), dtype=np.float32)
+        self._shares = np.zeros((palette_size, 0), dtype=np.float32)
+        self._histograms = np.zeros((0, HIST_BINS), dtype=np.uint8)
+        self._norms = np.zeros((palette_size, 0), dtype=np.float32)  # squared palette norms, for nearest()
+        self._row_of: Dict[int, int] = {}
+        self.failed: Dict[int, int] = {}  # id -> url hash
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def done(self, material_id: int, image_url: str, retry_failed: bool = False) -> bool:
+        """Whether the material's current image was already processed"""
+        fingerprint = url_hash(image_url)
+        row = self._row_of.get(material_id)
+        if row is not None and self._hashes[row] == fingerprint:
+            return True
+        return not retry_failed and self.failed.get(material_id) == fingerprint
+
+    # -- writes -------------------------------------------------------------
+
+    def add(self, rows: List[Tuple[int, str, np.ndarray, np.ndarray, np.ndarray]]):
+        """Insert or replace (id, image_url, palette, shares, histogram) rows"""
+        if not rows:
+            return
+        ids = [row[0] for row in rows]
+        self.remove(ids)
+        self._ids = np.concatenate([self._ids, np.array(ids, dtype=np.int64)])
+        self._hashes = np.concatenate([self._hashes, np.array([url_hash(row[1]) for row in rows], dtype=np.int64)])
+        palettes = np.stack([row[2] for row in rows], axis=1).astype(np.float32)
+        self._palettes = np.concatenate([self._palettes, palettes], axis=1)
+        self._shares = np.concatenate([self._shares, np.stack([row[3] for row in rows], axis=1)], axis=1)
+        self._histograms = np.concatenate([self._histograms, self._quantize(np.stack([row[4] for row in rows]))])
+        self._reindex()
+
+    def mark_failed(self, material_id: int, image_url: str):
+        self.remove([material_id])
+        self.failed[material_id] = url_hash(image_url)
+
+    def remove(self, material_ids: Iterable[int]):
+        material_ids = [i for i in material_ids if i in self._row_of or i in self.failed]
+        for material_id in material_ids:
+            self.failed.pop(material_id, None)
+        drop = [self._row_of[i] for i in material_ids if i in self._row_of]
+        if not drop:
+            return
+        keep = np.ones(len(self._ids), dtype=bool)
+        keep[drop] = False
+        self._ids, self._hashes, self._histograms = self._ids[keep], self._hashes[keep], self._histograms[keep]
+        self._palettes, self._shares = self._palettes[:, keep], self._shares[:, keep]
+        self._reindex()
+
+    def retain(self, material_ids: Iterable[int]):
+        """Drop every material not in material_ids (deleted from the catalog)"""
+        keep = set(material_ids)
+        self.remove([i for i in list(self._row_of) + list(self.failed) if i not in keep])
+
+    def _reindex(self):
+        self._row_of = {int(material_id): row for row, material_id in enumerate(self._ids)}
+        self._norms = (self._palettes ** 2).sum(axis=2)
+
+    @staticmethod
+    def _quantize(fractions: np.ndarray) -> np.ndarray:
+        return np.round(np.clip(fractions, 0.0, 1.0) * 255).astype(np.uint8)
+
+    # -- queries ------------------------------------------------------------
+
+    def nearest(
+        self,
+        lab: np.ndarray,
+        k: int = 20,
+        min_share: float = 0.15,
+        candidate_ids: Optional[Iterable[int]] = None,
+        max_distance: Optional[float] = None
+    ) -> List[Tuple[int, float, float]]:
+        """
+        Materials whose palette has a color close to `lab`: (id, delta E,
+        share of that color) sorted by distance, then larger share, then
+        id. Only palette colors covering at least min_share of the image
+        count, so a small accent does not match. Distance is CIE76 delta E
+        (about 2.3 is a just-noticeable difference).
+        """
+        rows = None
+        if candidate_ids is not None:
+            rows = np.array(sorted({self._row_of[i] for i in candidate_ids if i in self._row_of}), dtype=np.int64)
+        ids = self._ids if rows is None else self._ids[rows]
+        if not len(ids):
+            return []
+        lab = np.asarray(lab, dtype=np.float32)
+        query = -2 * lab
+        excluded = np.float32(1e9)  # added to colors below min_share; branch-free, unlike a masked assign
+
+        # |p - q|^2 = |p|^2 - 2 p.q + |q|^2, best over palette slots
+        best = np.full(len(ids), np.inf, dtype=np.float32)
+        for slot in range(self.palette_size):
+            palettes, norms, shares = self._palettes[slot], self._norms[slot], self._shares[slot]
+            if rows is not None:
+                palettes, norms, shares = palettes[rows], norms[rows], shares[rows]
+            distance = palettes @ query
+            distance += norms
+            distance += (shares < min_share) * excluded
+            np.minimum(best, distance, out=best)
+        best += lab @ lab
+
+        hits = np.flatnonzero(best < excluded / 2)
+        if max_distance is not None:
+            hits = hits[best[hits] <= max_distance ** 2]
+        if len(hits) > k:
+            kth = np.partition(best[hits], k - 1)[k - 1]
+            hits = hits[best[hits] <= kth]
+
+        # Share of the matching color, only for the rows that made the cut
+        positions = hits if rows is None else rows[hits]
+        palettes = self._palettes[:, positions]
+        shares = self._shares[:, positions]
+        distance = np.sqrt(((palettes - lab) ** 2).sum(axis=2))
+        distance[shares < min_share] = np.inf
+        slot = distance.argmin(axis=0)
+        columns = np.arange(len(hits))
+        distance, share = distance[slot, columns], shares[slot, columns]
+        order = np.lexsort((ids[hits], -share, distance))[:k]
+        return [(int(ids[hits[i]]), round(float(distance[i]), 2), round(float(share[i]), 3)) for i in order]
+
+    def similar(self, material_id: int, k: int = 20) -> Optional[List[Tuple[int, float]]]:
+        """Materials with the most overlapping Lab histograms (intersection, 1.0 = identical); None if unknown"""
+        row = self._row_of.get(material_id)
+        if row is None:
+            return None
+        overlap = np.minimum(self._histograms, self._histograms[row]).sum(axis=1, dtype=np.int32) / 255.0
+        overlap[row] = -np.inf
+        top = np.flatnonzero(np.isfinite(overlap))
+        if len(top) > k:
+            kth = -np.partition(-overlap[top], k - 1)[k - 1]
+            top = top[overlap[top] >= kth]
+        order = top[np.lexsort((self._ids[top], -overlap[top]))][:k]
+        return [(int(self._ids[i]), round(float(overlap[i]), 3)) for i in order]
+
+    # -- persistence --------------------------------------------------------
+
+    def save(self, path: str):
+        """Write atomically, so an interrupted job keeps its last checkpoint"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        failed = np.array(sorted(self.failed.items()), dtype=np.int64).reshape(-1, 2)
+        np.savez(
+            tmp_path,
+            meta=np.array(json.dumps({"palette_size": self.palette_size, "hist_bins": HIST_BINS})),
+            ids=self._ids,
+            hashes=self._hashes,
+            palettes=self._palettes.astype(np.float16),
+            shares=self._quantize(self._shares),
+            histograms=self._histograms,
+            failed=failed
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ColorFeatureStore":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            store = cls(meta["palette_size"])
+            store._ids = data["ids"]
+            store._hashes = data["hashes"]
+            store._palettes = data["palettes"].astype(np.float32)
+            store._shares = data["shares"].astype(np.float32) / 255
+            store._histograms = data["histograms"]
+            store.failed = {int(i): int(h) for i, h in data["failed"]}
+        store._reindex()
+        return store
+
+    def stats(self) -> Dict:
+        nbytes = sum(a.nbytes for a in (self._ids, self._hashes, self._palettes, self._shares, self._histograms))
+        return {
+            "rows": len(self._ids),
+            "failed": len(self.failed),
+            "palette_size": self.palette_size,
+            "memory_mb": round(nbytes / 1e6, 1)
+        }
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 
 class Settings(BaseSettings):
@@ -29,6 +29,126 @@ class Settings(BaseSettings):
     KIMI_API_KEY: str = ""
     KIMI_API_BASE: str = "https://api.moonshot.cn/v1"
     KIMI_MODEL: str = "kimi-coding/k2p5"  # 或 kimi-coding/k2p5
+    KIMI_TIMEOUT: float = 60.0
+    KIMI_CONNECT_TIMEOUT: float = 5.0
+    KIMI_HTTP2: bool = True
+    KIMI_MAX_CONNECTIONS: int = 100
+    KIMI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    KIMI_KEEPALIVE_EXPIRY: float = 30.0
+    # Per call type timeouts (seconds); unknown types use KIMI_TIMEOUT
+    KIMI_CALL_TIMEOUTS: Dict[str, float] = {
+        "chat": 20.0,
+        "stream": 30.0,
+        "description": 45.0,
+        "summary": 30.0,
+        "embedding": 30.0,
+        "probe": 5.0
+    }
+    
+    # Kimi circuit breaker
+    KIMI_BREAKER_FAILURE_RATE: float = 0.5
+    KIMI_BREAKER_SLOW_CALL_SECONDS: float = 15.0
+    KIMI_BREAKER_SLOW_CALL_RATE: float = 0.8
+    KIMI_BREAKER_WINDOW: int = 20
+    KIMI_BREAKER_MIN_CALLS: int = 5
+    KIMI_BREAKER_OPEN_SECONDS: float = 30.0
+    
+    # LLM admission control
+    LLM_MAX_CONCURRENCY: int = 10
+    LLM_REQUESTS_PER_MINUTE: int = 60
+    LLM_TOKENS_PER_MINUTE: int = 128000
+    
+    # Chat prompt context
+    CHAT_CONTEXT_TOKEN_BUDGET: int = 3000  # summary + recent turns
+    CHAT_CONTEXT_KEEP_RATIO: float = 0.5  # share of the budget kept verbatim after a fold
+    CHAT_CONTEXT_MAX_FETCH: int = 200
+    CHAT_SUMMARY_MAX_TOKENS: int = 500
+    
+    # Per-worker cache of active chat sessions
+    CHAT_SESSION_CACHE_ENABLED: bool = True
+    CHAT_SESSION_CACHE_MAX_SESSIONS: int = 2000
+    CHAT_SESSION_CACHE_MESSAGES: int = 100  # ring buffer size per session
+    CHAT_SESSION_CACHE_IDLE_SECONDS: float = 1800.0
+    CHAT_SESSION_CACHE_PUBSUB: bool = True  # Redis invalidation across workers
+    
+    # Chat persistence: acknowledge turns before the DB commit finishes
+    CHAT_WRITE_BEHIND: bool = False
+    CHAT_WRITE_BEHIND_SPOOL_DIR: str = ".chat_spool"
+    CHAT_WRITE_BEHIND_STALE_SECONDS: float = 300.0
+    CHAT_WRITE_BEHIND_MAX_ATTEMPTS: int = 10  # then the batch moves to <spool>/dead
+    
+    # Chat WebSocket channel (per connection)
+    CHAT_WS_MAX_INFLIGHT: int = 4  # turns running at once per connection; later turns wait
+    CHAT_WS_MAX_PENDING: int = 8  # requests running or waiting per connection; more get an error frame
+    CHAT_WS_SEND_QUEUE_SIZE: int = 256  # outgoing frames buffered for a slow client
+    
+    # Bulk room description generation
+    DESIGN_BATCH_SINGLE_PROMPT_MAX_ROOMS: int = 3  # larger projects fan out per room
+    DESIGN_BATCH_CONCURRENCY: int = 4
+    
+    # Local FAQ answers checked before calling Kimi
+    FAQ_ENABLED: bool = True
+    FAQ_MATCH_THRESHOLD: float = 0.5  # cosine similarity; unrelated questions score ~0.1
+    FAQ_MIN_QUERY_CHARS: int = 4
+    FAQ_MIN_COVERAGE: float = 0.8  # share of the query's characters the matched question must contain
+    
+    # Style quiz: precomputed outcome table (scripts/build_quiz_outcomes.py)
+    QUIZ_OUTCOMES_PATH: str = "data/quiz_outcomes.json"
+    QUIZ_LLM_REFINEMENT: bool = False  # refine the served result with Kimi in the background
+    
+    # Material similarity index over Material.embedding
+    MATERIAL_INDEX_ENABLED: bool = True
+    MATERIAL_INDEX_PATH: str = "data/material_vectors.npz"
+    MATERIAL_INDEX_METRIC: str = "cosine"  # cosine or ip
+    MATERIAL_INDEX_IVF_MIN_ROWS: int = 50000  # below this, exact brute-force search
+    MATERIAL_INDEX_NPROBE: int = 8
+    MATERIAL_TEXT_INDEX_ENABLED: bool = True  # in-process BM25 search over name/brand
+    MATERIAL_TEXT_SEARCH_CANDIDATES: int = 1000  # ranked matches filtered in SQL while the facet index loads
+    MATERIAL_FACETS_ENABLED: bool = True
+    MATERIAL_PRICE_BUCKETS: List[float] = [0, 50, 100, 200, 500, 1000, 2000, 5000]
+    MATERIAL_PRICE_INDEX_ENABLED: bool = True  # sorted per-category prices for alternatives
+    MATERIAL_ALTERNATIVES_POOL: int = 4  # price-window candidates per result re-ranked by embedding
+    MATERIAL_ALTERNATIVES_VECTOR_WEIGHT: float = 0.5  # embedding similarity's share of the final score
+    MATERIAL_CATALOG_EVENTS_ENABLED: bool = True  # reload indexes when another process writes the catalog
+    
+    # Material endpoint result cache, keyed on the catalog version
+    MATERIAL_CACHE_ENABLED: bool = True
+    MATERIAL_CACHE_TTL: int = 300
+    MATERIAL_CACHE_MAXSIZE: int = 2048
+    MATERIAL_CACHE_USE_REDIS: bool = True
+    
+    # Budget-constrained material matching for projects
+    MATERIAL_MATCH_DEFAULT_AREA_SQM: float = 90.0  # when the project has no rooms with an area
+    MATERIAL_MATCH_DEFAULT_BUDGET_PER_SQM: float = 1500.0  # yuan per ㎡, when the project has no budget
+    MATERIAL_MATCH_CANDIDATES: int = 256  # best options per category handed to the knapsack
+    MATERIAL_MATCH_BUDGET_STEPS: int = 2000  # knapsack budget resolution
+    
+    # Material embeddings; without a model, ingest uses local hashed n-gram vectors
+    EMBEDDING_MODEL: str = ""
+    EMBEDDING_API_BASE: str = ""  # defaults to KIMI_API_BASE
+    EMBEDDING_BATCH_SIZE: int = 256
+    EMBEDDING_HASH_DIM: int = 256
+    
+    # Bulk catalog ingest (scripts/ingest_materials.py, POST /materials/ingest)
+    MATERIAL_INGEST_CHUNK_SIZE: int = 5000
+    MATERIAL_INGEST_DIR: str = "data/ingest"  # uploads and resume checkpoints
+    
+    # Offline image color features (scripts/extract_material_colors.py, /materials/by-color)
+    MATERIAL_COLOR_FEATURES_ENABLED: bool = True
+    MATERIAL_COLOR_FEATURES_PATH: str = "data/material_colors.npz"
+    MATERIAL_COLOR_PALETTE_SIZE: int = 5
+    MATERIAL_COLOR_FETCH_CONCURRENCY: int = 32
+    MATERIAL_COLOR_FETCH_PER_HOST: int = 8  # politeness towards a single supplier CDN
+    MATERIAL_COLOR_FETCH_TIMEOUT: float = 20.0
+    MATERIAL_COLOR_MAX_IMAGE_BYTES: int = 10 * 1024 * 1024
+    MATERIAL_COLOR_WORKERS: int = 0  # extraction processes; 0 = one per core
+    MATERIAL_COLOR_CHECKPOINT_SECONDS: int = 60
+    
+    # LLM response cache
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL: int = 24 * 3600
+    LLM_CACHE_MAXSIZE: int = 2048
+    LLM_CACHE_USE_REDIS: bool = True
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,256 @@
+import bisect
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def price_bucket_range(edges: Sequence[float], label: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """(low, high) prices of a FacetIndex.price_bucket label, low inclusive and
+    high exclusive, None for an open end; None if no bucket has this label"""
+    edges = sorted(edges)
+    if not edges:
+        return None
+    if label == f"<{edges[0]:g}":
+        return None, edges[0]
+    if label == f"{edges[-1]:g}+":
+        return edges[-1], None
+    for low, high in zip(edges, edges[1:]):
+        if label == f"{low:g}-{high:g}":
+            return low, high
+    return None
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Set bits per uint64 word (SWAR; numpy<2 has no bitwise_count)"""
+    words = words - ((words >> np.uint64(1)) & _M1)
+    words = (words & _M2) + ((words >> np.uint64(2)) & _M2)
+    words = (words + (words >> np.uint64(4))) & _M4
+    return (words * _H01) >> np.uint64(56)
+
+
+class FacetIndex:
+    """
+    Per-value bitsets over row positions, for filtered search with counts.
+
+    Every facet value (category "floor", style "nordic", a price bucket, ...)
+    owns a bitset of the rows that carry it, stored as packed uint64 words.
+    A query ANDs the OR of the selected values per field, and each field's
+    counts are computed against the filters of the *other* fields, so the
+    UI can show how many results picking another value would give.
+
+    Rows are append-only: an update tombstones the old row and appends a
+    new one, and compact() renumbers once a quarter of rows are dead.
+    """
+
+    def __init__(self, fields: Sequence[str], price_buckets: Sequence[float] = ()):
+        self.fields = list(fields)
+        self.price_buckets = sorted(price_buckets)
+        self._reset()
+
+    def _reset(self):
+        self._capacity = 0
+        self._size = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._prices = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=np.uint64)
+        self._row_of: Dict[int, int] = {}
+        self._values: List[Dict[str, Tuple]] = []  # per row, for compaction
+        self._bits: Dict[str, Dict[str, np.ndarray]] = {field: {} for field in self.fields + ["price"]}
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    # -- bit helpers --------------------------------------------------------
+
+    def _words(self) -> int:
+        return self._capacity // 64
+
+    def _empty(self) -> np.ndarray:
+        return np.zeros(self._words(), dtype=np.uint64)
+
+    def _set_many(self, bits: np.ndarray, rows: np.ndarray):
+        np.bitwise_or.at(bits, rows >> 6, np.left_shift(np.uint64(1), (rows & 63).astype(np.uint64)))
+
+    def _clear(self, bits: np.ndarray, row: int):
+        bits[row >> 6] &= ~np.uint64(1 << (row & 63))
+
+    def _from_bools(self, flags: np.ndarray) -> np.ndarray:
+        padded = np.zeros(self._capacity, dtype=bool)
+        padded[:len(flags)] = flags
+        return np.packbits(padded, bitorder="little").view(np.uint64)
+
+    def _rows(self, bits: np.ndarray) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(bits.view(np.uint8), bitorder="little"))
+
+    def _reserve(self, extra: int):
+        if self._size + extra <= self._capacity:
+            return
+        capacity = max(self._size + extra, self._capacity * 2, 1024)
+        capacity = (capacity + 63) // 64 * 64
+        grow = capacity - self._capacity
+        self._ids = np.concatenate([self._ids, np.zeros(grow, dtype=np.int64)])
+        self._prices = np.concatenate([self._prices, np.full(grow, np.nan, dtype=np.float32)])
+        extra_words = np.zeros(grow // 64, dtype=np.uint64)
+        self._alive = np.concatenate([self._alive, extra_words])
+        for values in self._bits.values():
+            for value, bits in values.items():
+                values[value] = np.concatenate([bits, extra_words])
+        self._capacity = capacity
+
+    def price_bucket(self, price: Optional[float]) -> Optional[str]:
+        """Bucket label such as "100-200" (or "5000+") for a price"""
+        if price is None or not self.price_buckets:
+            return None
+        i = bisect.bisect_right(self.price_buckets, price) - 1
+        if i < 0:
+            return f"<{self.price_buckets[0]:g}"
+        if i == len(self.price_buckets) - 1:
+            return f"{self.price_buckets[-1]:g}+"
+        return f"{self.price_buckets[i]:g}-{self.price_buckets[i + 1]:g}"
+
+    # -- writes -------------------------------------------------------------
+
+    def add(self, docs: Iterable[Tuple[int, Dict[str, Iterable[str]], Optional[float]]]):
+        """Insert or replace (id, {field: values}, price) rows"""
+        docs = list(docs)
+        self.remove(doc_id for doc_id, _, _ in docs)
+        self._reserve(len(docs))
+        new_bits: Dict[Tuple[str, str], List[int]] = {}
+        for doc_id, values, price in docs:
+            row = self._size
+            self._size += 1
+            self._ids[row] = doc_id
+            self._prices[row] = np.nan if price is None else price
+            self._row_of[int(doc_id)] = row
+
+            normalized = {}
+            for field in self.fields:
+                field_values = values.get(field) or ()
+                if isinstance(field_values, str):
+                    field_values = (field_values,)
+                normalized[field] = tuple(dict.fromkeys(v for v in field_values if v))
+            bucket = self.price_bucket(price)
+            normalized["price"] = (bucket,) if bucket else ()
+            for field, field_values in normalized.items():
+                for value in field_values:
+                    new_bits.setdefault((field, value), []).append(row)
+            self._values.append(normalized)
+
+        if docs:
+            self._set_many(self._alive, np.arange(self._size - len(docs), self._size))
+        for (field, value), rows in new_bits.items():
+            bits = self._bits[field].get(value)
+            if bits is None:
+                bits = self._bits[field][value] = self._empty()
+            self._set_many(bits, np.array(rows, dtype=np.int64))
+
+    def remove(self, doc_ids: Iterable[int]):
+        for doc_id in doc_ids:
+            row = self._row_of.pop(int(doc_id), None)
+            if row is not None:
+                self._clear(self._alive, row)
+                for field, field_values in self._values[row].items():
+                    for value in field_values:
+                        self._clear(self._bits[field][value], row)
+        if self._size > 1024 and len(self._row_of) < self._size * 0.75:
+            self.compact()
+
+    def compact(self):
+        live = sorted(self._row_of.values())
+        docs = [(int(self._ids[row]), self._values[row], None if np.isnan(self._prices[row]) else float(self._prices[row]))
+                for row in live]
+        self._reset()
+        self.add(docs)
+
+    # -- queries ------------------------------------------------------------
+
+    def _field_mask(self, field: str, selected: Iterable[str]) -> np.ndarray:
+        mask = self._empty()
+        for value in selected:
+            bits = self._bits[field].get(value)
+            if bits is not None:
+                mask |= bits
+        return mask
+
+    def query(
+        self,
+        filters: Optional[Dict[str, Iterable[str]]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        candidate_ids: Optional[Iterable[int]] = None
+    ) -> Tuple[np.ndarray, Dict[str, Dict[str, int]]]:
+        """
+        Ids of rows matching every filter, plus facet counts.
+
+        `filters` maps a field (or "price" for bucket labels) to the values
+        allowed for it (any-of). `candidate_ids`, e.g. the matches of a text
+        query, restrict everything further. Ids come back in row order,
+        which for candidate_ids is not their rank; callers re-rank.
+        """
+        base = self._alive.copy()
+        if candidate_ids is not None:
+            rows = [self._row_of[i] for i in candidate_ids if i in self._row_of]
+            flags = np.zeros(self._size, dtype=bool)
+            flags[rows] = True
+            base &= self._from_bools(flags)
+        if min_price is not None or max_price is not None:
+            prices = self._prices[:self._size]
+            flags = ~np.isnan(prices)
+            if min_price is not None:
+                flags &= prices >= min_price
+            if max_price is not None:
+                flags &= prices <= max_price
+            base &= self._from_bools(flags)
+
+        field_masks = {
+            field: self._field_mask(field, values)
+            for field, values in (filters or {}).items() if values and field in self._bits
+        }
+        result = base.copy()
+        for mask in field_masks.values():
+            result &= mask
+
+        counts = {}
+        for field, values in self._bits.items():
+            # Disjunctive counts: apply every filter except this field's own
+            scope = base.copy()
+            for other, mask in field_masks.items():
+                if other != field:
+                    scope &= mask
+            field_counts = {value: int(popcount(bits & scope).sum()) for value, bits in values.items()}
+            counts[field] = dict(sorted(
+                ((value, count) for value, count in field_counts.items() if count),
+                key=lambda item: -item[1]
+            ))
+        return self._ids[self._rows(result)], counts
+
+    # -- row arrays, for vectorized scoring over the catalog -----------------
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per-row ids, prices and live flags (row order)"""
+        return self._ids[:self._size], self._prices[:self._size], self._flags(self._alive)
+
+    def flags(self, field: str, values: Iterable[str]) -> np.ndarray:
+        """Per-row flag: the row carries any of `values` in `field`"""
+        return self._flags(self._field_mask(field, values))
+
+    def values(self, field: str) -> List[str]:
+        return list(self._bits[field])
+
+    def _flags(self, bits: np.ndarray) -> np.ndarray:
+        return np.unpackbits(bits.view(np.uint8), bitorder="little")[:self._size].astype(bool)
+
+    def stats(self) -> Dict:
+        return {
+            "rows": len(self._row_of),
+            "tombstones": self._size - len(self._row_of),
+            "values": {field: len(values) for field, values in self._bits.items()},
+            "memory_mb": round(
+                sum(bits.nbytes for values in self._bits.values() for bits in values.values()) / 1e6, 1
+            )
+        }
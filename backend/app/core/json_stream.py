@@ -0,0 +1,105 @@
+import json
+from typing import Any, Dict, Optional
+
+_OPENERS = {"object": "{", "array": "["}
+
+
+class IncrementalJSONExtractor:
+    """
+    Find the first complete JSON object or array in text that arrives in chunks.
+
+    Works on raw model output, so the JSON may be wrapped in prose or a
+    ```json fence. Brackets are balanced while tracking string literals; a
+    balanced candidate that fails to parse is skipped and scanning resumes
+    after its opening bracket.
+    """
+
+    def __init__(self, expect: Optional[str] = None):
+        # expect: "object", "array" or None for either
+        self.openers = _OPENERS[expect] if expect else "{["
+        self.text = ""
+        self.result: Any = None
+        self.done = False
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk; returns True once a JSON value has been extracted"""
+        if self.done:
+            return True
+        self.text += chunk
+        text = self.text
+
+        while self._pos < len(text):
+            ch = text[self._pos]
+            if self._start < 0:
+                if ch in self.openers:
+                    self._start = self._pos
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        self.result = json.loads(text[self._start:self._pos + 1])
+                    except ValueError:
+                        # Not JSON after all (e.g. "[1]" in prose); rescan
+                        self._pos = self._start + 1
+                        self._start = -1
+                        self._in_string = False
+                        self._escape = False
+                        continue
+                    self.done = True
+                    return True
+            self._pos += 1
+        return False
+
+
+def extract_json(text: str, expect: Optional[str] = None) -> Optional[Any]:
+    """Extract the first JSON object/array from a complete text, or None"""
+    extractor = IncrementalJSONExtractor(expect)
+    extractor.feed(text)
+    return extractor.result if extractor.done else None
+
+
+class JSONExtractionStats:
+    """Parse-success rate and time-to-parse for structured LLM outputs"""
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.early_stops = 0
+        self.total_parse_seconds = 0.0
+        self.max_parse_seconds = 0.0
+
+    def record(self, success: bool, seconds: float, early_stop: bool = False):
+        self.attempts += 1
+        if success:
+            self.successes += 1
+            self.total_parse_seconds += seconds
+            self.max_parse_seconds = max(self.max_parse_seconds, seconds)
+        if early_stop:
+            self.early_stops += 1
+
+    def stats(self) -> Dict:
+        return {
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "success_rate": round(self.successes / self.attempts, 4) if self.attempts else 0.0,
+            "early_stops": self.early_stops,
+            "avg_time_to_parse_ms": round(1000 * self.total_parse_seconds / self.successes, 2) if self.successes else 0.0,
+            "max_time_to_parse_ms": round(1000 * self.max_parse_seconds, 2)
+        }
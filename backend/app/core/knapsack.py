@@ -0,0 +1,64 @@
+import math
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def pareto_frontier(costs: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Positions of the options no other option beats on both cost and value,
+    cheapest first. Only these can appear in an optimal knapsack choice.
+    """
+    order = np.lexsort((-values, costs))
+    best = np.maximum.accumulate(values[order])
+    keep = np.empty(len(order), dtype=bool)
+    keep[:1] = True
+    keep[1:] = values[order][1:] > best[:-1]
+    return order[keep]
+
+
+def solve_multiple_choice_knapsack(
+    costs: Sequence[np.ndarray],
+    values: Sequence[np.ndarray],
+    budget: float,
+    steps: int = 2000
+) -> Optional[List[int]]:
+    """
+    Pick exactly one option per group maximizing total value with total
+    cost <= budget, or None if even the cheapest picks do not fit.
+
+    Dynamic programming over the budget split into `steps` units; costs are
+    rounded *up* to whole units, so a returned selection always fits the
+    real budget (it may miss an optimum that only fits by less than one
+    unit per group). Each group is one vectorized pass per option, so pass
+    pruned options (see pareto_frontier) for large catalogs.
+    """
+    if budget <= 0:
+        return None
+    unit = budget / steps
+    best = np.zeros(steps + 1)  # best[b]: max value with cost <= b units
+    choices = []
+    for group_costs, group_values in zip(costs, values):
+        units = np.ceil(np.asarray(group_costs) / unit - 1e-9).astype(np.int64)
+        new = np.full(steps + 1, -math.inf)
+        choice = np.full(steps + 1, -1, dtype=np.int32)
+        for option, (cost, value) in enumerate(zip(units, group_values)):
+            if cost > steps:
+                continue
+            candidate = np.full(steps + 1, -math.inf)
+            candidate[cost:] = best[:steps + 1 - cost] + value
+            better = candidate > new
+            new[better] = candidate[better]
+            choice[better] = option
+        best = new
+        choices.append((units, choice))
+
+    if best[steps] == -math.inf:
+        return None
+    picks = []
+    remaining = steps
+    for units, choice in reversed(choices):
+        option = int(choice[remaining])
+        picks.append(option)
+        remaining -= int(units[option])
+    return picks[::-1]
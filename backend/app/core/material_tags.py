@@ -0,0 +1,47 @@
+import json
+import re
+from typing import Dict, List
+
+# Supplier and user spellings -> canonical style/color tags, shared by
+# catalog ingest and the budget matcher
+STYLE_ALIASES = {
+    "现代": "modern", "现代简约": "modern", "简约": "modern", "minimalist": "modern",
+    "北欧": "nordic", "scandinavian": "nordic",
+    "新中式": "chinese", "中式": "chinese",
+    "日式": "japanese", "原木": "japanese", "wabi-sabi": "japanese",
+    "轻奢": "luxury", "light luxury": "luxury",
+    "工业": "industrial", "工业风": "industrial",
+    "美式": "american", "法式": "french", "欧式": "european", "地中海": "mediterranean"
+}
+
+COLOR_ALIASES = {
+    "白": "white", "白色": "white", "米白": "beige", "米色": "beige", "米黄": "beige",
+    "灰": "grey", "灰色": "grey", "gray": "grey", "浅灰": "grey", "深灰": "grey",
+    "黑": "black", "黑色": "black",
+    "原木色": "wood", "木色": "wood", "胡桃木": "walnut", "胡桃色": "walnut",
+    "棕": "brown", "棕色": "brown", "咖啡色": "brown",
+    "金": "gold", "金色": "gold", "银": "silver", "银色": "silver",
+    "蓝": "blue", "蓝色": "blue", "绿": "green", "绿色": "green",
+    "红": "red", "红色": "red", "黄": "yellow", "黄色": "yellow", "粉": "pink", "粉色": "pink"
+}
+
+_TAG_SPLIT = re.compile(r"[,，;；|/、]+")
+
+
+def normalize_tags(value, aliases: Dict[str, str]) -> List[str]:
+    """Split a list or delimited string of tags and map synonyms to canonical names"""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        if value.startswith("["):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+    items = _TAG_SPLIT.split(value) if isinstance(value, str) else value
+    tags = []
+    for item in items:
+        tag = str(item).strip().lower()
+        if tag:
+            tags.append(aliases.get(tag, tag))
+    return list(dict.fromkeys(tags))
@@ -0,0 +1,18 @@
+import unicodedata
+from collections import Counter
+from typing import Tuple
+
+
+def normalize(text: str) -> str:
+    """Fold width/case and drop whitespace and punctuation"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] in ("L", "N"))
+
+
+def char_ngrams(text: str, sizes: Tuple[int, ...] = (1, 2, 3)) -> Counter:
+    grams = Counter()
+    for n in sizes:
+        grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    if not grams and text:
+        grams[text] = 1
+    return grams
@@ -0,0 +1,204 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.facet_index import popcount
+
+
+class _Category:
+    """Rows of one category sorted by (price, id)"""
+
+    __slots__ = ("prices", "ids", "styles", "colors", "style_counts", "color_counts")
+
+    def __init__(self):
+        self.prices = np.zeros(0, dtype=np.float64)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.styles = np.zeros(0, dtype=np.uint64)
+        self.colors = np.zeros(0, dtype=np.uint64)
+        self.style_counts = np.zeros(0, dtype=np.float64)  # tags per row, for Jaccard
+        self.color_counts = np.zeros(0, dtype=np.float64)
+
+
+class PriceIndex:
+    """
+    Per-category price-sorted arrays for "similar price" lookups.
+
+    Each category keeps parallel arrays of price, id and 64-bit style/color
+    tag masks sorted by (price, id), so a price window is two bisections.
+    Candidates in the window are ranked by price proximity plus style and
+    color overlap (Jaccard over the masks), with ties broken by price
+    distance and then id, so results are deterministic. Small writes are
+    inserted/deleted in place; bulk batches re-sort each touched category once.
+    """
+
+    SMALL_BATCH = 64  # writes up to this many rows per category are applied in place
+
+    def __init__(self, price_weight: float = 0.4, style_weight: float = 0.4, color_weight: float = 0.2):
+        self.price_weight = price_weight
+        self.style_weight = style_weight
+        self.color_weight = color_weight
+        self._categories: Dict[str, _Category] = {}
+        self._rows: Dict[int, Tuple[str, float, int, int]] = {}  # id -> (category, price, styles, colors)
+        self.tags: Dict[str, Dict[str, int]] = {"styles": {}, "colors": {}}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _mask(self, field: str, values: Optional[Iterable[str]], create: bool = True) -> int:
+        bits = self.tags[field]
+        mask = 0
+        for value in values or ():
+            bit = bits.get(value)
+            if bit is None:
+                if not create:
+                    continue
+                # Past 64 distinct values the last bit is shared (overlap gets permissive)
+                bit = bits[value] = min(len(bits), 63)
+            mask |= 1 << bit
+        return mask
+
+    # -- writes -------------------------------------------------------------
+
+    def add(self, docs: Iterable[Tuple[int, Optional[str], Optional[float], Iterable[str], Iterable[str]]]):
+        """Insert or replace (id, category, price, styles, colors); rows without category or price are dropped"""
+        docs = list(docs)
+        self.remove(doc[0] for doc in docs)
+        added: Dict[str, List[Tuple[float, int, int, int]]] = {}
+        for doc_id, category, price, styles, colors in docs:
+            if category is None or price is None:
+                continue
+            style_mask, color_mask = self._mask("styles", styles), self._mask("colors", colors)
+            self._rows[int(doc_id)] = (category, float(price), style_mask, color_mask)
+            added.setdefault(category, []).append((float(price), int(doc_id), style_mask, color_mask))
+        for category, rows in added.items():
+            bucket = self._categories.setdefault(category, _Category())
+            rows.sort()
+            prices = np.array([row[0] for row in rows], dtype=np.float64)
+            ids = np.array([row[1] for row in rows], dtype=np.int64)
+            styles = np.array([row[2] for row in rows], dtype=np.uint64)
+            colors = np.array([row[3] for row in rows], dtype=np.uint64)
+            if len(rows) <= self.SMALL_BATCH:
+                # Live updates: insert in place instead of re-sorting the category
+                positions = [self._position(bucket, price, doc_id) for price, doc_id, _, _ in rows]
+                bucket.prices = np.insert(bucket.prices, positions, prices)
+                bucket.ids = np.insert(bucket.ids, positions, ids)
+                bucket.styles = np.insert(bucket.styles, positions, styles)
+                bucket.colors = np.insert(bucket.colors, positions, colors)
+                bucket.style_counts = np.insert(bucket.style_counts, positions, popcount(styles))
+                bucket.color_counts = np.insert(bucket.color_counts, positions, popcount(colors))
+            else:
+                self._store(
+                    bucket,
+                    np.concatenate([bucket.prices, prices]),
+                    np.concatenate([bucket.ids, ids]),
+                    np.concatenate([bucket.styles, styles]),
+                    np.concatenate([bucket.colors, colors])
+                )
+
+    def remove(self, doc_ids: Iterable[int]):
+        removed: Dict[str, List[Tuple[float, int]]] = {}
+        for doc_id in doc_ids:
+            row = self._rows.pop(int(doc_id), None)
+            if row is not None:
+                removed.setdefault(row[0], []).append((row[1], int(doc_id)))
+        for category, rows in removed.items():
+            bucket = self._categories[category]
+            if len(rows) <= self.SMALL_BATCH:
+                positions = [self._position(bucket, price, doc_id) for price, doc_id in rows]
+                for name in _Category.__slots__:
+                    setattr(bucket, name, np.delete(getattr(bucket, name), positions))
+            else:
+                keep = ~np.isin(bucket.ids, [doc_id for _, doc_id in rows])
+                for name in _Category.__slots__:
+                    setattr(bucket, name, getattr(bucket, name)[keep])
+
+    @staticmethod
+    def _position(bucket: _Category, price: float, doc_id: int) -> int:
+        """Index of (price, id) in the category's sort order"""
+        lo = int(np.searchsorted(bucket.prices, price, side="left"))
+        hi = int(np.searchsorted(bucket.prices, price, side="right"))
+        return lo + int(np.searchsorted(bucket.ids[lo:hi], doc_id))
+
+    @staticmethod
+    def _store(bucket: _Category, prices, ids, styles, colors):
+        order = np.lexsort((ids, prices))
+        bucket.prices, bucket.ids = prices[order], ids[order]
+        bucket.styles, bucket.colors = styles[order], colors[order]
+        bucket.style_counts = popcount(bucket.styles).astype(np.float64)
+        bucket.color_counts = popcount(bucket.colors).astype(np.float64)
+
+    # -- queries ------------------------------------------------------------
+
+    @staticmethod
+    def _jaccard(masks: np.ndarray, counts: np.ndarray, mask: int) -> np.ndarray:
+        if not mask:
+            return np.zeros(len(masks))
+        bits = [bit for bit in range(64) if mask >> bit & 1]
+        if len(bits) <= 6:
+            # A material has a handful of tags; testing them one by one beats a full popcount
+            shared = np.zeros(len(masks), dtype=np.uint64)
+            for bit in bits:
+                shared += (masks >> np.uint64(bit)) & np.uint64(1)
+        else:
+            shared = popcount(masks & np.uint64(mask))
+        shared = shared.astype(np.float64)
+        return shared / (counts + len(bits) - shared)
+
+    def alternatives(
+        self,
+        material_id: int,
+        k: int = 5,
+        tolerance: Optional[float] = 0.2,
+        required_styles: Optional[Iterable[str]] = None
+    ) -> Optional[List[Tuple[int, float]]]:
+        """
+        Up to k (id, score) pairs from the material's category within
+        price * (1 ± tolerance) (tolerance None: any price), best first;
+        None if the material is not indexed. `required_styles` keeps only
+        candidates carrying at least one of them.
+        """
+        row = self._rows.get(int(material_id))
+        if row is None:
+            return None
+        category, price, style_mask, color_mask = row
+        bucket = self._categories[category]
+
+        if tolerance is None:
+            window = slice(0, len(bucket.prices))
+        else:
+            window = slice(
+                np.searchsorted(bucket.prices, price * (1 - tolerance), side="left"),
+                np.searchsorted(bucket.prices, price * (1 + tolerance), side="right")
+            )
+        ids = bucket.ids[window]
+        keep = ids != material_id
+        if required_styles:
+            required = self._mask("styles", required_styles, create=False)
+            keep &= (bucket.styles[window] & np.uint64(required)) != 0
+        if not keep.any():
+            return []
+
+        distance = np.abs(bucket.prices[window] - price)
+        spread = (price * tolerance if tolerance else distance.max()) or 1.0
+        scores = (
+            self.price_weight * (1.0 - distance / spread)
+            + self.style_weight * self._jaccard(bucket.styles[window], bucket.style_counts[window], style_mask)
+            + self.color_weight * self._jaccard(bucket.colors[window], bucket.color_counts[window], color_mask)
+        )
+        scores[~keep] = -np.inf
+        top = np.flatnonzero(keep)
+        if len(top) > k:
+            # Everything tied with the k-th best stays in, so the tie-break decides
+            kth = -np.partition(-scores, k - 1)[k - 1]
+            top = np.flatnonzero(scores >= kth)
+        order = top[np.lexsort((ids[top], distance[top], -scores[top]))][:k]
+        return [(int(ids[i]), round(float(scores[i]), 4)) for i in order]
+
+    def stats(self) -> Dict:
+        return {
+            "rows": len(self._rows),
+            "categories": len(self._categories),
+            "largest_category": max((len(b.ids) for b in self._categories.values()), default=0),
+            "style_tags": len(self.tags["styles"]),
+            "color_tags": len(self.tags["colors"])
+        }
@@ -0,0 +1,201 @@
+import asyncio
+import enum
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+
+class Priority(int, enum.Enum):
+    INTERACTIVE = 0  # chat turns a user is waiting on
+    DEFAULT = 1
+    BATCH = 2        # bulk generation, offline jobs
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self, seconds: float):
+        """Empty the bucket so a single token is not granted for `seconds`"""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "future", "enqueued_at")
+
+    def __init__(self, priority: int, seq: int, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RequestScheduler:
+    """
+    Admission control for an upstream API with RPM/TPM quotas.
+
+    Requests wait in a priority queue (lower Priority value first, FIFO
+    within a class) and are admitted when a concurrency slot is free and
+    both the requests-per-minute and tokens-per-minute buckets allow it.
+    Token usage is estimated up front and reconciled with the real usage
+    when the request finishes.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        requests_per_minute: int,
+        tokens_per_minute: int
+    ):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._wait_stats = {
+            p.name.lower(): {"admitted": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for p in Priority
+        }
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.DEFAULT, estimated_tokens: int = 0):
+        """
+        Hold an admission slot for the duration of the block.
+
+        The yielded dict may be given a "used_tokens" entry to reconcile the
+        token bucket with actual usage.
+        """
+        await self.acquire(priority, estimated_tokens)
+        usage = {"used_tokens": None}
+        try:
+            yield usage
+        finally:
+            self.release(estimated_tokens, usage["used_tokens"])
+
+    async def acquire(self, priority: Priority = Priority.DEFAULT, estimated_tokens: int = 0):
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(int(priority), next(self._seq), estimated_tokens, loop.create_future())
+        heapq.heappush(self._queue, waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted at the same moment we were cancelled
+                self.release(estimated_tokens, 0)
+            else:
+                waiter.future.cancel()
+                self._dispatch()
+            raise
+
+        waited = time.monotonic() - waiter.enqueued_at
+        stats = self._wait_stats[Priority(priority).name.lower()]
+        stats["admitted"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def release(self, estimated_tokens: int = 0, used_tokens: Optional[int] = None):
+        self._active -= 1
+        if used_tokens is not None:
+            if used_tokens < estimated_tokens:
+                self.tokens.refund(estimated_tokens - used_tokens)
+            else:
+                self.tokens.consume(used_tokens - estimated_tokens)
+        self._dispatch()
+
+    def backoff(self, seconds: float):
+        """Pause admissions, e.g. after the provider answered 429"""
+        self.requests.drain(seconds)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._queue and self._active < self.max_concurrency:
+            head = self._queue[0]
+            if head.future.done():
+                heapq.heappop(self._queue)
+                continue
+
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(head.tokens))
+            if wait > 0:
+                self._schedule(wait)
+                return
+
+            heapq.heappop(self._queue)
+            self.requests.consume(1)
+            self.tokens.consume(head.tokens)
+            self._active += 1
+            head.future.set_result(None)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            return
+        loop = asyncio.get_running_loop()
+
+        def fire():
+            self._timer = None
+            self._dispatch()
+
+        self._timer = loop.call_later(delay, fire)
+
+    def stats(self) -> Dict:
+        queued: Dict[str, int] = {p.name.lower(): 0 for p in Priority}
+        for waiter in self._queue:
+            if not waiter.future.done():
+                queued[Priority(waiter.priority).name.lower()] += 1
+
+        wait = {}
+        for name, s in self._wait_stats.items():
+            wait[name] = {
+                "admitted": s["admitted"],
+                "avg_wait_ms": round(1000 * s["total_wait"] / s["admitted"], 2) if s["admitted"] else 0.0,
+                "max_wait_ms": round(1000 * s["max_wait"], 2),
+                "queued": queued[name]
+            }
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "requests_available": round(self.requests.tokens, 2),
+            "tokens_available": round(self.tokens.tokens, 2),
+            "queue_wait": wait
+        }
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int = 0) -> int:
+    """Rough token estimate for a chat request (CJK-heavy text ~1.5 chars/token)"""
+    chars = sum(len(m.get("content", "")) for m in messages)
+    return int(chars / 1.5) + max_tokens
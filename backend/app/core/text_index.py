@@ -0,0 +1,260 @@
+import bisect
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_RUN = re.compile(r"[㐀-鿿豈-﫿]+|[a-z0-9]+")
+
+
+def _is_cjk(run: str) -> bool:
+    return run[0] > "　"
+
+
+def tokenize(text: str) -> Counter:
+    """
+    Index terms for product text.
+
+    CJK runs become character bigrams and trigrams (single characters stay
+    as-is), so any substring of two or more characters is findable without
+    word segmentation. Latin/digit words are kept whole ("w:") and also as
+    boundary-padded trigrams ("t:"), which is what makes misspelled brand
+    and model names still match.
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    terms = Counter()
+    for run in _RUN.findall(text):
+        if _is_cjk(run):
+            if len(run) == 1:
+                terms[run] += 1
+            for n in (2, 3):
+                terms.update(run[i:i + n] for i in range(len(run) - n + 1))
+        else:
+            terms["w:" + run] += 1
+            padded = f"^{run}$"
+            if len(run) > 1:
+                terms.update("t:" + padded[i:i + 3] for i in range(len(padded) - 2))
+    return terms
+
+
+class TextIndex:
+    """
+    BM25-ranked inverted index over character n-grams.
+
+    Postings live in a compressed-sparse main segment (term -> contiguous
+    arrays of row numbers and term frequencies) plus a small delta segment
+    for recent writes; the delta is merged in once it grows past
+    `merge_threshold` rows. Deletes are tombstones until the next merge.
+    A query scores all postings of its terms with one vectorized pass per
+    term and keeps documents that contain at least `min_should_match` of
+    its distinct terms, counting terms the index has never seen as missed. The last Latin word of a query also matches as a
+    prefix, for search-as-you-type.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, min_should_match: float = 0.5,
+                 merge_threshold: int = 20000, max_prefix_expansions: int = 16):
+        self.k1 = k1
+        self.b = b
+        self.min_should_match = min_should_match
+        self.merge_threshold = merge_threshold
+        self.max_prefix_expansions = max_prefix_expansions
+        self._terms: Dict[str, int] = {}
+        self._words: List[str] = []  # sorted Latin words, for prefix expansion
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._row_of: Dict[int, int] = {}
+        self._total_length = 0.0
+        self._ptr = np.zeros(1, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.uint8)
+        self._impacts = np.zeros(0, dtype=np.float32)  # BM25 tf part, fixed at merge time
+        self._df = np.zeros(0, dtype=np.int32)
+        self._delta: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+        self._delta_rows = 0
+        self._new_words: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    # -- writes -------------------------------------------------------------
+
+    def _term_id(self, term: str) -> int:
+        term_id = self._terms.get(term)
+        if term_id is None:
+            term_id = self._terms[term] = len(self._terms)
+            if term.startswith("w:"):
+                self._new_words.append(term[2:])
+        return term_id
+
+    def _reserve(self, extra: int):
+        capacity = len(self._ids)
+        if self._size + extra <= capacity:
+            return
+        grow = max(self._size + extra, capacity * 2, 1024) - capacity
+        self._ids = np.concatenate([self._ids, np.zeros(grow, dtype=np.int64)])
+        self._lengths = np.concatenate([self._lengths, np.zeros(grow, dtype=np.float32)])
+        self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+
+    def add(self, docs: Iterable[Tuple[int, str]], merge: bool = True):
+        """Insert or replace (id, text) documents; bulk loads pass merge=False and merge() once"""
+        docs = list(docs)
+        self.remove(doc_id for doc_id, _ in docs)
+        self._reserve(len(docs))
+        for doc_id, text in docs:
+            terms = tokenize(text)
+            row = self._size
+            self._size += 1
+            self._ids[row] = doc_id
+            self._alive[row] = True
+            length = sum(terms.values())
+            self._lengths[row] = length
+            self._total_length += length
+            self._row_of[int(doc_id)] = row
+            for term, tf in terms.items():
+                self._delta[self._term_id(term)].append((row, tf))
+        self._delta_rows += len(docs)
+        if merge and self._delta_rows >= self.merge_threshold:
+            self.merge()
+
+    def remove(self, doc_ids: Iterable[int]):
+        for doc_id in doc_ids:
+            row = self._row_of.pop(int(doc_id), None)
+            if row is not None:
+                self._alive[row] = False
+                self._total_length -= float(self._lengths[row])
+
+    def merge(self):
+        """Fold the delta segment into the main one and drop tombstoned postings"""
+        n_terms = len(self._terms)
+        main_terms = np.repeat(np.arange(len(self._ptr) - 1, dtype=np.int32), np.diff(self._ptr))
+        delta_terms = [np.full(len(p), t, dtype=np.int32) for t, p in self._delta.items()]
+        delta_postings = [np.array(p, dtype=np.int64).reshape(-1, 2) for p in self._delta.values()]
+        terms = np.concatenate([main_terms] + delta_terms)
+        rows = np.concatenate([self._rows.astype(np.int64)] + [p[:, 0] for p in delta_postings])
+        tfs = np.concatenate([self._tfs] + [np.minimum(p[:, 1], 255).astype(np.uint8) for p in delta_postings])
+
+        keep = self._alive[rows]
+        terms, rows, tfs = terms[keep], rows[keep], tfs[keep]
+        order = np.lexsort((rows, terms))
+        terms, self._rows, self._tfs = terms[order], rows[order].astype(np.int32), tfs[order]
+        counts = np.bincount(terms, minlength=n_terms)
+        self._ptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self._df = counts.astype(np.int32)
+        self._impacts = self._impact(self._rows, self._tfs)
+
+        self._delta = defaultdict(list)
+        self._delta_rows = 0
+        if self._new_words:
+            self._words = sorted(set(self._words).union(self._new_words))
+            self._new_words = []
+
+    # -- search -------------------------------------------------------------
+
+    def _impact(self, rows: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        n_docs = len(self._row_of)
+        avg_length = self._total_length / n_docs if n_docs else 1.0
+        tfs = tfs.astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * self._lengths[rows] / avg_length)
+        return tfs * (self.k1 + 1.0) / (tfs + norm)
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows containing a term and their BM25 tf impacts"""
+        if term_id < len(self._ptr) - 1:
+            start, end = self._ptr[term_id], self._ptr[term_id + 1]
+            rows, impacts = self._rows[start:end], self._impacts[start:end]
+        else:
+            # Term first seen after the last merge
+            rows, impacts = self._rows[:0], self._impacts[:0]
+        delta = self._delta.get(term_id)
+        if delta:
+            extra = np.array(delta, dtype=np.int64).reshape(-1, 2)
+            extra_rows = extra[:, 0].astype(np.int32)
+            rows = np.concatenate([rows, extra_rows])
+            impacts = np.concatenate([impacts, self._impact(extra_rows, extra[:, 1])])
+        return rows, impacts
+
+    def _prefix_terms(self, prefix: str) -> List[int]:
+        words = self._words
+        start = bisect.bisect_left(words, prefix)
+        expansions = []
+        for word in words[start:start + self.max_prefix_expansions]:
+            if not word.startswith(prefix):
+                break
+            expansions.append(self._terms["w:" + word])
+        return expansions
+
+    def search(self, query: str, k: Optional[int] = 50,
+               candidate_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Matching ids and BM25 scores, best first; k=None returns every match.
+        `candidate_ids` restricts matches to those ids, e.g. the ones passing
+        facet filters, before the top k are taken.
+        """
+        terms = tokenize(query)
+        runs = _RUN.findall(unicodedata.normalize("NFKC", query or "").lower())
+        if not terms or not self._row_of:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        # (term ids, weight) groups; a prefix group counts once towards matching
+        groups: List[Tuple[List[int], float]] = []
+        for term, count in terms.items():
+            term_id = self._terms.get(term)
+            if term_id is not None:
+                groups.append(([term_id], float(count)))
+        if runs and not _is_cjk(runs[-1]) and query.rstrip() == query:
+            expansions = [t for t in self._prefix_terms(runs[-1]) if t != self._terms.get("w:" + runs[-1])]
+            if expansions:
+                groups.append((expansions, 1.0))
+        required = max(1, math.ceil(len(terms) * self.min_should_match))
+
+        n_docs = len(self._row_of)
+        all_rows, all_scores, all_hits = [], [], []
+        for term_ids, weight in groups:
+            group_rows = []
+            for term_id in term_ids:
+                rows, impacts = self._postings(term_id)
+                if not len(rows):
+                    continue
+                df = len(rows)
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                all_scores.append(impacts * np.float32(weight * idf))
+                all_rows.append(rows)
+                group_rows.append(rows)
+            if len(group_rows) == 1:
+                all_hits.append(group_rows[0])  # a term's rows are already distinct
+            elif group_rows:
+                all_hits.append(np.unique(np.concatenate(group_rows)))
+        if not all_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        # Accumulate over the rows the query touches, not the whole index
+        touched, slots = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(slots, np.concatenate(all_scores), minlength=len(touched))
+        hits = np.bincount(np.searchsorted(touched, np.concatenate(all_hits)), minlength=len(touched))
+        keep = (hits >= required) & self._alive[touched]
+        if candidate_ids is not None:
+            keep &= np.isin(self._ids[touched], candidate_ids)
+        matched, matched_scores = touched[keep], scores[keep]
+
+        if k is not None and len(matched) > k:
+            top = np.argpartition(-matched_scores, k)[:k]
+            matched, matched_scores = matched[top], matched_scores[top]
+        order = np.argsort(-matched_scores, kind="stable")
+        return self._ids[matched[order]], matched_scores[order].astype(np.float32)
+
+    def stats(self) -> Dict:
+        return {
+            "documents": len(self._row_of),
+            "tombstones": self._size - len(self._row_of),
+            "terms": len(self._terms),
+            "postings": int(len(self._rows)),
+            "delta_documents": self._delta_rows,
+            "memory_mb": round(
+                (self._rows.nbytes + self._tfs.nbytes + self._impacts.nbytes + self._ptr.nbytes) / 1e6, 1
+            )
+        }
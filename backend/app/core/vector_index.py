@@ -0,0 +1,337 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class VectorIndex:
+    """
+    In-memory top-k similarity index over a contiguous float32 matrix.
+
+    Rows carry three filter columns that are applied before scoring:
+    a category code, a price and a 64-bit tag mask (any-of match). Two
+    search modes:
+
+    - brute force: one matrix-vector product over the filtered rows
+    - IVF: rows are assigned to k-means centroids; a query scores only the
+      rows of its `nprobe` nearest lists (approximate, for large catalogs)
+
+    With metric="cosine" vectors are L2-normalized on insert and scores are
+    inner products. Deletes are tombstones, compacted once they make up a
+    quarter of the rows. save()/load() keep everything in one .npz file.
+    """
+
+    def __init__(self, dim: int, metric: str = "cosine", ivf_min_rows: int = 50000, nprobe: int = 8):
+        if metric not in ("cosine", "ip"):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.dim = dim
+        self.metric = metric
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self._size = 0
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._category = np.zeros(0, dtype=np.int32)
+        self._price = np.zeros(0, dtype=np.float32)
+        self._tags = np.zeros(0, dtype=np.uint64)
+        self._row_of: Dict[int, int] = {}
+        self.categories: Dict[str, int] = {}
+        self.tags: Dict[str, int] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._lists: List[List[int]] = []
+        self._trained_rows = 0
+        self.version: Optional[str] = None  # caller's tag for the data it was built from
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    # -- encoding -----------------------------------------------------------
+
+    def _category_code(self, category: Optional[str], create: bool = True) -> int:
+        if category is None:
+            return -1
+        code = self.categories.get(category)
+        if code is None:
+            if not create:
+                return -2  # never matches
+            code = self.categories[category] = len(self.categories)
+        return code
+
+    def _tag_mask(self, tags: Optional[Iterable[str]], create: bool = True) -> int:
+        mask = 0
+        for tag in tags or ():
+            bit = self.tags.get(tag)
+            if bit is None:
+                if not create:
+                    continue
+                # Beyond 64 distinct tags the last bit is shared, which makes
+                # filtering on those rare tags permissive rather than wrong
+                bit = self.tags[tag] = min(len(self.tags), 63)
+            mask |= 1 << bit
+        return mask
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1.0, norms)
+        return vectors
+
+    # -- writes -------------------------------------------------------------
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        grow = capacity - len(self._ids)
+        self._vectors = np.concatenate([self._vectors, np.zeros((grow, self.dim), dtype=np.float32)])
+        self._ids = np.concatenate([self._ids, np.zeros(grow, dtype=np.int64)])
+        self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+        self._category = np.concatenate([self._category, np.full(grow, -1, dtype=np.int32)])
+        self._price = np.concatenate([self._price, np.full(grow, np.nan, dtype=np.float32)])
+        self._tags = np.concatenate([self._tags, np.zeros(grow, dtype=np.uint64)])
+        self._assign = np.concatenate([self._assign, np.full(grow, -1, dtype=np.int32)])
+
+    def add(
+        self,
+        ids: Sequence[int],
+        vectors: np.ndarray,
+        categories: Optional[Sequence[Optional[str]]] = None,
+        prices: Optional[Sequence[Optional[float]]] = None,
+        tags: Optional[Sequence[Optional[Iterable[str]]]] = None
+    ):
+        """Insert or replace rows"""
+        vectors = self._prepare(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors differ in length")
+        self.remove(ids)
+        self._reserve(len(ids))
+
+        start, end = self._size, self._size + len(ids)
+        self._vectors[start:end] = vectors
+        self._ids[start:end] = ids
+        self._alive[start:end] = True
+        if categories is not None:
+            self._category[start:end] = [self._category_code(c) for c in categories]
+        if prices is not None:
+            self._price[start:end] = [np.nan if p is None else p for p in prices]
+        if tags is not None:
+            self._tags[start:end] = [self._tag_mask(t) for t in tags]
+        for row, material_id in enumerate(ids, start):
+            self._row_of[int(material_id)] = row
+        self._size = end
+
+        if self._centroids is not None:
+            assign = np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+            self._assign[start:end] = assign
+            for row, list_no in zip(range(start, end), assign):
+                self._lists[list_no].append(row)
+        self.dirty = True
+        self._maybe_retrain()
+
+    def remove(self, ids: Iterable[int]):
+        for material_id in ids:
+            row = self._row_of.pop(int(material_id), None)
+            if row is not None:
+                self._alive[row] = False
+                self.dirty = True
+        if self._size and len(self._row_of) < self._size * 0.75:
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned rows and renumber"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._vectors = self._vectors[keep].copy()
+        self._ids = self._ids[keep].copy()
+        self._alive = self._alive[keep].copy()
+        self._category = self._category[keep].copy()
+        self._price = self._price[keep].copy()
+        self._tags = self._tags[keep].copy()
+        self._assign = self._assign[keep].copy()
+        self._size = len(keep)
+        self._row_of = {int(material_id): row for row, material_id in enumerate(self._ids)}
+        self._rebuild_lists()
+        self.dirty = True
+
+    # -- IVF ----------------------------------------------------------------
+
+    def _maybe_retrain(self):
+        rows = len(self._row_of)
+        if rows < self.ivf_min_rows:
+            if self._centroids is not None:
+                self._centroids, self._lists = None, []
+            return
+        if self._centroids is None or rows > self._trained_rows * 2:
+            self.train()
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        """(Re)compute coarse centroids with spherical k-means on a sample"""
+        live = np.flatnonzero(self._alive[:self._size])
+        nlist = max(1, int(4 * np.sqrt(len(live))))
+        rng = np.random.default_rng(seed)
+        sample = self._vectors[rng.choice(live, size=min(len(live), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1.0, norms)
+
+        self._centroids = centroids.astype(np.float32)
+        self._assign[:self._size] = -1
+        for start in range(0, len(live), 65536):
+            chunk = live[start:start + 65536]
+            self._assign[chunk] = np.argmax(self._vectors[chunk] @ self._centroids.T, axis=1)
+        self._rebuild_lists()
+        self._trained_rows = len(live)
+        self.dirty = True
+
+    def _rebuild_lists(self):
+        if self._centroids is None:
+            self._lists = []
+            return
+        self._lists = [[] for _ in range(len(self._centroids))]
+        for row in np.flatnonzero(self._alive[:self._size]):
+            self._lists[self._assign[row]].append(int(row))
+
+    # -- search -------------------------------------------------------------
+
+    def vector(self, material_id: int) -> Optional[np.ndarray]:
+        row = self._row_of.get(int(material_id))
+        return None if row is None else self._vectors[row]
+
+    def scores(self, query: np.ndarray, ids: Iterable[int]) -> np.ndarray:
+        """Similarity of each id to the query; NaN for ids not in the index"""
+        query = self._prepare(query)[0]
+        rows = np.array([self._row_of.get(int(i), -1) for i in ids], dtype=np.int64)
+        result = np.full(len(rows), np.nan, dtype=np.float32)
+        found = rows >= 0
+        result[found] = self._vectors[rows[found]] @ query
+        return result
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        tags: Optional[Iterable[str]] = None,
+        exclude: Iterable[int] = (),
+        nprobe: Optional[int] = None,
+        exact: bool = False
+    ) -> List[Tuple[int, float]]:
+        """Top-k (id, score) pairs among rows that pass every filter"""
+        if not self._row_of:
+            return []
+        query = self._prepare(query)[0]
+
+        if self._centroids is not None and not exact:
+            probes = np.argsort(-(self._centroids @ query))[:nprobe or self.nprobe]
+            rows = np.fromiter(
+                (row for list_no in probes for row in self._lists[list_no]), dtype=np.int64
+            )
+        else:
+            rows = np.arange(self._size)
+
+        keep = self._alive[rows]
+        if category is not None:
+            keep &= self._category[rows] == self._category_code(category, create=False)
+        if min_price is not None:
+            keep &= self._price[rows] >= min_price
+        if max_price is not None:
+            keep &= self._price[rows] <= max_price
+        if tags:
+            mask = np.uint64(self._tag_mask(tags, create=False))
+            keep &= (self._tags[rows] & mask) != 0
+        for material_id in exclude:
+            row = self._row_of.get(int(material_id))
+            if row is not None:
+                keep &= rows != row
+        rows = rows[keep]
+        if not len(rows):
+            return []
+
+        scores = self._vectors[rows] @ query
+        if len(rows) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self._ids[rows[i]]), float(scores[i])) for i in top]
+
+    # -- persistence --------------------------------------------------------
+
+    def save(self, path: str):
+        """Write atomically so a crash never leaves a torn index behind"""
+        live = np.flatnonzero(self._alive[:self._size])
+        meta = {
+            "dim": self.dim,
+            "metric": self.metric,
+            "categories": self.categories,
+            "tags": self.tags,
+            "trained_rows": self._trained_rows,
+            "version": self.version
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+            ids=self._ids[live],
+            vectors=self._vectors[live],
+            category=self._category[live],
+            price=self._price[live],
+            tags=self._tags[live],
+            assign=self._assign[live],
+            centroids=self._centroids if self._centroids is not None else np.zeros((0, self.dim), dtype=np.float32)
+        )
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str, ivf_min_rows: int = 50000, nprobe: int = 8) -> "VectorIndex":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(meta["dim"], meta["metric"], ivf_min_rows, nprobe)
+            index.categories = meta["categories"]
+            index.tags = meta["tags"]
+            index.version = meta.get("version")
+            index._ids = data["ids"]
+            index._vectors = data["vectors"]
+            index._category = data["category"]
+            index._price = data["price"]
+            index._tags = data["tags"]
+            index._assign = data["assign"]
+            centroids = data["centroids"]
+        index._size = len(index._ids)
+        index._alive = np.ones(index._size, dtype=bool)
+        index._row_of = {int(material_id): row for row, material_id in enumerate(index._ids)}
+        if len(centroids):
+            index._centroids = centroids
+            index._trained_rows = meta["trained_rows"]
+            index._rebuild_lists()
+        return index
+
+    def stats(self) -> Dict:
+        return {
+            "rows": len(self._row_of),
+            "tombstones": self._size - len(self._row_of),
+            "dim": self.dim,
+            "metric": self.metric,
+            "mode": "ivf" if self._centroids is not None else "brute_force",
+            "lists": len(self._lists),
+            "nprobe": self.nprobe,
+            "memory_mb": round(self._vectors.nbytes / 1e6, 1),
+            "dirty": self.dirty
+        }
@@ -6,15 +6,48 @@ import uvicorn
 
 from app.api import projects, designs, materials, chat
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import init_db, async_session
+from app.services.ai_service import kimi_ai
+from app.services.chat_writer import chat_write_behind
+from app.services.chat_session_cache import chat_session_cache
+from app.services.faq_index import faq_index
+from app.services.chat_channel import chat_channel_stats
+from app.services.material_index import (
+    load_material_indexes, save_material_indexes, material_vectors, material_text, material_facets,
+    material_prices, material_colors
+)
+from app.services.material_cache import material_result_cache
+from app.services.material_events import material_catalog_events
+from app.services.quiz_outcomes import quiz_outcome_table
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await init_db()
+    await kimi_ai.startup()
+    async with async_session() as db:
+        if faq_index is not None:
+            await faq_index.load_approved(db)
+    await load_material_indexes(async_session)
+    if material_catalog_events is not None:
+        await material_catalog_events.start(async_session)
+    if chat_write_behind is not None:
+        await chat_write_behind.start()
+    if chat_session_cache is not None:
+        await chat_session_cache.start()
     yield
     # Shutdown
+    if material_catalog_events is not None:
+        await material_catalog_events.stop()
+    if chat_session_cache is not None:
+        await chat_session_cache.stop()
+    if chat_write_behind is not None:
+        await chat_write_behind.stop()
+    save_material_indexes()
+    if material_result_cache is not None:
+        await material_result_cache.close()
+    await kimi_ai.shutdown()
 
 
 app = FastAPI(
@@ -47,6 +80,29 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "kimi_pool": kimi_ai.pool_stats(),
+        "llm_cache": kimi_ai.cache.stats(),
+        "llm_singleflight": kimi_ai.inflight.stats(),
+        "llm_scheduler": kimi_ai.scheduler.stats(),
+        "kimi_circuit": kimi_ai.breaker.stats(),
+        "llm_json": kimi_ai.json_stats.stats(),
+        "chat_write_behind": chat_write_behind.stats() if chat_write_behind else {"enabled": False},
+        "chat_session_cache": chat_session_cache.stats() if chat_session_cache else {"enabled": False},
+        "quiz_outcomes": quiz_outcome_table.stats(),
+        "faq": faq_index.stats() if faq_index else {"enabled": False},
+        "chat_ws": chat_channel_stats.stats(),
+        "material_vectors": material_vectors.stats() if material_vectors else {"enabled": False},
+        "material_text": material_text.stats() if material_text else {"enabled": False},
+        "material_facets": material_facets.stats() if material_facets else {"enabled": False},
+        "material_prices": material_prices.stats() if material_prices else {"enabled": False},
+        "material_colors": material_colors.stats() if material_colors else {"enabled": False},
+        "material_cache": material_result_cache.stats() if material_result_cache else {"enabled": False},
+        "material_catalog_events": material_catalog_events.stats() if material_catalog_events else {"enabled": False}
+    }
+
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
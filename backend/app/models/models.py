@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON, ForeignKey, Text, Enum
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON, ForeignKey, Text, Enum, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -62,6 +63,8 @@ class Design(Base):
     # Design metadata
     room_type = Column(String(50))  # living_room, bedroom, kitchen, etc.
     style = Column(String(50))
+    area = Column(Float)  # ㎡
+    description = Column(Text)  # AI-generated design description
     
     # Generated files
     render_images = Column(JSON)  # List of image URLs
@@ -82,6 +85,13 @@ class Design(Base):
 
 class Material(Base):
     __tablename__ = "materials"
+    __table_args__ = (
+        # Bulk ingest upserts on this key
+        Index("uq_materials_supplier_purchase_url", "supplier", "purchase_url", unique=True),
+        # Tag containment filters (?|, ?&, @>)
+        Index("ix_materials_styles_gin", "styles", postgresql_using="gin"),
+        Index("ix_materials_colors_gin", "colors", postgresql_using="gin"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
@@ -92,8 +102,8 @@ class Material(Base):
     currency = Column(String(10), default="CNY")
     
     # Style matching
-    styles = Column(JSON)  # ["modern", "nordic"]
-    colors = Column(JSON)  # ["white", "beige"]
+    styles = Column(JSONB)  # ["modern", "nordic"]
+    colors = Column(JSONB)  # ["white", "beige"]
     
     # External links
     supplier = Column(String(50))  # jd, tmall, etc.
@@ -102,6 +112,9 @@ class Material(Base):
     
     # AI features
     embedding = Column(JSON)  # Vector for similarity search
+    
+    # Part of the catalog version saved with the vector index
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 
 class ChatSession(Base):
@@ -111,6 +124,10 @@ class ChatSession(Base):
     project_id = Column(Integer, ForeignKey("projects.id"))
     session_type = Column(String(50), default="design_assistant")  # design_assistant, style_quiz
     
+    # Rolling summary of turns that no longer fit the prompt budget
+    summary = Column(Text)
+    summary_message_id = Column(Integer, default=0)  # last message folded into summary
+    
     created_at = Column(DateTime, default=datetime.utcnow)
     
     project = relationship("Project", back_populates="chat_sessions")
@@ -119,13 +136,18 @@ class ChatSession(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Keyset pagination over (created_at, id) within a session
+        Index("ix_chat_messages_session_created_id", "session_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("chat_sessions.id"))
     role = Column(String(20))  # user, assistant, system
     content = Column(Text)
     message_type = Column(String(50), default="text")  # text, image, suggestion
-    metadata = Column(JSON)  # Additional data like suggested styles, etc.
+    # "metadata" is reserved on declarative models; keep the column name
+    message_metadata = Column("metadata", JSON)  # Additional data like suggested styles, etc.
     
     created_at = Column(DateTime, default=datetime.utcnow)
     
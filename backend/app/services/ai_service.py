@@ -1,7 +1,14 @@
 import httpx
 import json
-from typing import List, Dict, Optional, AsyncGenerator
+import re
+import time
+from typing import Any, List, Dict, Optional, AsyncGenerator, Tuple
 from app.core.config import settings
+from app.core.cache import TieredCache, make_cache_key
+from app.core.singleflight import SingleFlight
+from app.core.rate_limit import RequestScheduler, Priority, estimate_tokens
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.json_stream import IncrementalJSONExtractor, JSONExtractionStats
 
 
 class KimiAI:
@@ -15,15 +22,228 @@ class KimiAI:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self._client: Optional[httpx.AsyncClient] = None
+        self._requests_total = 0
+        self._requests_in_flight = 0
+        self.cache = TieredCache(
+            namespace="llm",
+            maxsize=settings.LLM_CACHE_MAXSIZE,
+            ttl=settings.LLM_CACHE_TTL,
+            redis_url=settings.REDIS_URL if settings.LLM_CACHE_USE_REDIS else None
+        )
+        self.inflight = SingleFlight()
+        self.scheduler = RequestScheduler(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE
+        )
+        self.json_stats = JSONExtractionStats()
+        self.breaker = CircuitBreaker(
+            "kimi",
+            probe=self._probe,
+            failure_rate_threshold=settings.KIMI_BREAKER_FAILURE_RATE,
+            slow_call_seconds=settings.KIMI_BREAKER_SLOW_CALL_SECONDS,
+            slow_call_rate_threshold=settings.KIMI_BREAKER_SLOW_CALL_RATE,
+            window_size=settings.KIMI_BREAKER_WINDOW,
+            min_calls=settings.KIMI_BREAKER_MIN_CALLS,
+            open_seconds=settings.KIMI_BREAKER_OPEN_SECONDS
+        )
     
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            headers=self.headers,
+            http2=settings.KIMI_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.KIMI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.KIMI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.KIMI_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                settings.KIMI_TIMEOUT,
+                connect=settings.KIMI_CONNECT_TIMEOUT
+            )
+        )
+    
+    async def startup(self):
+        """Open the shared connection pool (called from app lifespan)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+    
+    async def shutdown(self):
+        """Close the shared connection pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        await self.cache.close()
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Scripts and workers that never run the app lifespan still get a
+        # pooled client; it is opened lazily on first use.
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+    
+    def pool_stats(self) -> Dict:
+        """Connection pool statistics for sizing the pool"""
+        stats = {
+            "open": self._client is not None and not self._client.is_closed,
+            "http2": settings.KIMI_HTTP2,
+            "max_connections": settings.KIMI_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.KIMI_MAX_KEEPALIVE_CONNECTIONS,
+            "requests_total": self._requests_total,
+            "requests_in_flight": self._requests_in_flight,
+            "connections": 0,
+            "idle_connections": 0,
+            "active_connections": 0,
+            "http2_connections": 0
+        }
+        if not stats["open"]:
+            return stats
+        
+        # httpx does not expose pool state publicly; read it from the
+        # underlying httpcore pool when available.
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        for conn in getattr(pool, "connections", []):
+            stats["connections"] += 1
+            if conn.is_idle():
+                stats["idle_connections"] += 1
+            else:
+                stats["active_connections"] += 1
+            if "HTTP/2" in conn.info():
+                stats["http2_connections"] += 1
+        return stats
+    
+    def _cache_key(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        # Normalize whitespace so cosmetic prompt edits still share entries
+        normalized = [
+            {"role": m["role"], "content": re.sub(r"\s+", " ", m["content"]).strip()}
+            for m in messages
+        ]
+        return self.cache.key({
+            "model": self.model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": normalized
+        })
+    
+    def _timeout(self, call_type: str) -> httpx.Timeout:
+        return httpx.Timeout(
+            settings.KIMI_CALL_TIMEOUTS.get(call_type, settings.KIMI_TIMEOUT),
+            connect=settings.KIMI_CONNECT_TIMEOUT
+        )
+    
+    @staticmethod
+    def _is_upstream_failure(exc: Exception) -> bool:
+        # 5xx, timeouts and connection errors count against the breaker;
+        # 429 and other client errors do not
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code >= 500
+        return isinstance(exc, httpx.TransportError)
+    
+    async def _probe(self):
+        """Cheap health check used by the circuit breaker while half-open"""
+        response = await self.client.get(
+            f"{self.base_url}/models",
+            timeout=self._timeout("probe")
+        )
+        response.raise_for_status()
+    
+    def _check_rate_limited(self, response: httpx.Response):
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After", "")
+            self.scheduler.backoff(float(retry_after) if retry_after.isdigit() else 5.0)
+    
+    async def _post_completion(self, payload: Dict, priority: Priority, call_type: str) -> Dict:
+        estimated = estimate_tokens(payload["messages"], payload["max_tokens"])
+        async with self.scheduler.slot(priority, estimated) as usage:
+            self._requests_total += 1
+            self._requests_in_flight += 1
+            started = time.monotonic()
+            try:
+                response = await self.client.post(
+                    f"{self.base_url}/chat/completions",
+                    json=payload,
+                    timeout=self._timeout(call_type)
+                )
+                self._check_rate_limited(response)
+                response.raise_for_status()
+                result = response.json()
+            except Exception as e:
+                if self._is_upstream_failure(e):
+                    self.breaker.record_failure(time.monotonic() - started)
+                raise
+            finally:
+                self._requests_in_flight -= 1
+            self.breaker.record_success(time.monotonic() - started)
+            usage["used_tokens"] = result.get("usage", {}).get("total_tokens")
+            return result
+
+    async def create_embeddings(
+        self,
+        texts: List[str],
+        model: Optional[str] = None,
+        priority: Priority = Priority.BATCH
+    ) -> List[List[float]]:
+        """Embed a batch of texts with one OpenAI-compatible /embeddings call"""
+        self.breaker.allow()
+        estimated = int(sum(len(text) for text in texts) / 1.5)
+        async with self.scheduler.slot(priority, estimated) as usage:
+            self._requests_total += 1
+            self._requests_in_flight += 1
+            started = time.monotonic()
+            try:
+                response = await self.client.post(
+                    f"{settings.EMBEDDING_API_BASE or self.base_url}/embeddings",
+                    json={"model": model or settings.EMBEDDING_MODEL, "input": texts},
+                    timeout=self._timeout("embedding")
+                )
+                self._check_rate_limited(response)
+                response.raise_for_status()
+                result = response.json()
+            except Exception as e:
+                if self._is_upstream_failure(e):
+                    self.breaker.record_failure(time.monotonic() - started)
+                raise
+            finally:
+                self._requests_in_flight -= 1
+            self.breaker.record_success(time.monotonic() - started)
+            usage["used_tokens"] = result.get("usage", {}).get("total_tokens")
+            return [item["embedding"] for item in sorted(result["data"], key=lambda item: item["index"])]
+
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
         max_tokens: int = 2000,
-        stream: bool = False
+        stream: bool = False,
+        cache: bool = False,
+        bypass_cache: bool = False,
+        priority: Priority = Priority.INTERACTIVE,
+        call_type: str = "chat"
     ) -> Dict:
-        """Send chat completion request to Kimi"""
+        """
+        Send chat completion request to Kimi
+        
+        Args:
+            cache: opt in to the response cache for deterministic prompts
+            bypass_cache: skip the cache lookup but still refresh the entry
+            priority: admission class; batch work should pass Priority.BATCH
+            call_type: selects the timeout from settings.KIMI_CALL_TIMEOUTS
+        
+        Raises CircuitOpenError without calling Kimi while the circuit is
+        open; callers fall back to their default responses.
+        """
+        use_cache = cache and settings.LLM_CACHE_ENABLED and not stream
+        if use_cache:
+            key = self._cache_key(messages, temperature, max_tokens)
+            if not bypass_cache:
+                cached = await self.cache.get(key)
+                if cached is not None:
+                    return cached
+        
+        self.breaker.allow()
+        
         payload = {
             "model": self.model,
             "messages": messages,
@@ -32,21 +252,144 @@ class KimiAI:
             "stream": stream
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload,
-                timeout=60.0
-            )
-            response.raise_for_status()
-            return response.json()
+        # Identical concurrent requests share one upstream call
+        result = await self.inflight.do(
+            make_cache_key("llm-inflight", payload),
+            lambda: self._post_completion(payload, priority, call_type)
+        )
+        
+        if use_cache:
+            await self.cache.set(key, result)
+        return result
     
-    async def analyze_style_preferences(
+    async def stream_chat_completion(
         self,
-        user_preferences: Dict
-    ) -> Dict:
-        """Analyze user preferences and recommend styles"""
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> AsyncGenerator[str, None]:
+        """Stream chat completion from Kimi, yielding content deltas"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        
+        self.breaker.allow()
+        
+        async with self.scheduler.slot(priority, estimate_tokens(messages, max_tokens)) as usage:
+            self._requests_total += 1
+            self._requests_in_flight += 1
+            started = time.monotonic()
+            first_token_at = None
+            streamed_chars = 0
+            try:
+                async with self.client.stream(
+                    "POST",
+                    f"{self.base_url}/chat/completions",
+                    json=payload,
+                    timeout=self._timeout("stream")
+                ) as response:
+                    self._check_rate_limited(response)
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        # Server-sent events: "data: {...}" lines, "data: [DONE]" at the end
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        if not chunk.get("choices"):
+                            continue
+                        delta = chunk["choices"][0].get("delta", {}).get("content")
+                        if delta:
+                            if first_token_at is None:
+                                first_token_at = time.monotonic()
+                            streamed_chars += len(delta)
+                            yield delta
+            except GeneratorExit:
+                # The consumer stopped early (complete_json does once its JSON is
+                # complete); upstream answered fine, so this is a success too
+                self.breaker.record_success((first_token_at or time.monotonic()) - started)
+                raise
+            except Exception as e:
+                if self._is_upstream_failure(e):
+                    self.breaker.record_failure(time.monotonic() - started)
+                raise
+            else:
+                # Streams are long by nature; judge latency by time to first token
+                self.breaker.record_success((first_token_at or time.monotonic()) - started)
+            finally:
+                self._requests_in_flight -= 1
+                usage["used_tokens"] = estimate_tokens(messages) + int(streamed_chars / 1.5)
+    
+    async def complete_json(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        expect: Optional[str] = None,
+        cache: bool = False,
+        bypass_cache: bool = False,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Tuple[Optional[Any], str]:
+        """
+        Stream a completion and return the first JSON object/array in it.
+        
+        The upstream stream is closed as soon as the JSON value is complete,
+        so trailing prose is never generated. Returns (parsed, text) where
+        parsed is None if no JSON value was found in the whole completion.
+        """
+        use_cache = cache and settings.LLM_CACHE_ENABLED
+        key = "json:" + self._cache_key(messages, temperature, max_tokens)
+        if use_cache and not bypass_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached["json"], cached["text"]
+        
+        parsed, text = await self.inflight.do(
+            key,
+            lambda: self._stream_json(messages, temperature, max_tokens, expect, priority)
+        )
+        if use_cache and parsed is not None:
+            await self.cache.set(key, {"json": parsed, "text": text})
+        return parsed, text
+    
+    async def _stream_json(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        expect: Optional[str],
+        priority: Priority
+    ) -> Tuple[Optional[Any], str]:
+        extractor = IncrementalJSONExtractor(expect)
+        started = time.monotonic()
+        stream = self.stream_chat_completion(messages, temperature, max_tokens, priority)
+        early_stop = False
+        try:
+            async for delta in stream:
+                if extractor.feed(delta):
+                    early_stop = True
+                    break
+        finally:
+            # Closing the generator closes the upstream response
+            await stream.aclose()
+        self.json_stats.record(extractor.done, time.monotonic() - started, early_stop)
+        return extractor.result, extractor.text
+    
+    def style_prompt_fingerprint(self) -> str:
+        """Changes whenever the style analysis prompt template or model changes"""
+        return make_cache_key("style-prompt", {
+            "model": self.model,
+            "messages": self._style_messages({})
+        })
+    
+    def _style_messages(self, user_preferences: Dict) -> List[Dict[str, str]]:
         system_prompt = """你是一位专业的室内设计师，擅长根据用户的家庭情况、生活习惯和偏好推荐最适合的装修风格。
 
 请分析以下信息，并提供：
@@ -82,35 +425,33 @@ class KimiAI:
     "design_tips": ["建议1", "建议2"]
 }}"""
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
+    
+    async def analyze_style_preferences(
+        self,
+        user_preferences: Dict,
+        bypass_cache: bool = False,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Dict:
+        """Analyze user preferences and recommend styles"""
+        messages = self._style_messages(user_preferences)
         
         try:
-            response = await self.chat_completion(messages, temperature=0.7)
-            content = response["choices"][0]["message"]["content"]
-            
-            # Extract JSON from response
-            try:
-                # Try to parse directly
-                result = json.loads(content)
+            result, content = await self.complete_json(
+                messages, temperature=0.7, expect="object",
+                cache=True, bypass_cache=bypass_cache, priority=priority
+            )
+            if result is not None:
                 return result
-            except json.JSONDecodeError:
-                # Try to extract JSON from markdown code block
-                if "```json" in content:
-                    json_str = content.split("```json")[1].split("```")[0].strip()
-                    return json.loads(json_str)
-                elif "```" in content:
-                    json_str = content.split("```")[1].split("```")[0].strip()
-                    return json.loads(json_str)
-                else:
-                    # Return as text analysis if JSON parsing fails
-                    return {
-                        "analysis_text": content,
-                        "recommended_styles": ["现代简约"],
-                        "style_reasoning": "基于您的偏好推荐"
-                    }
+            # Return as text analysis if JSON parsing fails
+            return {
+                "analysis_text": content,
+                "recommended_styles": ["现代简约"],
+                "style_reasoning": "基于您的偏好推荐"
+            }
         except Exception as e:
             return {
                 "error": str(e),
@@ -122,9 +463,11 @@ class KimiAI:
         self,
         room_type: str,
         style: str,
-        requirements: Dict
-    ) -> str:
-        """Generate design description for a room"""
+        requirements: Dict,
+        bypass_cache: bool = False,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Optional[str]:
+        """Generate design description for a room; None if generation failed"""
         system_prompt = """你是一位专业的室内设计师。请根据房间类型、风格和需求，生成详细的设计描述。
 描述应包括：色彩搭配、材质选择、家具布局、灯光设计、装饰元素等。"""
 
@@ -144,22 +487,83 @@ class KimiAI:
         ]
         
         try:
-            response = await self.chat_completion(messages, temperature=0.8)
+            response = await self.chat_completion(
+                messages, temperature=0.8, cache=True, bypass_cache=bypass_cache,
+                priority=priority, call_type="description"
+            )
             return response["choices"][0]["message"]["content"]
-        except Exception as e:
-            return f"生成设计方案时出错：{str(e)}"
+        except Exception:
+            return None
+    
+    async def generate_design_descriptions(
+        self,
+        rooms: List[Dict],
+        style: str,
+        requirements: Dict,
+        bypass_cache: bool = False,
+        priority: Priority = Priority.BATCH
+    ) -> List[Optional[str]]:
+        """
+        Generate descriptions for several rooms in one structured prompt.
+        
+        Returns one entry per room in input order; None where the model's
+        output had no usable description for that room.
+        """
+        system_prompt = """你是一位专业的室内设计师。请根据整套房子的风格和需求，为每个房间生成详细的设计描述。
+描述应包括：色彩搭配、材质选择、家具布局、灯光设计、装饰元素等。各房间风格要统一协调。"""
+
+        room_lines = "\n".join(
+            f"{i + 1}. {room.get('room_type', '未知')}（面积：{room.get('area', '未知')} ㎡）"
+            for i, room in enumerate(rooms)
+        )
+        user_prompt = f"""请为以下整套房子的每个房间生成设计方案：
+
+设计风格：{style}
+总预算：{requirements.get('budget', '未知')} 万元
+特殊需求：{requirements.get('special_needs', '无')}
+
+房间列表：
+{room_lines}
+
+每个房间的描述300-500字。请以JSON数组格式输出，顺序与房间列表一致：
+[
+    {{"index": 1, "room_type": "房间类型", "description": "设计描述"}}
+]"""
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        
+        descriptions: List[Optional[str]] = [None] * len(rooms)
+        try:
+            result, _ = await self.complete_json(
+                messages, temperature=0.8, max_tokens=min(8000, 800 * len(rooms) + 200),
+                expect="array", cache=True, bypass_cache=bypass_cache, priority=priority
+            )
+        except Exception:
+            return descriptions
+        
+        for position, item in enumerate(result or []):
+            if not isinstance(item, dict) or not item.get("description"):
+                continue
+            index = item.get("index", position + 1)
+            if isinstance(index, int) and 1 <= index <= len(rooms):
+                descriptions[index - 1] = item["description"]
+        return descriptions
     
     async def suggest_materials(
         self,
         category: str,
         style: str,
-        budget_level: str
+        budget_level: str,
+        bypass_cache: bool = False
     ) -> List[Dict]:
         """Suggest materials based on category, style and budget"""
         system_prompt = """你是一位材料专家。请根据材料类别、装修风格和预算档次，推荐3-5种合适的材料。
 对于每种材料，提供：名称、品牌建议、价格区间、优缺点。"""
 
-        user_prompt = f"""请推荐{class_category}材料：
+        user_prompt = f"""请推荐{category}材料：
 
 类别：{category}
 风格：{style}
@@ -183,21 +587,13 @@ class KimiAI:
         ]
         
         try:
-            response = await self.chat_completion(messages, temperature=0.7)
-            content = response["choices"][0]["message"]["content"]
-            
-            # Try to extract JSON
-            try:
-                if "```json" in content:
-                    json_str = content.split("```json")[1].split("```")[0].strip()
-                    return json.loads(json_str)
-                elif "```" in content:
-                    json_str = content.split("```")[1].split("```")[0].strip()
-                    return json.loads(json_str)
-                else:
-                    return json.loads(content)
-            except:
-                return [{"name": "解析失败", "description": content}]
+            result, content = await self.complete_json(
+                messages, temperature=0.7, expect="array",
+                cache=True, bypass_cache=bypass_cache
+            )
+            if result is not None:
+                return result
+            return [{"name": "解析失败", "description": content}]
         except Exception as e:
             return [{"name": "出错", "description": str(e)}]
     
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.services.chat_service import ChatService
+
+logger = logging.getLogger(__name__)
+
+# Frames that start work and count against the in-flight limit
+TURN_FRAMES = ("message", "quiz_start", "quiz_answer")
+
+
+class ChatChannelStats:
+    def __init__(self):
+        self.open = 0
+        self.connections = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.turns = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.rejected = 0  # frames refused because the connection had too many pending
+        self.send_waits = 0  # frames that waited on a full send queue
+
+    def stats(self) -> Dict:
+        return {
+            "open": self.open,
+            "connections": self.connections,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "turns": self.turns,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "send_waits": self.send_waits,
+            "max_inflight": settings.CHAT_WS_MAX_INFLIGHT,
+            "max_pending": settings.CHAT_WS_MAX_PENDING,
+            "send_queue_size": settings.CHAT_WS_SEND_QUEUE_SIZE
+        }
+
+
+chat_channel_stats = ChatChannelStats()
+
+
+class ChatChannel:
+    """
+    One WebSocket connection carrying any number of chat and quiz sessions.
+
+    Client frames (JSON), each with a client-chosen request "id":
+        {"type": "message", "id", "session_id", "content", "message_type"?}
+        {"type": "quiz_start", "id", "project_id"}
+        {"type": "quiz_answer", "id", "session_id", "answer": {...}}
+        {"type": "cancel", "id"}
+        {"type": "ping", "id"}
+    Server frames echo "id" and "session_id": token/done for chat turns,
+    quiz/quiz_result for quiz steps, plus cancelled, error and pong.
+
+    Turns of one session run in order; different sessions run
+    concurrently. The socket is read continuously so cancel and ping are
+    handled at once, but at most CHAT_WS_MAX_INFLIGHT turns run at a time;
+    later turns wait for a slot, and at most CHAT_WS_MAX_PENDING requests
+    may be running or waiting; further frames get an error. Outgoing frames go through a bounded
+    queue, so a slow client slows token generation instead of buffering it.
+    Every turn opens its own short-lived DB session from the shared factory.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        session_factory=async_session,
+        max_inflight: int = settings.CHAT_WS_MAX_INFLIGHT,
+        max_pending: int = settings.CHAT_WS_MAX_PENDING,
+        send_queue_size: int = settings.CHAT_WS_SEND_QUEUE_SIZE
+    ):
+        self.websocket = websocket
+        self.session_factory = session_factory
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=send_queue_size)
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.max_pending = max_pending
+        self.pending = 0
+        # session_id -> [lock, turns holding or waiting for it]
+        self.session_locks: Dict[int, List] = {}
+        self.requests: Dict[str, asyncio.Task] = {}
+
+    async def run(self):
+        await self.websocket.accept()
+        chat_channel_stats.open += 1
+        chat_channel_stats.connections += 1
+        writer = asyncio.ensure_future(self._write_loop())
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                try:
+                    frame = json.loads(message.get("text") or "")
+                except ValueError:
+                    frame = None
+                if not isinstance(frame, dict):
+                    await self.send({"type": "error", "detail": "Frames must be JSON objects sent as text"})
+                    continue
+                chat_channel_stats.frames_in += 1
+                await self._dispatch(frame)
+        finally:
+            chat_channel_stats.open -= 1
+            tasks = list(self.requests.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.cancel()
+
+    async def _dispatch(self, frame: Dict):
+        request_id = str(frame.get("id", ""))
+        if frame.get("type") == "cancel":
+            task = self.requests.get(request_id)
+            if task is not None:
+                task.cancel()
+            return
+        if self.pending >= self.max_pending:
+            chat_channel_stats.rejected += 1
+            await self.send({
+                "id": request_id,
+                "session_id": frame.get("session_id"),
+                "type": "error",
+                "detail": "Too many pending requests"
+            })
+            return
+
+        task = asyncio.ensure_future(self._handle(request_id, frame))
+        self.pending += 1
+        if request_id:
+            self.requests[request_id] = task
+
+        def done(_):
+            self.pending -= 1
+            if self.requests.get(request_id) is task:
+                del self.requests[request_id]
+
+        task.add_done_callback(done)
+
+    async def send(self, frame: Dict):
+        if self.outbox.full():
+            chat_channel_stats.send_waits += 1
+        await self.outbox.put(frame)
+
+    async def _write_loop(self):
+        while True:
+            frame = await self.outbox.get()
+            try:
+                await self.websocket.send_text(json.dumps(frame, ensure_ascii=False, default=str))
+            except Exception:
+                return  # the reader sees the disconnect and tears down
+            chat_channel_stats.frames_out += 1
+
+    @asynccontextmanager
+    async def _session_turn(self, session_id: int):
+        """Serialize turns of one session; the lock is dropped with its last turn"""
+        entry = self.session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.session_locks[session_id]
+
+    async def _handle(self, request_id: str, frame: Dict):
+        kind = frame.get("type")
+        session_id: Optional[int] = frame.get("session_id")
+        reply = {"id": request_id, "session_id": session_id}
+        try:
+            if kind == "ping":
+                await self.send({**reply, "type": "pong"})
+            elif kind == "quiz_start":
+                async with self.inflight:
+                    await self._quiz_start(reply, frame["project_id"])
+            elif kind in TURN_FRAMES:
+                if session_id is None:
+                    raise ValueError("session_id is required")
+                # Queue behind the session's earlier turns before taking a slot
+                async with self._session_turn(session_id), self.inflight:
+                    if kind == "message":
+                        await self._chat_turn(reply, session_id, frame)
+                    else:
+                        await self._quiz_answer(reply, session_id, frame.get("answer") or {})
+                chat_channel_stats.turns += 1
+            else:
+                raise ValueError(f"Unknown frame type: {kind}")
+        except asyncio.CancelledError:
+            chat_channel_stats.cancelled += 1
+            # Best effort: the connection may be closing
+            if not self.outbox.full():
+                self.outbox.put_nowait({**reply, "type": "cancelled"})
+            raise
+        except (KeyError, ValueError) as e:
+            await self.send({**reply, "type": "error", "detail": str(e)})
+        except Exception:
+            chat_channel_stats.errors += 1
+            logger.exception("chat channel request %r failed", request_id)
+            await self.send({**reply, "type": "error", "detail": "Request failed"})
+
+    async def _chat_turn(self, reply: Dict, session_id: int, frame: Dict):
+        content = frame["content"]
+        async with self.session_factory() as db:
+            service = ChatService(db)
+            try:
+                service.queue_message(session_id, "user", content, frame.get("message_type", "text"))
+                async for event in service.stream_ai_response(session_id, content):
+                    await self.send({**reply, **event})
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+
+    async def _quiz_start(self, reply: Dict, project_id: int):
+        async with self.session_factory() as db:
+            service = ChatService(db)
+            quiz_session, first_question = await service.start_quiz(project_id)
+            await service.commit_turn()
+            await db.commit()
+        await self.send({
+            **reply,
+            "type": "quiz",
+            "session_id": quiz_session.id,
+            "content": first_question["content"],
+            "metadata": {"step": 1, "suggestions": first_question["suggestions"]}
+        })
+
+    async def _quiz_answer(self, reply: Dict, session_id: int, answer: Dict):
+        async with self.session_factory() as db:
+            service = ChatService(db)
+            result = await service.process_quiz_answer(session_id, answer)
+            await service.commit_turn()
+            await db.commit()
+        if "error" in result:
+            await self.send({**reply, "type": "error", "detail": result["error"]})
+        else:
+            await self.send({**reply, "type": result.get("message_type", "quiz"), **result})
@@ -0,0 +1,147 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.rate_limit import Priority, estimate_tokens
+from app.models.models import ChatSession, ChatMessage
+from app.services.ai_service import kimi_ai
+from app.services.chat_session_cache import chat_session_cache, cache_entry, SessionBuffer
+
+
+SUMMARY_PROMPT = """你是对话摘要助手。请把【已有摘要】和【新增对话】合并成一份新的摘要。
+要求：
+1. 保留用户的家庭情况、房屋信息、风格偏好、预算、已确认的决定和待解决的问题
+2. 删除寒暄和重复内容
+3. 使用第三人称，不超过300字
+只输出摘要正文。"""
+
+
+class ChatContextBuilder:
+    """
+    Builds the chat history part of the prompt within a token budget.
+
+    The newest turns are always included verbatim. Turns that no longer fit
+    are folded into a rolling summary stored on the ChatSession, so the
+    prompt size stays flat however long the session gets. When a fold
+    happens, only CHAT_CONTEXT_KEEP_RATIO of the budget is kept verbatim,
+    which leaves room for several turns before the next fold.
+    
+    History is read from the per-worker session cache when the session is
+    active there, so a live conversation needs no database reads.
+    """
+
+    def __init__(self, db: AsyncSession, token_budget: Optional[int] = None):
+        self.db = db
+        self.ai = kimi_ai
+        self.token_budget = token_budget or settings.CHAT_CONTEXT_TOKEN_BUDGET
+
+    async def build(self, session_id: int) -> List[Dict[str, str]]:
+        """Return prompt messages (summary first, then recent turns, oldest first)"""
+        buffer = await self._load(session_id)
+        summary = buffer.summary
+        history = list(buffer.messages)
+        
+        recent_budget = self.token_budget - self._tokens(summary)
+        recent, older = self._split_by_budget(history, recent_budget)
+        
+        if older:
+            keep, fold = self._split_by_budget(
+                history, int(recent_budget * settings.CHAT_CONTEXT_KEEP_RATIO)
+            )
+            # Turns still waiting on write-behind have no id to reference yet;
+            # they are always the newest, so fold the ones before them
+            written = next((i for i, m in enumerate(fold) if m["id"] is None), len(fold))
+            keep, fold = fold[written:] + keep, fold[:written]
+            if fold:
+                new_summary = await self._summarize(summary, fold)
+                if new_summary is not None:
+                    session = await self.db.get(ChatSession, session_id)
+                    if session is not None:
+                        session.summary = new_summary
+                        session.summary_message_id = fold[-1]["id"]
+                    if chat_session_cache is not None:
+                        # Shared with other requests: only once the summary is committed
+                        chat_session_cache.fold_on_commit(self.db, session_id, new_summary, fold[-1]["id"])
+                    else:
+                        buffer.fold(new_summary, fold[-1]["id"])
+                    summary = new_summary
+                    recent = keep
+        
+        messages = []
+        if summary:
+            messages.append({"role": "system", "content": f"此前对话摘要：\n{summary}"})
+        for msg in recent:
+            messages.append({"role": msg["role"], "content": msg["content"]})
+        return messages
+    
+    async def _load(self, session_id: int) -> SessionBuffer:
+        if chat_session_cache is not None:
+            buffer = chat_session_cache.get(session_id)
+            if buffer is not None:
+                return buffer
+        
+        session = await self.db.get(ChatSession, session_id)
+        summary = session.summary if session else None
+        summarized_upto = (session.summary_message_id or 0) if session else 0
+        history = await self._load_unsummarized(session_id, summarized_upto)
+        
+        if chat_session_cache is not None:
+            return chat_session_cache.fill(session_id, summary, summarized_upto, history)
+        return SessionBuffer(summary, summarized_upto, history, settings.CHAT_CONTEXT_MAX_FETCH)
+    
+    async def _load_unsummarized(self, session_id: int, after_id: int) -> List[Dict]:
+        result = await self.db.execute(
+            select(ChatMessage)
+            .where(ChatMessage.session_id == session_id, ChatMessage.id > after_id)
+            .order_by(ChatMessage.id.desc())
+            .limit(settings.CHAT_CONTEXT_MAX_FETCH)
+        )
+        return [
+            cache_entry({"id": m.id, "role": m.role, "content": m.content, "created_at": m.created_at})
+            for m in reversed(result.scalars().all())
+        ]
+    
+    def _split_by_budget(
+        self,
+        history: List[Dict],
+        budget: int
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """Split oldest-first history into (recent, older) where recent fits the budget"""
+        used = 0
+        cut = len(history)
+        for i in range(len(history) - 1, -1, -1):
+            used += self._tokens(history[i]["content"])
+            # The newest message is always kept, even if it alone exceeds the budget
+            if used > budget and i < len(history) - 1:
+                break
+            cut = i
+        return history[cut:], history[:cut]
+
+    @staticmethod
+    def _tokens(text: Optional[str]) -> int:
+        if not text:
+            return 0
+        return estimate_tokens([{"content": text}])
+
+    async def _summarize(self, summary: Optional[str], turns: List[Dict]) -> Optional[str]:
+        role_names = {"user": "用户", "assistant": "设计师"}
+        transcript = "\n".join(
+            f"{role_names.get(m['role'], m['role'])}：{m['content']}" for m in turns
+        )
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"【已有摘要】\n{summary or '无'}\n\n【新增对话】\n{transcript}"}
+        ]
+        try:
+            response = await self.ai.chat_completion(
+                messages,
+                temperature=0.3,
+                max_tokens=settings.CHAT_SUMMARY_MAX_TOKENS,
+                priority=Priority.DEFAULT,
+                call_type="summary"
+            )
+            return response["choices"][0]["message"]["content"].strip()
+        except Exception:
+            # Keep the old summary; the fold is retried on the next turn
+            return None
@@ -1,16 +1,30 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List, Optional, Dict
+from sqlalchemy import select, tuple_
+from typing import List, Optional, Dict, AsyncGenerator, Tuple
+from datetime import datetime
+import asyncio
+import base64
 import json
+import logging
 
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.rate_limit import Priority
 from app.models.models import ChatSession, ChatMessage
 from app.services.ai_service import kimi_ai
+from app.core.json_stream import extract_json
+from app.services.chat_context import ChatContextBuilder
+from app.services.chat_writer import insert_messages, chat_write_behind
+from app.services.chat_session_cache import chat_session_cache
+from app.services.faq_index import faq_index
+from app.services.quiz_outcomes import quiz_outcome_table, quiz_context, rule_based_outcome
 
 
 class ChatService:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.ai = kimi_ai
+        self.pending_messages: List[Dict] = []
     
     async def create_session(self, project_id: int, session_type: str = "design_assistant") -> ChatSession:
         """Create a new chat session"""
@@ -36,39 +50,113 @@ class ChatService:
             role=role,
             content=content,
             message_type=message_type,
-            metadata=metadata or {}
+            message_metadata=metadata or {}
         )
         self.db.add(message)
         await self.db.flush()
+        if chat_session_cache is not None:
+            chat_session_cache.append_on_commit(
+                self.db, session_id,
+                [{"id": message.id, "role": role, "content": content, "created_at": message.created_at}]
+            )
         return message
     
+    def queue_message(
+        self,
+        session_id: int,
+        role: str,
+        content: str,
+        message_type: str = "text",
+        metadata: Dict = None
+    ) -> Dict:
+        """Buffer a message for the current turn; written by commit_turn()"""
+        row = {
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "message_type": message_type,
+            "message_metadata": metadata or {},
+            "created_at": datetime.utcnow()
+        }
+        self.pending_messages.append(row)
+        return row
+    
+    async def commit_turn(self) -> List[Dict]:
+        """
+        Persist the messages buffered for this turn in one batched INSERT.
+        
+        With CHAT_WRITE_BEHIND enabled the rows are durably staged and
+        written in the background once this transaction commits instead,
+        so they come back without ids.
+        """
+        rows, self.pending_messages = self.pending_messages, []
+        if not rows:
+            return rows
+        if chat_write_behind is not None:
+            await chat_write_behind.submit(self.db, rows)
+            written = [{**row, "id": None} for row in rows]
+        else:
+            ids = await insert_messages(self.db, rows)
+            written = [{**row, "id": message_id} for row, message_id in zip(rows, ids)]
+        
+        if chat_session_cache is not None:
+            for session_id in dict.fromkeys(row["session_id"] for row in written):
+                session_rows = [row for row in written if row["session_id"] == session_id]
+                chat_session_cache.append_on_commit(self.db, session_id, session_rows)
+        return written
+    
     async def get_messages(
-        self, 
-        session_id: int, 
-        skip: int = 0, 
-        limit: int = 100
-    ) -> List[ChatMessage]:
-        """Get chat history"""
-        result = await self.db.execute(
-            select(ChatMessage)
-            .where(ChatMessage.session_id == session_id)
-            .order_by(ChatMessage.created_at)
-            .offset(skip)
-            .limit(limit)
-        )
-        return result.scalars().all()
+        self,
+        session_id: int,
+        limit: int = 100,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> Dict:
+        """
+        Get a page of chat history, oldest first.
+        
+        Pages by keyset over (created_at, id) so every page costs the same
+        index range scan however deep it is. Without a cursor the newest
+        page is returned; pass the returned before/after cursors to move
+        to older/newer messages.
+        """
+        stmt = select(ChatMessage).where(ChatMessage.session_id == session_id)
+        position = tuple_(ChatMessage.created_at, ChatMessage.id)
+        
+        if after:
+            stmt = stmt.where(position > tuple_(*decode_cursor(after)))
+            stmt = stmt.order_by(ChatMessage.created_at, ChatMessage.id)
+        else:
+            if before:
+                stmt = stmt.where(position < tuple_(*decode_cursor(before)))
+            stmt = stmt.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        
+        # One extra row tells whether another page exists in this direction
+        result = await self.db.execute(stmt.limit(limit + 1))
+        messages = result.scalars().all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if not after:
+            messages = list(reversed(messages))
+        
+        return {
+            "messages": messages,
+            "before": encode_cursor(messages[0]) if messages else before,
+            "after": encode_cursor(messages[-1]) if messages else after,
+            "has_more_before": has_more if not after else None,
+            "has_more_after": has_more if after else None
+        }
     
-    async def get_ai_response(self, session_id: int, user_message: str) -> Dict:
-        """Get AI response using Kimi"""
-        try:
-            # Build context from chat history
-            chat_history = await self.get_messages(session_id, limit=10)
-            messages = []
-            
-            # System prompt
-            messages.append({
-                "role": "system",
-                "content": """你是一位专业的室内设计师助手，擅长：
+    async def _build_ai_messages(self, session_id: int, user_message: str) -> List[Dict]:
+        """Build the Kimi prompt from chat history"""
+        # Rolling summary + newest turns within the token budget
+        chat_history = await ChatContextBuilder(self.db).build(session_id)
+        messages = []
+        
+        # System prompt
+        messages.append({
+            "role": "system",
+            "content": """你是一位专业的室内设计师助手，擅长：
 1. 根据用户需求推荐装修风格
 2. 提供材料选择建议
 3. 解答装修相关问题
@@ -76,51 +164,169 @@ class ChatService:
 
 请用专业但易懂的语言回答，必要时给出具体建议和数据支持。
 如果是风格推荐，请以结构化方式输出便于前端展示。"""
-            })
-            
-            # Add chat history
-            for msg in chat_history:
-                messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
-            
-            # Add current message
-            messages.append({"role": "user", "content": user_message})
+        })
+        
+        # Add chat history; the current message has usually been saved already
+        if chat_history and chat_history[-1] == {"role": "user", "content": user_message}:
+            chat_history.pop()
+        messages.extend(chat_history)
+        
+        # Add current message
+        messages.append({"role": "user", "content": user_message})
+        return messages
+    
+    def _classify_response(self, user_message: str, content: str) -> Dict:
+        """Determine message type and metadata of an AI response"""
+        message_type = "text"
+        metadata = {}
+        
+        # Check if response contains structured data
+        if any(keyword in user_message for keyword in ["风格", "推荐", "适合"]):
+            message_type = "suggestion"
+            # Try to parse structured recommendations
+            structured = extract_json(content, expect="object")
+            if structured is not None:
+                metadata = structured
+        elif any(keyword in user_message for keyword in ["材料", "地板", "瓷砖", "价格"]):
+            message_type = "material_suggestion"
+        elif "?" in user_message or "？" in user_message:
+            message_type = "answer"
+        
+        return {
+            "content": content,
+            "message_type": message_type,
+            "metadata": metadata
+        }
+    
+    async def _faq_answer(self, session_id: int, user_message: str) -> Optional[Dict]:
+        """Canned FAQ answer, only for the opening question of a session"""
+        if faq_index is None or await self._has_context(session_id):
+            return None
+        return faq_index.match(user_message)
+
+    async def _has_context(self, session_id: int) -> bool:
+        """Whether earlier turns exist that a canned answer would ignore"""
+        if chat_session_cache is not None:
+            buffer = chat_session_cache.get(session_id)
+            if buffer is not None:
+                return bool(buffer.summary or buffer.messages)
+        earlier = await self.db.scalar(
+            select(ChatMessage.id).where(ChatMessage.session_id == session_id).limit(1)
+        )
+        if earlier is not None:
+            return True
+        if chat_write_behind is not None:
+            return bool(await asyncio.to_thread(chat_write_behind.spooled_rows, session_id))
+        return False
+
+    async def get_ai_response(self, session_id: int, user_message: str) -> Dict:
+        """Get AI response using Kimi"""
+        answer = await self._faq_answer(session_id, user_message)
+        if answer is not None:
+            return answer
+        
+        try:
+            messages = await self._build_ai_messages(session_id, user_message)
             
             # Call Kimi
             response = await self.ai.chat_completion(messages, temperature=0.8)
             content = response["choices"][0]["message"]["content"]
             
-            # Determine message type based on content
-            message_type = "text"
-            metadata = {}
-            
-            # Check if response contains structured data
-            if any(keyword in user_message for keyword in ["风格", "推荐", "适合"]):
-                message_type = "suggestion"
-                # Try to parse structured recommendations
-                try:
-                    if "```json" in content:
-                        json_str = content.split("```json")[1].split("```")[0].strip()
-                        metadata = json.loads(json_str)
-                except:
-                    pass
-            elif any(keyword in user_message for keyword in ["材料", "地板", "瓷砖", "价格"]):
-                message_type = "material_suggestion"
-            elif "?" in user_message or "？" in user_message:
-                message_type = "answer"
-            
-            return {
-                "content": content,
-                "message_type": message_type,
-                "metadata": metadata
-            }
+            return self._classify_response(user_message, content)
             
         except Exception as e:
             # Fallback to mock response if AI fails
             return await self._get_mock_response(user_message)
     
+    async def stream_ai_response(
+        self,
+        session_id: int,
+        user_message: str
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        Stream AI response tokens, then persist the assistant message.
+        
+        Yields {"type": "token", "content": ...} events while Kimi generates
+        and a final {"type": "done", "message": ...} event once the buffered
+        text has been classified and saved together with any messages
+        queued earlier in the turn.
+        """
+        buffer = []
+        answer = await self._faq_answer(session_id, user_message)
+        try:
+            if answer is not None:
+                yield {"type": "token", "content": answer["content"]}
+                response = answer
+            else:
+                messages = await self._build_ai_messages(session_id, user_message)
+                async for delta in self.ai.stream_chat_completion(messages, temperature=0.8):
+                    buffer.append(delta)
+                    yield {"type": "token", "content": delta}
+                response = self._classify_response(user_message, "".join(buffer))
+        except Exception as e:
+            if buffer:
+                # Keep what the user has already seen
+                response = self._classify_response(user_message, "".join(buffer))
+            else:
+                # Fallback to mock response if AI fails before the first token
+                response = await self._get_mock_response(user_message)
+                yield {"type": "token", "content": response["content"]}
+        
+        self.queue_message(
+            session_id,
+            "assistant",
+            response["content"],
+            response.get("message_type", "text"),
+            response.get("metadata")
+        )
+        message = (await self.commit_turn())[-1]
+        yield {
+            "type": "done",
+            "message": {
+                "id": message["id"],
+                "role": message["role"],
+                "content": message["content"],
+                "message_type": message["message_type"],
+                "metadata": message["message_metadata"]
+            }
+        }
+    
+    async def approve_message(self, message_id: int) -> Optional[ChatMessage]:
+        """
+        Mark an assistant answer as approved for reuse by the FAQ index.
+        
+        The user message right before it is stored as the question it
+        answers. Other workers pick approved answers up on their next start.
+        """
+        message = await self.db.get(ChatMessage, message_id)
+        if message is None or message.role != "assistant":
+            return None
+        
+        result = await self.db.execute(
+            select(ChatMessage.content)
+            .where(
+                ChatMessage.session_id == message.session_id,
+                ChatMessage.role == "user",
+                tuple_(ChatMessage.created_at, ChatMessage.id) < (message.created_at, message.id)
+            )
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+            .limit(1)
+        )
+        question = result.scalar_one_or_none()
+        if question is None:
+            return None
+        
+        # Reassign so SQLAlchemy sees the JSON column change
+        message.message_metadata = {
+            **(message.message_metadata or {}),
+            "approved": True,
+            "approved_question": question
+        }
+        await self.db.flush()
+        if faq_index is not None:
+            faq_index.add_approved(message.id, question, message.content, message.message_type)
+        return message
+    
     async def _get_mock_response(self, user_message: str) -> Dict:
         """Fallback mock response"""
         user_lower = user_message.lower()
@@ -153,13 +359,55 @@ class ChatService:
         """Analyze user preferences using Kimi AI"""
         return await self.ai.analyze_style_preferences(preferences)
     
+    async def start_quiz(self, project_id: int) -> Tuple[ChatSession, Dict]:
+        """Create a style quiz session and queue its first question"""
+        quiz_session = await self.create_session(project_id, "style_quiz")
+        first_question = {
+            "content": "让我们通过几个简单的问题，找到最适合你的装修风格！\n\n首先，你喜欢家里整体氛围是：",
+            "suggestions": [
+                {"id": "bright", "text": "☀️ 明亮通透，阳光充足", "icon": "☀️"},
+                {"id": "warm", "text": "🕯️ 温馨舒适，暖色调", "icon": "🕯️"},
+                {"id": "minimal", "text": "⚪ 简约干净，少即是多", "icon": "⚪"},
+                {"id": "luxury", "text": "✨ 精致奢华，品质感", "icon": "✨"}
+            ]
+        }
+        self.queue_message(
+            quiz_session.id,
+            "assistant",
+            first_question["content"],
+            "quiz",
+            {"suggestions": first_question["suggestions"], "step": 1}
+        )
+        return quiz_session, first_question
+    
+    async def _quiz_answers(self, session_id: int) -> Dict[int, str]:
+        """Answers given so far in a quiz session, keyed by step; later answers win"""
+        result = await self.db.execute(
+            select(ChatMessage.message_metadata)
+            .where(
+                ChatMessage.session_id == session_id,
+                ChatMessage.message_type == "quiz_answer"
+            )
+            .order_by(ChatMessage.created_at, ChatMessage.id)
+        )
+        metadata = list(result.scalars())
+        if chat_write_behind is not None:
+            # Earlier answers may still be waiting for the background writer
+            spooled = await asyncio.to_thread(chat_write_behind.spooled_rows, session_id)
+            metadata += [row["message_metadata"] for row in spooled if row["message_type"] == "quiz_answer"]
+        metadata += [
+            row["message_metadata"] for row in self.pending_messages
+            if row["session_id"] == session_id and row["message_type"] == "quiz_answer"
+        ]
+        return {m["step"]: m["answer"] for m in metadata if m and "step" in m}
+    
     async def process_quiz_answer(self, session_id: int, answer: Dict) -> Dict:
         """Process quiz answer and return next question or result"""
         current_step = answer.get("step", 1)
         selected_option = answer.get("option")
         
         # Save answer
-        await self.save_message(
+        self.queue_message(
             session_id,
             "user",
             f"选择了: {selected_option}",
@@ -214,35 +462,84 @@ class ChatService:
             }
         
         elif current_step == 4:
-            # Use Kimi to generate personalized recommendation
-            quiz_context = {
-                "family_members": answer.get("family_members", 3),
-                "has_pets": answer.get("has_pets", False),
-                "storage_needs": answer.get("storage_needs", "normal"),
-                "brightness_preference": answer.get("brightness", "bright")
-            }
+            answers = await self._quiz_answers(session_id)
+            recommendation = quiz_outcome_table.get(answers)
+            source = "table"
+            if recommendation is None:
+                recommendation = rule_based_outcome(answers)
+                source = "rules"
             
-            # Get AI analysis
-            ai_recommendation = await self.analyze_user_preferences(quiz_context)
-            
-            await self.save_message(
+            self.queue_message(
                 session_id,
                 "assistant",
-                ai_recommendation.get("style_reasoning", ""),
+                recommendation.get("style_reasoning", ""),
                 "quiz_result",
-                ai_recommendation
+                {**recommendation, "source": source}
             )
+            if settings.QUIZ_LLM_REFINEMENT:
+                _spawn(_refine_quiz_result(session_id, answers))
             
-            styles = ai_recommendation.get("recommended_styles", ["现代简约"])
-            reasoning = ai_recommendation.get("style_reasoning", "根据您的需求推荐")
+            styles = recommendation.get("recommended_styles", ["现代简约"])
+            reasoning = recommendation.get("style_reasoning", "根据您的需求推荐")
             
             return {
                 "content": f"🎉 为您推荐：**{' + '.join(styles)}**\n\n{reasoning}",
                 "message_type": "quiz_result",
                 "metadata": {
-                    "result": ai_recommendation,
+                    "result": recommendation,
+                    "source": source,
+                    "refinement_pending": settings.QUIZ_LLM_REFINEMENT,
                     "next_action": "开始设计"
                 }
             }
         
-        return {"error": "Invalid quiz step"}
\ No newline at end of file
+        return {"error": "Invalid quiz step"}
+
+
+_background_tasks = set()
+
+
+def _spawn(coro):
+    # Hold a reference so the task is not garbage-collected mid-flight
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _refine_quiz_result(session_id: int, answers: Dict[int, str]):
+    """Ask Kimi for a personalized quiz result and store it next to the served one"""
+    try:
+        recommendation = await kimi_ai.analyze_style_preferences(
+            quiz_context(answers), priority=Priority.DEFAULT
+        )
+        if "error" in recommendation or "analysis_text" in recommendation:
+            return  # Kimi failed or returned prose; keep the served result
+        async with async_session() as db:
+            service = ChatService(db)
+            service.queue_message(
+                session_id,
+                "assistant",
+                recommendation.get("style_reasoning", ""),
+                "quiz_refinement",
+                {**recommendation, "source": "llm"}
+            )
+            await service.commit_turn()
+            await db.commit()
+    except Exception as e:
+        logging.getLogger(__name__).warning("Quiz refinement failed for session %s: %s", session_id, e)
+
+
+def encode_cursor(message: ChatMessage) -> str:
+    """Opaque cursor for a message's (created_at, id) position"""
+    raw = json.dumps([message.created_at.isoformat(), message.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(message_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
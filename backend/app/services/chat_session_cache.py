@@ -0,0 +1,201 @@
+import asyncio
+import functools
+import json
+import uuid
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import redis.asyncio as aioredis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+
+def cache_entry(message: Dict) -> Dict:
+    """The fields a SessionBuffer keeps of a message row or dict"""
+    created_at = message.get("created_at")
+    return {
+        "id": message["id"],
+        "role": message["role"],
+        "content": message["content"],
+        "created_at": created_at.isoformat() if created_at is not None else None
+    }
+
+
+class SessionBuffer:
+    """Recent, not-yet-summarized messages of one chat session"""
+
+    __slots__ = ("summary", "summary_message_id", "messages")
+
+    def __init__(self, summary: Optional[str], summary_message_id: int, messages: List[Dict], maxlen: int):
+        self.summary = summary
+        self.summary_message_id = summary_message_id
+        self.messages: Deque[Dict] = deque(messages, maxlen=maxlen)
+
+    def backfill(self, ids: Dict[str, int]):
+        """Set the ids of write-behind messages, keyed by created_at isoformat"""
+        for message in self.messages:
+            if message["id"] is None and message.get("created_at") in ids:
+                message["id"] = ids[message["created_at"]]
+
+    def fold(self, summary: str, summary_message_id: int):
+        """Record a new summary and drop the messages it now covers"""
+        self.summary = summary
+        self.summary_message_id = summary_message_id
+        # Messages still waiting on write-behind have no id and are always newer
+        while self.messages and self.messages[0]["id"] is not None \
+                and self.messages[0]["id"] <= summary_message_id:
+            self.messages.popleft()
+
+
+class ChatSessionCache:
+    """
+    Per-worker cache of active chat sessions for the context builder.
+
+    Each session holds a bounded ring buffer of its newest messages plus its
+    rolling summary, kept in an LRU that evicts by session count and idle
+    time. save_message/commit_turn append to it and the context builder
+    folds it, each once their transaction has committed (*_on_commit); the
+    context builder reads from it, falling back to the database on a miss.
+    Write-behind messages are cached without ids until the writer reports
+    them (backfill). With several workers, appends and folds are announced
+    on a Redis channel and the other workers drop their copy of that
+    session; backfills are announced so every worker can apply them.
+    """
+
+    CHANNEL = "chat:session-invalidate"
+
+    def __init__(self, max_sessions: int, max_messages: int, idle_seconds: float, redis_url: Optional[str] = None):
+        self.max_messages = max_messages
+        self.sessions = TTLCache(maxsize=max_sessions, ttl=idle_seconds, sliding=True)
+        self.redis_url = redis_url
+        self.worker_id = uuid.uuid4().hex
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self.invalidations = 0
+        self._pending_key = f"chat_session_cache:{self.worker_id}"
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+
+    def get(self, session_id: int) -> Optional[SessionBuffer]:
+        return self.sessions.get(session_id)
+
+    def fill(self, session_id: int, summary: Optional[str], summary_message_id: int, messages: List[Dict]) -> SessionBuffer:
+        buffer = SessionBuffer(summary, summary_message_id, messages, self.max_messages)
+        self.sessions.set(session_id, buffer)
+        return buffer
+
+    def append(self, session_id: int, messages: List[Dict]):
+        """Add newly written messages; sessions not in the cache are left to load from the DB"""
+        buffer = self.sessions.peek(session_id)
+        if buffer is not None:
+            buffer.messages.extend(cache_entry(m) for m in messages)
+        self._publish({"session_id": session_id})
+
+    def append_on_commit(self, db, session_id: int, messages: List[Dict]):
+        """
+        append() once `db`'s transaction commits, and not at all if it rolls
+        back, so neither this worker's buffer nor a refill triggered by the
+        invalidation can see messages that are not in the database.
+        """
+        self._on_commit(db, functools.partial(self.append, session_id, messages))
+
+    def fold_on_commit(self, db, session_id: int, summary: str, summary_message_id: int):
+        """Fold the cached buffer once `db` has committed the session's new summary"""
+        self._on_commit(db, functools.partial(self.fold, session_id, summary, summary_message_id))
+
+    def fold(self, session_id: int, summary: str, summary_message_id: int):
+        buffer = self.sessions.peek(session_id)
+        if buffer is not None:
+            buffer.fold(summary, summary_message_id)
+        self._publish({"session_id": session_id})
+
+    def backfill(self, session_id: int, ids: Dict[str, int], publish: bool = True):
+        """Record the ids the write-behind writer got, keyed by created_at isoformat"""
+        buffer = self.sessions.peek(session_id)
+        if buffer is not None:
+            buffer.backfill(ids)
+        if publish:
+            self._publish({"session_id": session_id, "ids": ids})
+
+    def _on_commit(self, db, action):
+        db.sync_session.info.setdefault(self._pending_key, []).append(action)
+
+    def _after_commit(self, session: Session):
+        for action in session.info.pop(self._pending_key, ()):
+            action()
+
+    def _after_rollback(self, session: Session):
+        session.info.pop(self._pending_key, None)
+
+    def invalidate(self, session_id: int):
+        self.sessions.delete(session_id)
+
+    def _publish(self, event: Dict):
+        if self._redis is None:
+            return
+        payload = json.dumps({**event, "worker": self.worker_id})
+
+        async def publish():
+            try:
+                await self._redis.publish(self.CHANNEL, payload)
+            except Exception:
+                pass
+
+        # Fire and forget; the chat turn does not wait on Redis
+        asyncio.ensure_future(publish())
+
+    async def start(self):
+        if not self.redis_url:
+            return
+        self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        self._listener = asyncio.ensure_future(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self.CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("worker") == self.worker_id:
+                        continue
+                    if "ids" in data:
+                        self.backfill(data["session_id"], data["ids"], publish=False)
+                    else:
+                        self.invalidate(data["session_id"])
+                        self.invalidations += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Redis went away: drop everything we can no longer trust, then resubscribe
+                self.sessions.clear()
+                await asyncio.sleep(1.0)
+
+    def stats(self) -> Dict:
+        return {
+            **self.sessions.stats(),
+            "max_messages": self.max_messages,
+            "pubsub": self._redis is not None,
+            "invalidations": self.invalidations
+        }
+
+
+chat_session_cache = ChatSessionCache(
+    max_sessions=settings.CHAT_SESSION_CACHE_MAX_SESSIONS,
+    max_messages=settings.CHAT_SESSION_CACHE_MESSAGES,
+    idle_seconds=settings.CHAT_SESSION_CACHE_IDLE_SECONDS,
+    redis_url=settings.REDIS_URL if settings.CHAT_SESSION_CACHE_PUBSUB else None
+) if settings.CHAT_SESSION_CACHE_ENABLED else None
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, insert
+from sqlalchemy.exc import DataError, IntegrityError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.models import ChatMessage
+from app.services.chat_session_cache import chat_session_cache
+
+
+async def insert_messages(db, rows: List[Dict]) -> List[int]:
+    """Write chat message rows in one multi-row INSERT, returning ids in row order"""
+    result = await db.execute(
+        insert(ChatMessage).returning(ChatMessage.id, sort_by_parameter_order=True),
+        rows
+    )
+    return list(result.scalars())
+
+
+FOREIGN_KEY_VIOLATION = "23503"
+
+
+def is_permanent(exc: Exception) -> bool:
+    """Errors retrying cannot fix: the batch itself is bad"""
+    if isinstance(exc, IntegrityError) and getattr(exc.orig, "sqlstate", None) == FOREIGN_KEY_VIOLATION:
+        # Its chat session may just not be visible yet; max_attempts bounds the wait
+        return False
+    return isinstance(exc, (IntegrityError, DataError, ProgrammingError, ValueError, KeyError))
+
+
+class ChatWriteBehind:
+    """
+    Write-behind persistence for chat turns.
+
+    submit() durably stages a turn's rows on disk (write, fsync, off the
+    event loop) and returns. When the request's own transaction commits,
+    the staged file is renamed into the spool, so the writer never sees
+    rows whose chat session is not committed yet; a rollback discards it.
+    A background task inserts spooled batches in order and deletes each
+    file only after its transaction commits.
+    Failed batches are retried with exponential backoff, and batches left
+    over from a crash are picked up again on start. A batch the database
+    rejects (constraint or data errors, an unreadable file) or that still
+    fails after `max_attempts` is moved to the dead/ subdirectory so it
+    cannot hold up later turns; move it back into the spool directory to
+    replay it. Files are claimed by renaming them to *.inflight, so several
+    workers may share one spool directory; claims older than
+    CHAT_WRITE_BEHIND_STALE_SECONDS are treated as abandoned, and so are
+    staged files a crash left between commit and rename.
+    """
+
+    def __init__(self, spool_dir: str, session_factory=async_session, max_retry_delay: float = 60.0,
+                 max_attempts: int = 10):
+        self.spool_dir = spool_dir
+        self.dead_letter_dir = os.path.join(spool_dir, "dead")
+        self.session_factory = session_factory
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.submitted = 0
+        self.written = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self.last_error: Optional[str] = None
+        self._staged_key = f"chat_write_behind:{uuid.uuid4().hex}"
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_transaction_end", self._after_transaction_end)
+
+    async def start(self):
+        os.makedirs(self.dead_letter_dir, exist_ok=True)
+        self._recover_stale()
+        self._stopping = False
+        self._task = asyncio.ensure_future(self._run())
+        self._wakeup.set()
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain what can be written within `timeout`; the rest stays spooled"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._task = None
+
+    async def submit(self, db, rows: List[Dict]):
+        """Stage rows to be written once `db`'s transaction commits"""
+        payload = json.dumps(
+            [{**row, "created_at": row["created_at"].isoformat()} for row in rows],
+            ensure_ascii=False
+        )
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json"
+        # fsync takes milliseconds; keep it off the event loop
+        await asyncio.to_thread(self._stage, name, payload)
+        if not db.in_transaction():
+            # So that commit, rollback or close all end it and fire the hooks
+            await db.begin()
+        db.sync_session.info.setdefault(self._staged_key, []).append(name)
+        self.submitted += 1
+
+    def _stage(self, name: str, payload: str):
+        with open(os.path.join(self.spool_dir, name + ".staged"), "w", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _after_commit(self, session: Session):
+        names = session.info.pop(self._staged_key, ())
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            os.rename(path + ".staged", path)
+        if names:
+            self._wakeup.set()
+
+    def _after_transaction_end(self, session: Session, transaction):
+        # Still staged here means the transaction ended without committing
+        if transaction.parent is not None:
+            return  # a savepoint or subtransaction; the outer one may still commit
+        for name in session.info.pop(self._staged_key, ()):
+            try:
+                os.remove(os.path.join(self.spool_dir, name + ".staged"))
+            except FileNotFoundError:
+                pass
+
+    def spooled_rows(self, session_id: int) -> List[Dict]:
+        """Committed rows of a chat session that are still waiting in the spool, oldest first"""
+        rows = []
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith((".json", ".json.inflight")):
+                continue
+            try:
+                with open(os.path.join(self.spool_dir, name), encoding="utf-8") as f:
+                    batch = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue  # written and removed, or claimed, meanwhile
+            rows += [row for row in batch if row.get("session_id") == session_id]
+        return rows
+
+    def _recover_stale(self):
+        cutoff = time.time() - settings.CHAT_WRITE_BEHIND_STALE_SECONDS
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            for suffix in (".inflight", ".staged"):
+                # A staged file this old most likely committed; if not, its
+                # session never appears and it ends up in dead/
+                if name.endswith(suffix) and os.path.getmtime(path) < cutoff:
+                    os.rename(path, path[:-len(suffix)])
+
+    def _claim_next(self) -> Optional[str]:
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                os.rename(path, path + ".inflight")
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            return path + ".inflight"
+        return None
+
+    async def _write(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+        for row in rows:
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+        async with self.session_factory() as db:
+            ids = await insert_messages(db, rows)
+            await db.commit()
+        if chat_session_cache is not None:
+            # Cached copies of these rows have no id yet, which holds up summary folds
+            by_session: Dict[int, Dict[str, int]] = {}
+            for row, message_id in zip(rows, ids):
+                by_session.setdefault(row["session_id"], {})[row["created_at"].isoformat()] = message_id
+            for session_id, session_ids in by_session.items():
+                chat_session_cache.backfill(session_id, session_ids)
+
+    async def _run(self):
+        delay = 0.5
+        while True:
+            path = self._claim_next()
+            if path is None:
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            attempts = 0
+            while True:
+                try:
+                    await self._write(path)
+                except Exception as e:
+                    attempts += 1
+                    self.retries += 1
+                    self.last_error = str(e)
+                    if is_permanent(e) or attempts >= self.max_attempts:
+                        self._dead_letter(path)
+                        break
+                    if self._stopping:
+                        # Leave it spooled for the next start
+                        os.rename(path, path[:-len(".inflight")])
+                        return
+                    os.utime(path)  # keep the claim fresh while retrying
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+                else:
+                    os.remove(path)
+                    self.written += 1
+                    delay = 0.5
+                    break
+
+    def _dead_letter(self, path: str):
+        name = os.path.basename(path)[:-len(".inflight")]
+        os.rename(path, os.path.join(self.dead_letter_dir, name))
+        self.dead_lettered += 1
+
+    def stats(self) -> Dict:
+        spooled = 0
+        if os.path.isdir(self.spool_dir):
+            spooled = sum(1 for name in os.listdir(self.spool_dir) if name.endswith(".json"))
+        return {
+            "enabled": True,
+            "submitted": self.submitted,
+            "written": self.written,
+            "spooled": spooled,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+            "last_error": self.last_error
+        }
+
+
+chat_write_behind = ChatWriteBehind(
+    settings.CHAT_WRITE_BEHIND_SPOOL_DIR, max_attempts=settings.CHAT_WRITE_BEHIND_MAX_ATTEMPTS
+) if settings.CHAT_WRITE_BEHIND else None
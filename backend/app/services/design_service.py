@@ -1,13 +1,18 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List, Optional
+import asyncio
 
-from app.models.models import Design, ProjectStatus
+from app.core.config import settings
+from app.core.rate_limit import Priority
+from app.models.models import Design, Project, ProjectStatus
+from app.services.ai_service import kimi_ai
 
 
 class DesignService:
     def __init__(self, db: AsyncSession):
         self.db = db
+        self.ai = kimi_ai
     
     async def get_project_designs(self, project_id: int) -> List[Design]:
         """Get all designs for a project"""
@@ -16,6 +21,138 @@ class DesignService:
         )
         return result.scalars().all()
     
+    async def generate_descriptions(
+        self,
+        project_id: int,
+        rooms: Optional[List[dict]] = None,
+        style: Optional[str] = None,
+        bypass_cache: bool = False
+    ) -> dict:
+        """
+        Generate design descriptions for every room of a project.
+        
+        Rooms default to the project's Design rows; an explicit room list
+        (e.g. a floorplan's rooms) is matched to existing designs by room
+        type and missing designs are created. Small projects use one
+        structured multi-room prompt; larger ones fan out per room with
+        bounded concurrency so generation runs in parallel. Rooms the
+        single prompt could not cover are also filled in by fan-out; rooms
+        that still fail are listed under "failed" and left unchanged.
+        """
+        result = await self.db.execute(
+            select(Project).where(Project.id == project_id)
+        )
+        project = result.scalar_one_or_none()
+        if not project:
+            return {"error": "Project not found"}
+        
+        style = style or self._project_style(project)
+        designs = await self.get_project_designs(project_id)
+        if rooms:
+            designs = await self._designs_for_rooms(project_id, designs, rooms, style)
+        
+        requirements = {
+            "budget": project.budget_max or "未知",
+            "special_needs": self._special_needs(project)
+        }
+        
+        texts: List[Optional[str]] = [None] * len(designs)
+        strategy = "fan_out"
+        if 0 < len(designs) <= settings.DESIGN_BATCH_SINGLE_PROMPT_MAX_ROOMS:
+            strategy = "single_prompt"
+            texts = await self.ai.generate_design_descriptions(
+                [{"room_type": d.room_type, "area": d.area or "未知"} for d in designs],
+                style,
+                requirements,
+                bypass_cache=bypass_cache
+            )
+        
+        missing = [i for i, text in enumerate(texts) if text is None]
+        if missing:
+            semaphore = asyncio.Semaphore(settings.DESIGN_BATCH_CONCURRENCY)
+            
+            async def describe(i: int):
+                design = designs[i]
+                async with semaphore:
+                    texts[i] = await self.ai.generate_design_description(
+                        design.room_type,
+                        design.style or style,
+                        {**requirements, "area": design.area or "未知"},
+                        bypass_cache=bypass_cache,
+                        priority=Priority.BATCH
+                    )
+            
+            await asyncio.gather(*(describe(i) for i in missing))
+        
+        # Failed rooms keep their previous description so a retry can fill them in
+        for design, text in zip(designs, texts):
+            if text is not None:
+                design.description = text
+        await self.db.flush()
+        
+        return {
+            "project_id": project_id,
+            "strategy": strategy,
+            "descriptions": [
+                {"design_id": d.id, "room_type": d.room_type, "description": d.description}
+                for d in designs
+            ],
+            "failed": [
+                {"design_id": d.id, "room_type": d.room_type}
+                for d, text in zip(designs, texts) if text is None
+            ]
+        }
+    
+    async def _designs_for_rooms(
+        self,
+        project_id: int,
+        designs: List[Design],
+        rooms: List[dict],
+        style: str
+    ) -> List[Design]:
+        """Match rooms to existing designs by room type, creating missing ones"""
+        available = list(designs)
+        matched = []
+        for room in rooms:
+            room_type = room.get("room_type") or room.get("name")
+            design = next((d for d in available if d.room_type == room_type), None)
+            if design is not None:
+                available.remove(design)
+            else:
+                design = Design(
+                    project_id=project_id,
+                    room_type=room_type,
+                    style=room.get("style") or style,
+                    status=ProjectStatus.PENDING
+                )
+                self.db.add(design)
+            if room.get("area"):
+                design.area = room["area"]
+            matched.append(design)
+        await self.db.flush()
+        return matched
+    
+    @staticmethod
+    def _project_style(project: Project) -> str:
+        prefs = project.style_preferences or {}
+        styles = prefs.get("styles") or []
+        return prefs.get("primary") or (styles[0] if styles else "现代简约")
+    
+    @staticmethod
+    def _special_needs(project: Project) -> str:
+        needs = []
+        family = project.family_info or {}
+        prefs = project.preferences or {}
+        if family.get("children"):
+            needs.append(f"有{family['children']}个孩子")
+        if family.get("pets"):
+            needs.append(f"养宠物：{', '.join(family['pets'])}")
+        if prefs.get("likes"):
+            needs.append(f"喜欢：{', '.join(prefs['likes'])}")
+        if prefs.get("dislikes"):
+            needs.append(f"不喜欢：{', '.join(prefs['dislikes'])}")
+        return "；".join(needs) or "无"
+    
     async def adjust_style(self, design_id: int, adjustment: dict) -> dict:
         """Adjust design style parameters"""
         # TODO: Implement style adjustment logic
@@ -0,0 +1,291 @@
+import math
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.ngrams import char_ngrams, normalize
+from app.models.models import ChatMessage
+
+
+# Curated answers; each entry is matched through any of its question phrasings
+CURATED_FAQ: List[Dict] = [
+    {
+        "id": "budget-tiers",
+        "questions": [
+            "装修预算一般多少钱一平",
+            "装修每平米大概多少钱",
+            "装修预算怎么分档次",
+            "装修一平方需要多少预算",
+            "全包装修多少钱一平米"
+        ],
+        "answer": "装修预算通常分为以下几个档次：\n\n- **经济型**：1000-1500元/㎡\n- **舒适型**：1500-2500元/㎡\n- **豪华型**：2500-4000元/㎡",
+        "message_type": "suggestion"
+    },
+    {
+        "id": "style-overview",
+        "questions": [
+            "有哪些装修风格推荐",
+            "装修风格有哪些",
+            "推荐几种装修风格",
+            "常见的装修风格介绍一下"
+        ],
+        "answer": "根据您的户型和家庭情况，我推荐以下几种风格供您参考：\n\n1. **现代简约** - 简洁线条，功能至上\n2. **北欧风** - 自然材质，明亮温馨\n3. **新中式** - 传统与现代结合",
+        "message_type": "suggestion",
+        "metadata": {
+            "suggestions": [
+                {"id": "modern", "name": "现代简约", "description": "简洁线条，功能至上"},
+                {"id": "nordic", "name": "北欧风", "description": "自然材质，明亮温馨"},
+                {"id": "chinese", "name": "新中式", "description": "传统与现代结合"}
+            ]
+        }
+    },
+    {
+        "id": "budget-split",
+        "questions": [
+            "硬装和软装预算怎么分配",
+            "装修预算分配比例是多少",
+            "软装一般占总预算多少"
+        ],
+        "answer": "一般建议：\n\n- **硬装**（水电、泥瓦、木作、油漆）约占 60%\n- **软装**（家具、灯具、窗帘、饰品）约占 30%\n- **预留**约 10% 应对增项和涨价",
+        "message_type": "answer"
+    },
+    {
+        "id": "renovation-order",
+        "questions": [
+            "装修的流程和顺序是什么",
+            "装修先做什么后做什么",
+            "装修步骤有哪些"
+        ],
+        "answer": "常规装修顺序：\n\n1. 设计与预算确认\n2. 拆改与水电改造\n3. 防水与泥瓦（贴砖）\n4. 木作与吊顶\n5. 墙面油漆\n6. 安装（橱柜、门、地板、洁具、灯具）\n7. 保洁、通风，软装进场",
+        "message_type": "answer"
+    },
+    {
+        "id": "formaldehyde",
+        "questions": [
+            "装修完多久可以入住",
+            "新房甲醛多久能散完",
+            "装修后怎么除甲醛"
+        ],
+        "answer": "建议装修完成后通风 3-6 个月再入住，并在入住前做一次甲醛检测。选材时优先 ENF/E0 级板材和环保乳胶漆，比事后治理更有效。",
+        "message_type": "answer"
+    }
+]
+
+
+class FAQIndex:
+    """
+    Local answer index for repeat questions.
+
+    Questions are embedded as TF-IDF vectors over character 1- to 3-grams
+    (no word segmentation needed for Chinese), L2-normalized and
+    stored column-wise: for every n-gram, the documents containing it and
+    their weights. A query's cosine score against all documents is then one
+    scatter-add over the postings of its own n-grams. The index is rebuilt
+    lazily after entries are added, which is cheap at FAQ scale.
+
+    match() also requires the matched question to contain at least
+    `min_coverage` of the query's characters, so a question that wraps a
+    stock phrase in personal details ("我家有猫，装修风格推荐哪种") goes
+    to the model instead of getting the generic answer.
+    """
+
+    def __init__(self, threshold: float, min_query_chars: int, min_coverage: float = 0.0):
+        self.threshold = threshold
+        self.min_query_chars = min_query_chars
+        self.min_coverage = min_coverage
+        self.entries: Dict[str, Dict] = {}
+        self._docs: List[Tuple[str, str]] = []  # (entry id, normalized question)
+        self._dirty = True
+        self._vocab: Dict[str, int] = {}
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._postings_ptr = np.zeros(1, dtype=np.int64)
+        self._postings_doc = np.zeros(0, dtype=np.int32)
+        self._postings_weight = np.zeros(0, dtype=np.float32)
+        self.lookups = 0
+        self.hits = 0
+        self.near_misses = 0  # best score within 0.1 below the threshold
+        self.low_coverage = 0  # above the threshold but too much of the query unmatched
+        self.lookup_seconds = 0.0
+
+    def add(self, entry_id: str, questions: List[str], answer: str, message_type: str = "answer",
+            metadata: Optional[Dict] = None, source: str = "curated"):
+        self.entries[entry_id] = {
+            "id": entry_id,
+            "answer": answer,
+            "message_type": message_type,
+            "metadata": metadata or {},
+            "source": source
+        }
+        # Re-adding an entry replaces its phrasings
+        self._docs = [doc for doc in self._docs if doc[0] != entry_id]
+        for question in questions:
+            normalized = normalize(question)
+            if normalized:
+                self._docs.append((entry_id, normalized))
+        self._dirty = True
+
+    def _rebuild(self):
+        doc_grams = [char_ngrams(text) for _, text in self._docs]
+        df = Counter(gram for grams in doc_grams for gram in grams)
+        self._vocab = {gram: i for i, gram in enumerate(df)}
+        n_docs = len(self._docs)
+        self._idf = np.array(
+            [math.log((1 + n_docs) / (1 + df[gram])) + 1.0 for gram in self._vocab],
+            dtype=np.float32
+        )
+
+        # Column-major (per n-gram) postings of L2-normalized sublinear TF-IDF
+        columns: List[List[Tuple[int, float]]] = [[] for _ in self._vocab]
+        for doc, grams in enumerate(doc_grams):
+            ids = [self._vocab[gram] for gram in grams]
+            weights = np.array(
+                [1.0 + math.log(count) for count in grams.values()], dtype=np.float32
+            ) * self._idf[ids]
+            weights /= np.linalg.norm(weights) or 1.0
+            for term, weight in zip(ids, weights):
+                columns[term].append((doc, float(weight)))
+
+        lengths = np.array([len(column) for column in columns], dtype=np.int64)
+        self._postings_ptr = np.concatenate(([0], np.cumsum(lengths)))
+        flat = [posting for column in columns for posting in column]
+        self._postings_doc = np.array([doc for doc, _ in flat], dtype=np.int32)
+        self._postings_weight = np.array([weight for _, weight in flat], dtype=np.float32)
+        self._dirty = False
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[Dict, float]]:
+        """Best-scoring entries for a query as (entry, cosine) pairs"""
+        return [(self.entries[self._docs[doc][0]], score) for doc, score in self._rank(query, k)]
+
+    def _rank(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """(doc, cosine) of the best-scoring phrasing of each of the top k entries"""
+        if self._dirty:
+            self._rebuild()
+        grams = char_ngrams(normalize(query))
+        if not grams or not self._docs:
+            return []
+
+        # N-grams never seen in the index still count towards the query
+        # norm (at the highest idf), so off-topic text dilutes the score
+        unseen_idf = math.log(1 + len(self._docs)) + 1.0
+        terms, weights = [], []
+        for gram, count in grams.items():
+            term = self._vocab.get(gram)
+            weights.append((1.0 + math.log(count)) * (unseen_idf if term is None else self._idf[term]))
+            terms.append(term)
+        weights = np.array(weights, dtype=np.float32)
+        weights /= np.linalg.norm(weights)
+
+        known = [(term, weight) for term, weight in zip(terms, weights) if term is not None]
+        if not known:
+            return []
+        docs = np.concatenate([
+            self._postings_doc[self._postings_ptr[term]:self._postings_ptr[term + 1]] for term, _ in known
+        ])
+        contributions = np.concatenate([
+            self._postings_weight[self._postings_ptr[term]:self._postings_ptr[term + 1]] * weight
+            for term, weight in known
+        ])
+        scores = np.zeros(len(self._docs), dtype=np.float32)
+        np.add.at(scores, docs, contributions)
+
+        # Several phrasings map to one entry; keep each entry's best
+        best: Dict[str, Tuple[int, float]] = {}
+        for doc in np.argsort(-scores)[:k * 4]:
+            if scores[doc] <= 0:
+                break
+            best.setdefault(self._docs[doc][0], (int(doc), float(scores[doc])))
+        return sorted(best.values(), key=lambda item: -item[1])[:k]
+
+    def coverage(self, query: str, doc: int) -> float:
+        """Share of the query's characters that also occur in an indexed question"""
+        text = normalize(query)
+        chars = set(self._docs[doc][1])
+        return sum(ch in chars for ch in text) / len(text) if text else 0.0
+
+    def match(self, query: str) -> Optional[Dict]:
+        """High-confidence answer for a standalone question, else None"""
+        if len(normalize(query)) < self.min_query_chars:
+            return None
+        started = time.perf_counter()
+        results = self._rank(query, k=1)
+        self.lookup_seconds += time.perf_counter() - started
+        self.lookups += 1
+        if not results:
+            return None
+
+        doc, score = results[0]
+        if score < self.threshold:
+            if score >= self.threshold - 0.1:
+                self.near_misses += 1
+            return None
+        if self.coverage(query, doc) < self.min_coverage:
+            self.low_coverage += 1
+            return None
+        entry = self.entries[self._docs[doc][0]]
+        self.hits += 1
+        return {
+            "content": entry["answer"],
+            "message_type": entry["message_type"],
+            "metadata": {
+                **entry["metadata"],
+                "source": "faq",
+                "faq_id": entry["id"],
+                "score": round(score, 4)
+            }
+        }
+
+    async def load_approved(self, db) -> int:
+        """Index assistant answers that were approved through the chat API"""
+        result = await db.execute(
+            select(ChatMessage.id, ChatMessage.content, ChatMessage.message_type, ChatMessage.message_metadata)
+            .where(
+                ChatMessage.role == "assistant",
+                ChatMessage.message_metadata["approved"].as_boolean().is_(True)
+            )
+        )
+        count = 0
+        for message_id, content, message_type, metadata in result.all():
+            question = metadata.get("approved_question")
+            if question:
+                self.add_approved(message_id, question, content, message_type)
+                count += 1
+        return count
+
+    def add_approved(self, message_id: int, question: str, answer: str, message_type: str = "answer"):
+        self.add(f"approved-{message_id}", [question], answer, message_type, source="approved")
+
+    def stats(self) -> Dict:
+        sources = Counter(entry["source"] for entry in self.entries.values())
+        return {
+            "entries": len(self.entries),
+            "curated": sources["curated"],
+            "approved": sources["approved"],
+            "questions": len(self._docs),
+            "vocabulary": len(self._vocab),
+            "threshold": self.threshold,
+            "min_query_chars": self.min_query_chars,
+            "min_coverage": self.min_coverage,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "near_misses": self.near_misses,
+            "low_coverage": self.low_coverage,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "avg_lookup_ms": round(self.lookup_seconds / self.lookups * 1000, 3) if self.lookups else 0.0
+        }
+
+
+def build_faq_index() -> FAQIndex:
+    index = FAQIndex(settings.FAQ_MATCH_THRESHOLD, settings.FAQ_MIN_QUERY_CHARS, settings.FAQ_MIN_COVERAGE)
+    for entry in CURATED_FAQ:
+        index.add(
+            entry["id"], entry["questions"], entry["answer"],
+            entry.get("message_type", "answer"), entry.get("metadata")
+        )
+    return index
+
+
+faq_index = build_faq_index() if settings.FAQ_ENABLED else None
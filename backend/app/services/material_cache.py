@@ -0,0 +1,116 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from app.core.cache import TieredCache
+from app.core.config import settings
+
+
+def normalize_params(params: Dict[str, Any], casefold: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Canonical form of endpoint parameters for cache keys: unset values are
+    dropped and lists sorted. Only `casefold` keys are lowercased; numbers
+    and other strings stay exact, as the queries compare them exactly.
+    """
+    normalized = {}
+    for name, value in params.items():
+        if value is None or value == "" or value == []:
+            continue
+        if name in casefold and isinstance(value, str):
+            value = value.lower()
+        elif isinstance(value, (list, tuple)):
+            value = sorted(value)
+        normalized[name] = value
+    return normalized
+
+
+class MaterialResultCache:
+    """
+    Cache of material endpoint results tagged with a catalog version.
+
+    The version lives in Redis (shared by workers and the ingest CLI) and is
+    part of every key, so bump_version() after a catalog write invalidates
+    all cached results at once; old entries just age out. Results are only
+    served when the current version could be read: if Redis is configured
+    but unreachable, lookups bypass the cache rather than risk stale prices.
+    """
+
+    VERSION_KEY = "materials:catalog_version"
+
+    def __init__(self, maxsize: int, ttl: float, redis_url: Optional[str] = None):
+        self.cache = TieredCache(namespace="materials", maxsize=maxsize, ttl=ttl, redis_url=redis_url)
+        self._local_version = 0
+        self.bypassed = 0
+        self.endpoints: Dict[str, Dict[str, int]] = {}
+
+    async def version(self) -> Optional[int]:
+        redis = self.cache.redis
+        if redis is None:
+            return self._local_version
+        try:
+            return int(await redis.get(self.VERSION_KEY) or 0)
+        except Exception:
+            self.cache.redis_errors += 1
+            return None
+
+    async def bump_version(self):
+        """Call after any catalog write is committed"""
+        self._local_version += 1
+        redis = self.cache.redis
+        if redis is None:
+            return
+        try:
+            await redis.incr(self.VERSION_KEY)
+        except Exception:
+            self.cache.redis_errors += 1
+
+    async def get_or_compute(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+        casefold: Iterable[str] = ()
+    ) -> Any:
+        """Cached result of `compute()`, which must return JSON-serializable data"""
+        counters = self.endpoints.setdefault(endpoint, {"hits": 0, "misses": 0})
+        version = await self.version()
+        if version is None:
+            self.bypassed += 1
+            return await compute()
+
+        key = self.cache.key({
+            "endpoint": endpoint,
+            "version": version,
+            "params": normalize_params(params, casefold)
+        })
+        value = await self.cache.get(key)
+        if value is not None:
+            counters["hits"] += 1
+            return value
+        counters["misses"] += 1
+        value = await compute()
+        await self.cache.set(key, value)
+        return value
+
+    async def close(self):
+        await self.cache.close()
+
+    def stats(self) -> Dict:
+        endpoints = {}
+        for endpoint, counters in self.endpoints.items():
+            lookups = counters["hits"] + counters["misses"]
+            endpoints[endpoint] = {
+                **counters,
+                "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0
+            }
+        return {
+            "local_version": self._local_version,
+            "bypassed": self.bypassed,
+            "endpoints": endpoints,
+            "tiers": self.cache.stats()
+        }
+
+
+material_result_cache = MaterialResultCache(
+    maxsize=settings.MATERIAL_CACHE_MAXSIZE,
+    ttl=settings.MATERIAL_CACHE_TTL,
+    redis_url=settings.REDIS_URL if settings.MATERIAL_CACHE_USE_REDIS else None
+) if settings.MATERIAL_CACHE_ENABLED else None
@@ -0,0 +1,233 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy import select
+
+from app.core.color_features import ColorFeatureStore, extract_color_features
+from app.core.config import settings
+from app.models.models import Material
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class ImageFetcher:
+    """
+    Bounded-concurrency image downloader over one pooled HTTP client.
+
+    At most `concurrency` downloads run at once and at most `per_host`
+    against one host. Bodies are streamed and cut off at max_bytes.
+    Connection errors, 429 and 5xx are retried with backoff, during which
+    no slot is held; other failures raise.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 32,
+        per_host: int = 8,
+        timeout: float = 20.0,
+        max_bytes: int = 10 * 1024 * 1024,
+        retries: int = 2
+    ):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self._slots = asyncio.Semaphore(concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.fetched = 0
+        self.bytes = 0
+
+    async def __aenter__(self) -> "ImageFetcher":
+        self._client = httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0))
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.aclose()
+        self._client = None
+
+    async def fetch(self, url: str) -> bytes:
+        host = self._hosts.setdefault(urlsplit(url).netloc, asyncio.Semaphore(self.per_host))
+        for attempt in range(self.retries + 1):
+            # Host first: a busy host must not hold global slots other hosts could use
+            async with host, self._slots:
+                try:
+                    return await self._get(url)
+                except Exception as e:
+                    if attempt == self.retries or not is_transient(e):
+                        raise
+            # Back off without holding either slot
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def _get(self, url: str) -> bytes:
+        async with self._client.stream("GET", url) as response:
+            response.raise_for_status()
+            if int(response.headers.get("content-length") or 0) > self.max_bytes:
+                raise ImageTooLarge(url)
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > self.max_bytes:
+                    raise ImageTooLarge(url)
+        self.fetched += 1
+        self.bytes += len(body)
+        return bytes(body)
+
+
+def is_transient(exc: Exception) -> bool:
+    """Worth retrying on a later run: network trouble, throttling, server errors"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError) and not isinstance(exc, httpx.UnsupportedProtocol)
+
+
+class MaterialColorJob:
+    """
+    Offline color features for material images.
+
+    Images are downloaded through an ImageFetcher and decoded/clustered
+    (extract_color_features) in a process pool, so downloads and CPU work
+    overlap across all cores. Results go to the ColorFeatureStore at
+    MATERIAL_COLOR_FEATURES_PATH, which is checkpointed every
+    MATERIAL_COLOR_CHECKPOINT_SECONDS and on exit. A rerun skips materials
+    whose current image_url is already in the store, and ones that failed
+    permanently (4xx, undecodable) unless retry_failed; transient failures
+    are simply tried again next run. Materials deleted from the catalog
+    are dropped from the store.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        path: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        workers: Optional[int] = None
+    ):
+        self.session_factory = session_factory
+        self.path = path or settings.MATERIAL_COLOR_FEATURES_PATH
+        self.concurrency = concurrency or settings.MATERIAL_COLOR_FETCH_CONCURRENCY
+        self.workers = workers or settings.MATERIAL_COLOR_WORKERS or os.cpu_count() or 1
+
+    def _open_store(self) -> ColorFeatureStore:
+        if os.path.exists(self.path):
+            store = ColorFeatureStore.load(self.path)
+            if store.palette_size == settings.MATERIAL_COLOR_PALETTE_SIZE:
+                return store
+        return ColorFeatureStore(settings.MATERIAL_COLOR_PALETTE_SIZE)
+
+    async def _targets(self, store: ColorFeatureStore, retry_failed: bool) -> Tuple[List[Tuple[int, str]], List[int]]:
+        """(id, image_url) still to process, and every material id with an image"""
+        todo, seen = [], []
+        async with self.session_factory() as db:
+            result = await db.stream(
+                select(Material.id, Material.image_url)
+                .where(Material.image_url.isnot(None), Material.image_url != "")
+                .order_by(Material.id)
+                .execution_options(yield_per=20000)
+            )
+            async for rows in result.partitions():
+                for material_id, image_url in rows:
+                    seen.append(material_id)
+                    if not store.done(material_id, image_url, retry_failed):
+                        todo.append((material_id, image_url))
+        return todo, seen
+
+    async def run(
+        self,
+        retry_failed: bool = False,
+        limit: Optional[int] = None,
+        progress: Optional[Callable[[Dict], None]] = None
+    ) -> Dict:
+        started = time.perf_counter()
+        store = await asyncio.to_thread(self._open_store)
+        todo, seen = await self._targets(store, retry_failed)
+        store.retain(seen)
+        stats = {"images": len(seen), "skipped": len(seen) - len(todo), "todo": len(todo[:limit]),
+                 "processed": 0, "failed": 0, "transient": 0, "images_per_second": 0.0}
+        todo = todo[:limit]
+
+        loop = asyncio.get_running_loop()
+        extracted: List[Tuple] = []
+        failed: List[Tuple[int, str]] = []
+        # A cancelled checkpoint's thread may still be writing when the final save starts
+        writing = threading.Lock()
+        last_checkpoint = time.monotonic()
+
+        async def checkpoint():
+            # Take the buffers on the loop; workers keep filling new ones meanwhile
+            rows, bad = extracted[:], failed[:]
+            extracted.clear()
+            failed.clear()
+
+            def write():
+                with writing:
+                    store.add(rows)
+                    for material_id, image_url in bad:
+                        store.mark_failed(material_id, image_url)
+                    store.save(self.path)
+            await asyncio.to_thread(write)
+
+        pending = iter(todo)
+
+        async def worker(fetcher: ImageFetcher, pool: ProcessPoolExecutor):
+            nonlocal last_checkpoint
+            # Workers share one iterator, so each image is taken exactly once
+            for material_id, image_url in pending:
+                try:
+                    data = await fetcher.fetch(image_url)
+                    features = await loop.run_in_executor(
+                        pool, extract_color_features, data, settings.MATERIAL_COLOR_PALETTE_SIZE
+                    )
+                    extracted.append((material_id, image_url, *features))
+                    stats["processed"] += 1
+                except BrokenExecutor:
+                    raise
+                except Exception as e:
+                    if is_transient(e):
+                        stats["transient"] += 1
+                    else:
+                        failed.append((material_id, image_url))
+                        stats["failed"] += 1
+
+                done = stats["processed"] + stats["failed"] + stats["transient"]
+                if progress and done % 500 == 0:
+                    stats["images_per_second"] = round(done / (time.perf_counter() - started), 1)
+                    progress(stats)
+                if time.monotonic() - last_checkpoint >= settings.MATERIAL_COLOR_CHECKPOINT_SECONDS:
+                    last_checkpoint = time.monotonic()
+                    await checkpoint()
+
+        try:
+            with ProcessPoolExecutor(self.workers) as pool:
+                async with ImageFetcher(
+                    concurrency=self.concurrency,
+                    per_host=settings.MATERIAL_COLOR_FETCH_PER_HOST,
+                    timeout=settings.MATERIAL_COLOR_FETCH_TIMEOUT,
+                    max_bytes=settings.MATERIAL_COLOR_MAX_IMAGE_BYTES
+                ) as fetcher:
+                    # Extra workers keep the process pool busy while others wait on downloads
+                    await asyncio.gather(*(worker(fetcher, pool) for _ in range(self.concurrency + self.workers)))
+                    stats["downloaded_mb"] = round(fetcher.bytes / 1e6, 1)
+        finally:
+            # Also on interrupt: keep everything extracted so far
+            await asyncio.shield(checkpoint())
+
+        elapsed = time.perf_counter() - started
+        done = stats["processed"] + stats["failed"] + stats["transient"]
+        stats["images_per_second"] = round(done / elapsed, 1) if elapsed else 0.0
+        stats["elapsed_seconds"] = round(elapsed, 1)
+        stats["store"] = store.stats()
+        return stats
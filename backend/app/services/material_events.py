@@ -0,0 +1,90 @@
+import asyncio
+import json
+import uuid
+from typing import Dict, Optional
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.services.material_index import reload_material_indexes
+
+
+class MaterialCatalogEvents:
+    """
+    Catalog-changed notifications between processes over Redis pub/sub.
+
+    A catalog write that other processes' in-memory material indexes did
+    not see (a CLI ingest, or an API ingest on another worker) is announced
+    once it has committed. Every other listening worker then rebuilds its
+    indexes in the background and keeps serving the old ones meanwhile.
+    """
+
+    CHANNEL = "materials:catalog-changed"
+
+    def __init__(self, redis_url: str):
+        self.redis_url = redis_url
+        self.worker_id = uuid.uuid4().hex
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self._session_factory = None
+        self.published = 0
+        self.received = 0
+
+    async def publish(self):
+        """Announce a committed catalog write; works without start() for one-off scripts"""
+        redis = self._redis or aioredis.from_url(self.redis_url, decode_responses=True)
+        try:
+            await redis.publish(self.CHANNEL, json.dumps({"worker": self.worker_id}))
+            self.published += 1
+        except Exception:
+            pass
+        finally:
+            if redis is not self._redis:
+                await redis.close()
+
+    async def start(self, session_factory):
+        self._session_factory = session_factory
+        self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        self._listener = asyncio.ensure_future(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    async def _listen(self):
+        missed = False
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self.CHANNEL)
+                if missed:
+                    # Announcements may have been lost while Redis was away
+                    reload_material_indexes(self._session_factory)
+                    missed = False
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    if json.loads(message["data"]).get("worker") != self.worker_id:
+                        self.received += 1
+                        reload_material_indexes(self._session_factory)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                missed = True
+                await asyncio.sleep(1.0)
+
+    def stats(self) -> Dict:
+        return {
+            "listening": self._listener is not None,
+            "published": self.published,
+            "received": self.received
+        }
+
+
+material_catalog_events = (
+    MaterialCatalogEvents(settings.REDIS_URL) if settings.MATERIAL_CATALOG_EVENTS_ENABLED else None
+)
@@ -0,0 +1,498 @@
+import asyncio
+import copy
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app.core.color_features import ColorFeatureStore
+from app.core.config import settings
+from app.core.facet_index import FacetIndex
+from app.core.price_index import PriceIndex
+from app.core.text_index import TextIndex
+from app.core.vector_index import VectorIndex
+from app.models.models import Material
+
+
+class _BackgroundIndex:
+    """
+    Base for catalog indexes that are built from the database in the
+    background on startup. Until `ready`, callers fall back to SQL, and
+    writes that arrive meanwhile are buffered and replayed after the build.
+    reload() rebuilds a fresh copy the same way while this one keeps
+    serving, then swaps the `state` attributes over.
+    """
+
+    columns: Tuple = ()
+    state: Tuple = ("index",)
+
+    def __init__(self):
+        self.ready = False
+        self._pending: List[Tuple[str, list]] = []
+        self._loaded = asyncio.Event()
+        self._reloading: Optional["_BackgroundIndex"] = None
+        self._reload_again = False
+        self.reloads = 0
+
+    def _reset(self):
+        """Replace the `state` attributes with empty ones"""
+        raise NotImplementedError
+
+    def _docs(self, materials: Iterable) -> list:
+        raise NotImplementedError
+
+    def _add(self, docs: list, bulk: bool = False):
+        raise NotImplementedError
+
+    def _remove(self, material_ids: list):
+        raise NotImplementedError
+
+    def _finish_load(self):
+        pass
+
+    def _query(self):
+        return select(*self.columns)
+
+    async def load(self, session_factory):
+        async with session_factory() as db:
+            result = await db.stream(self._query().execution_options(yield_per=20000))
+            async for rows in result.partitions():
+                # Index building is CPU-bound; keep it off the event loop
+                await asyncio.to_thread(self._add, self._docs(rows), True)
+        await asyncio.to_thread(self._finish_load)
+        self._go_live()
+
+    def _go_live(self):
+        for op, items in self._pending:
+            if op == "upsert":
+                self._add(items)
+            else:
+                self._remove(items)
+        self._pending = []
+        self.ready = True
+        self._loaded.set()
+
+    async def reload(self, session_factory):
+        """Rebuild from the database after a catalog write this process did not see"""
+        if self._reloading is not None:
+            # The running rebuild may have read past the write; go once more
+            self._reload_again = True
+            return
+        await self._loaded.wait()
+        while True:
+            fresh = copy.copy(self)
+            fresh.ready = False
+            fresh._pending = []
+            fresh._loaded = asyncio.Event()
+            fresh._reset()
+            self._reloading = fresh
+            self._reload_again = False
+            try:
+                await fresh.load(session_factory)
+            finally:
+                self._reloading = None
+            for name in self.state:
+                setattr(self, name, getattr(fresh, name))
+            self.reloads += 1
+            if not self._reload_again:
+                return
+
+    def upsert(self, materials: Iterable):
+        docs = self._docs(materials)
+        if self._reloading is not None:
+            self._reloading._pending.append(("upsert", docs))
+        if self.ready:
+            self._add(docs)
+        else:
+            self._pending.append(("upsert", docs))
+
+    def remove(self, material_ids: Iterable[int]):
+        material_ids = list(material_ids)
+        if self._reloading is not None:
+            self._reloading._pending.append(("remove", material_ids))
+        if self.ready:
+            self._remove(material_ids)
+        else:
+            self._pending.append(("remove", material_ids))
+
+
+class MaterialVectorIndex(_BackgroundIndex):
+    """
+    Similarity index over Material.embedding.
+
+    Loaded in the background on startup from MATERIAL_INDEX_PATH when the
+    saved catalog version (embedded row count and latest updated_at) still
+    matches the database, otherwise rebuilt from the database and saved.
+    Catalog writes go through index_materials / unindex_materials so the
+    in-memory copy stays current; it is saved again on shutdown. Materials
+    whose embedding is missing or has a different dimension than the index
+    are skipped.
+    """
+
+    columns = (Material.id, Material.embedding, Material.category, Material.price, Material.styles)
+    state = ("index", "skipped", "version")
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._reset()
+
+    def _reset(self):
+        self.index: Optional[VectorIndex] = None
+        self.skipped = 0
+        self.version: Optional[str] = None
+
+    def _new_index(self, dim: int) -> VectorIndex:
+        return VectorIndex(
+            dim,
+            metric=settings.MATERIAL_INDEX_METRIC,
+            ivf_min_rows=settings.MATERIAL_INDEX_IVF_MIN_ROWS,
+            nprobe=settings.MATERIAL_INDEX_NPROBE
+        )
+
+    @staticmethod
+    async def catalog_version(db) -> str:
+        count, updated_at = (await db.execute(
+            select(func.count(), func.max(Material.updated_at)).where(Material.embedding.isnot(None))
+        )).one()
+        return f"{count}:{updated_at.isoformat() if updated_at else ''}"
+
+    def _query(self):
+        return select(*self.columns).where(Material.embedding.isnot(None))
+
+    async def load(self, session_factory):
+        # Read before the build: writes racing it are replayed, and at worst
+        # make the next startup rebuild again
+        async with session_factory() as db:
+            self.version = await self.catalog_version(db)
+        if os.path.exists(self.path):
+            index = await asyncio.to_thread(
+                VectorIndex.load, self.path,
+                settings.MATERIAL_INDEX_IVF_MIN_ROWS, settings.MATERIAL_INDEX_NPROBE
+            )
+            if index.version == self.version:
+                self.index = index
+                self._go_live()
+                return
+        await super().load(session_factory)
+
+    def _finish_load(self):
+        if self.index is not None:
+            self.index.version = self.version
+            self.index.save(self.path)
+
+    def _docs(self, materials: Iterable) -> list:
+        return list(materials)
+
+    def _add(self, materials: list, bulk: bool = False):
+        """Index objects or rows with id, embedding, category, price and styles"""
+        self._remove([m.id for m in materials if not m.embedding])
+        batch = [m for m in materials if m.embedding]
+        if not batch:
+            return
+        if self.index is None:
+            self.index = self._new_index(len(batch[0].embedding))
+        usable = [m for m in batch if len(m.embedding) == self.index.dim]
+        if len(usable) < len(batch):
+            self.skipped += len(batch) - len(usable)
+            self._remove([m.id for m in batch if len(m.embedding) != self.index.dim])
+        if not usable:
+            return
+        self.index.add(
+            [m.id for m in usable],
+            np.array([m.embedding for m in usable], dtype=np.float32),
+            categories=[m.category for m in usable],
+            prices=[m.price for m in usable],
+            tags=[m.styles or [] for m in usable]
+        )
+
+    def _remove(self, material_ids: list):
+        if self.index is not None:
+            self.index.remove(material_ids)
+
+    def save(self):
+        if self.ready and self.index is not None and self.index.dirty:
+            self.index.save(self.path)
+
+    def similar(
+        self,
+        material_id: int,
+        k: int = 5,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        styles: Optional[List[str]] = None
+    ) -> Optional[List[Tuple[int, float]]]:
+        """Nearest neighbours of an indexed material, or None if it is not indexed"""
+        vector = self.index.vector(material_id) if self.ready and self.index is not None else None
+        if vector is None:
+            return None
+        return self.index.search(
+            vector, k, category=category, min_price=min_price, max_price=max_price,
+            tags=styles, exclude=[material_id]
+        )
+
+    def similarities(self, material_id: int, candidate_ids: List[int]) -> Optional[np.ndarray]:
+        """Similarity of each candidate to an indexed material (NaN if the
+        candidate is not indexed), or None if the material is not indexed"""
+        vector = self.index.vector(material_id) if self.ready and self.index is not None else None
+        if vector is None:
+            return None
+        return self.index.scores(vector, candidate_ids)
+
+    def search(self, vector, k: int = 10, **filters) -> List[Tuple[int, float]]:
+        if not self.ready or self.index is None or len(vector) != self.index.dim:
+            return []
+        return self.index.search(np.asarray(vector, dtype=np.float32), k, **filters)
+
+    def stats(self) -> Dict:
+        if self.index is None:
+            return {"rows": 0, "path": self.path, "ready": self.ready}
+        return {**self.index.stats(), "path": self.path, "ready": self.ready, "skipped": self.skipped,
+                "version": self.version, "reloads": self.reloads}
+
+
+
+class MaterialTextIndex(_BackgroundIndex):
+    """Full-text index over material name and brand for /materials/search"""
+
+    columns = (Material.id, Material.name, Material.brand)
+
+    def __init__(self):
+        super().__init__()
+        self._reset()
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def _reset(self):
+        self.index = TextIndex()
+
+    def _docs(self, materials: Iterable) -> list:
+        return [(m.id, f"{m.name or ''} {m.brand or ''}") for m in materials]
+
+    def _add(self, docs: list, bulk: bool = False):
+        self.index.add(docs, merge=not bulk)
+
+    def _remove(self, material_ids: list):
+        self.index.remove(material_ids)
+
+    def _finish_load(self):
+        self.index.merge()
+
+    def search(self, query: str, k: Optional[int] = 1000,
+               candidate_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        started = time.perf_counter()
+        ids, scores = self.index.search(query, k, candidate_ids)
+        self.query_seconds += time.perf_counter() - started
+        self.queries += 1
+        return ids, scores
+
+    def stats(self) -> Dict:
+        return {
+            **self.index.stats(),
+            "ready": self.ready,
+            "reloads": self.reloads,
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_seconds / self.queries * 1000, 3) if self.queries else 0.0
+        }
+
+
+class MaterialFacetIndex(_BackgroundIndex):
+    """
+    Bitset facets (category, styles, colors, supplier, price unit, price
+    bucket) for faceted search and the budget matcher.
+    """
+
+    columns = (Material.id, Material.category, Material.styles, Material.colors, Material.supplier,
+               Material.price_unit, Material.price)
+    fields = ("category", "styles", "colors", "supplier", "price_unit")
+
+    def __init__(self, price_buckets: List[float]):
+        super().__init__()
+        self.price_buckets = price_buckets
+        self._reset()
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def _reset(self):
+        self.index = FacetIndex(self.fields, self.price_buckets)
+
+    def _docs(self, materials: Iterable) -> list:
+        return [
+            (m.id, {field: getattr(m, field) for field in self.fields}, m.price)
+            for m in materials
+        ]
+
+    def _add(self, docs: list, bulk: bool = False):
+        self.index.add(docs)
+
+    def _remove(self, material_ids: list):
+        self.index.remove(material_ids)
+
+    def query(self, filters: Dict[str, List[str]], min_price=None, max_price=None, candidate_ids=None):
+        started = time.perf_counter()
+        result = self.index.query(filters, min_price, max_price, candidate_ids)
+        self.query_seconds += time.perf_counter() - started
+        self.queries += 1
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            **self.index.stats(),
+            "ready": self.ready,
+            "reloads": self.reloads,
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_seconds / self.queries * 1000, 3) if self.queries else 0.0
+        }
+
+
+class MaterialPriceIndex(_BackgroundIndex):
+    """Per-category price-sorted index behind /materials/{id}/alternatives"""
+
+    columns = (Material.id, Material.category, Material.price, Material.styles, Material.colors)
+
+    def __init__(self):
+        super().__init__()
+        self._reset()
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def _reset(self):
+        self.index = PriceIndex()
+
+    def _docs(self, materials: Iterable) -> list:
+        return [(m.id, m.category, m.price, m.styles, m.colors) for m in materials]
+
+    def _add(self, docs: list, bulk: bool = False):
+        self.index.add(docs)
+
+    def _remove(self, material_ids: list):
+        self.index.remove(material_ids)
+
+    def alternatives(self, material_id: int, k: int = 5, tolerance: Optional[float] = 0.2,
+                     styles: Optional[List[str]] = None) -> Optional[List[Tuple[int, float]]]:
+        started = time.perf_counter()
+        result = self.index.alternatives(material_id, k, tolerance, styles)
+        self.query_seconds += time.perf_counter() - started
+        self.queries += 1
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            **self.index.stats(),
+            "ready": self.ready,
+            "reloads": self.reloads,
+            "queries": self.queries,
+            "avg_query_us": round(self.query_seconds / self.queries * 1e6, 1) if self.queries else 0.0
+        }
+
+
+class MaterialColorIndex:
+    """
+    Image color features written by the offline extraction job
+    (scripts/extract_material_colors.py). The file is reloaded when the job
+    has written a newer one; deleted materials are dropped in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.store: Optional[ColorFeatureStore] = None
+        self._mtime: Optional[float] = None
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    async def refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            self.store = await asyncio.to_thread(ColorFeatureStore.load, self.path)
+            self._mtime = mtime
+
+    def nearest(self, lab, k: int = 20, min_share: float = 0.15, candidate_ids=None,
+                max_distance: Optional[float] = None) -> List[Tuple[int, float, float]]:
+        started = time.perf_counter()
+        result = self.store.nearest(lab, k, min_share, candidate_ids, max_distance)
+        self.query_seconds += time.perf_counter() - started
+        self.queries += 1
+        return result
+
+    def similar(self, material_id: int, k: int = 20) -> Optional[List[Tuple[int, float]]]:
+        return self.store.similar(material_id, k)
+
+    def remove(self, material_ids: Iterable[int]):
+        if self.store is not None:
+            self.store.remove(material_ids)
+
+    def stats(self) -> Dict:
+        if self.store is None:
+            return {"rows": 0, "path": self.path}
+        return {
+            **self.store.stats(),
+            "path": self.path,
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_seconds / self.queries * 1000, 3) if self.queries else 0.0
+        }
+
+
+material_vectors = MaterialVectorIndex(settings.MATERIAL_INDEX_PATH) if settings.MATERIAL_INDEX_ENABLED else None
+material_text = MaterialTextIndex() if settings.MATERIAL_TEXT_INDEX_ENABLED else None
+material_facets = MaterialFacetIndex(settings.MATERIAL_PRICE_BUCKETS) if settings.MATERIAL_FACETS_ENABLED else None
+material_prices = MaterialPriceIndex() if settings.MATERIAL_PRICE_INDEX_ENABLED else None
+material_colors = (
+    MaterialColorIndex(settings.MATERIAL_COLOR_FEATURES_PATH) if settings.MATERIAL_COLOR_FEATURES_ENABLED else None
+)
+_background_loads = set()
+
+
+async def load_material_indexes(session_factory):
+    if material_colors is not None:
+        await material_colors.refresh()
+    for index in (material_vectors, material_text, material_facets, material_prices):
+        if index is not None:
+            task = asyncio.ensure_future(index.load(session_factory))
+            _background_loads.add(task)
+            task.add_done_callback(_background_loads.discard)
+
+
+def reload_material_indexes(session_factory):
+    """Rebuild the database-backed indexes in the background, serving the current ones meanwhile"""
+    for index in (material_vectors, material_text, material_facets, material_prices):
+        if index is not None:
+            task = asyncio.ensure_future(index.reload(session_factory))
+            _background_loads.add(task)
+            task.add_done_callback(_background_loads.discard)
+
+
+def save_material_indexes():
+    if material_vectors is not None:
+        material_vectors.save()
+
+
+def index_materials(materials: List):
+    """Apply inserted or updated materials to the in-memory indexes"""
+    materials = list(materials)
+    if material_vectors is not None:
+        material_vectors.upsert(materials)
+    if material_text is not None:
+        material_text.upsert(materials)
+    if material_facets is not None:
+        material_facets.upsert(materials)
+    if material_prices is not None:
+        material_prices.upsert(materials)
+
+
+def unindex_materials(material_ids: List[int]):
+    if material_vectors is not None:
+        material_vectors.remove(material_ids)
+    if material_text is not None:
+        material_text.remove(material_ids)
+    if material_facets is not None:
+        material_facets.remove(material_ids)
+    if material_prices is not None:
+        material_prices.remove(material_ids)
+    if material_colors is not None:
+        material_colors.remove(material_ids)
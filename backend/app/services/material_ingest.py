@@ -0,0 +1,327 @@
+import asyncio
+import collections
+import csv
+import functools
+import itertools
+import json
+import os
+import re
+import time
+import uuid
+import zlib
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import settings
+from app.core.material_tags import COLOR_ALIASES, STYLE_ALIASES, normalize_tags
+from app.core.ngrams import char_ngrams, normalize
+from app.models.models import Material
+from app.services.ai_service import kimi_ai
+from app.services.material_cache import material_result_cache
+from app.services.material_events import material_catalog_events
+from app.services.material_index import index_materials
+
+# Supplier export headers -> Material columns
+FIELD_ALIASES = {
+    "name": ("name", "title", "商品名称", "名称"),
+    "category": ("category", "分类", "类目"),
+    "brand": ("brand", "品牌"),
+    "price": ("price", "价格", "售价"),
+    "price_unit": ("price_unit", "unit", "单位"),
+    "currency": ("currency", "币种"),
+    "styles": ("styles", "style", "风格"),
+    "colors": ("colors", "color", "颜色"),
+    "supplier": ("supplier", "platform", "渠道"),
+    "purchase_url": ("purchase_url", "url", "link", "商品链接"),
+    "image_url": ("image_url", "image", "img", "图片")
+}
+
+_PRICE = re.compile(r"\d+(?:\.\d+)?")
+UPDATE_COLUMNS = ("name", "category", "brand", "price", "price_unit", "currency", "styles", "colors", "image_url")
+
+
+def parse_price(value) -> Optional[float]:
+    """Price from a number or text such as "¥1,299.00/㎡"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = _PRICE.search(str(value).replace(",", ""))
+    return float(match.group()) if match else None
+
+
+def normalize_record(raw: Dict, supplier: Optional[str] = None) -> Optional[Dict]:
+    """Map a supplier record onto Material columns; None if it has no name or dedupe key"""
+    row = {}
+    for field, names in FIELD_ALIASES.items():
+        for name in names:
+            if raw.get(name) not in (None, ""):
+                row[field] = raw[name]
+                break
+    row["supplier"] = str(row.get("supplier") or supplier or "").strip().lower()
+    row["purchase_url"] = str(row.get("purchase_url") or "").strip()
+    row["name"] = str(row.get("name") or "").strip()
+    if not (row["name"] and row["supplier"] and row["purchase_url"]):
+        return None
+    return {
+        "name": row["name"][:255],
+        "category": str(row["category"]).strip().lower() if row.get("category") else None,
+        "brand": str(row["brand"]).strip() if row.get("brand") else None,
+        "price": parse_price(row.get("price")),
+        "price_unit": row.get("price_unit"),
+        "currency": str(row.get("currency") or "CNY").upper(),
+        "styles": normalize_tags(row.get("styles"), STYLE_ALIASES),
+        "colors": normalize_tags(row.get("colors"), COLOR_ALIASES),
+        "supplier": row["supplier"][:50],
+        "purchase_url": row["purchase_url"][:500],
+        "image_url": row.get("image_url")
+    }
+
+
+def read_records(path: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    """Stream raw records from a CSV (header row) or JSONL file"""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    # utf-8-sig drops the BOM that spreadsheet exports put in front of the header
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        elif fmt == "jsonl":
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield {}  # counted as rejected
+        else:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+
+def embedding_text(row: Dict) -> str:
+    return " ".join(filter(None, [
+        row["name"], row["brand"], row["category"], " ".join(row["styles"]), " ".join(row["colors"])
+    ]))
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def _gram_slot(gram: str, dim: int) -> Tuple[int, int]:
+    h = zlib.crc32(gram.encode("utf-8"))
+    return h % dim, 1 if h & 0x80000000 else -1
+
+
+def hash_embeddings(texts: List[str], dim: int) -> np.ndarray:
+    """
+    Signed feature-hashed character n-gram vectors, L2-normalized.
+
+    A local stand-in when no embedding model is configured: materials with
+    similar names, styles and colors still end up close together.
+    """
+    rows, slots, weights = [], [], []
+    for i, text in enumerate(texts):
+        for gram, count in char_ngrams(normalize(text), (2, 3)).items():
+            slot, sign = _gram_slot(gram, dim)
+            rows.append(i)
+            slots.append(slot)
+            weights.append(sign * count)
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    np.add.at(vectors, (np.array(rows, dtype=np.int64), np.array(slots, dtype=np.int64)),
+              np.array(weights, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+async def embed_rows(rows: List[Dict]) -> List[List[float]]:
+    texts = [embedding_text(row) for row in rows]
+    if not settings.EMBEDDING_MODEL:
+        vectors = await asyncio.to_thread(hash_embeddings, texts, settings.EMBEDDING_HASH_DIM)
+        return np.round(vectors, 5).tolist()
+    size = settings.EMBEDDING_BATCH_SIZE
+    # The scheduler bounds how many of these batches run at once
+    batches = await asyncio.gather(*(
+        kimi_ai.create_embeddings(texts[start:start + size]) for start in range(0, len(texts), size)
+    ))
+    return [vector for batch in batches for vector in batch]
+
+
+class IngestCheckpoint:
+    """Records committed so far for one source file, so a rerun resumes after them"""
+
+    def __init__(self, source: str, directory: str):
+        self.source = os.path.abspath(source)
+        stat = os.stat(source)
+        self.fingerprint = f"{stat.st_size}:{int(stat.st_mtime)}"
+        name = f"{os.path.basename(source)}.{zlib.crc32(self.source.encode()):08x}.checkpoint.json"
+        self.path = os.path.join(directory, name)
+
+    def load(self) -> int:
+        """Records already committed, or 0 if there is no checkpoint for this exact file"""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("fingerprint") != self.fingerprint:
+            return 0
+        return state.get("records", 0)
+
+    def save(self, records: int, stats: Dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"source": self.source, "fingerprint": self.fingerprint, "records": records,
+                       "stats": stats}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MaterialIngestService:
+    """
+    Streaming bulk upsert of supplier catalogs into materials.
+
+    Records are read and normalized one chunk at a time, deduplicated on
+    (supplier, purchase_url) within the chunk (last one wins), embedded in
+    batches and written with multi-row INSERT ... ON CONFLICT DO UPDATE.
+    Each chunk is its own transaction followed by a checkpoint, so memory
+    stays bounded by the chunk size and an interrupted run resumes after
+    the last committed chunk. With `index=True` (the API) this process's
+    in-memory material indexes are updated per chunk. Either way the run
+    ends by announcing the change on material_catalog_events, so other
+    workers rebuild theirs.
+    """
+
+    def __init__(self, session_factory, chunk_size: Optional[int] = None, embed: bool = True,
+                 index: bool = True):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size or settings.MATERIAL_INGEST_CHUNK_SIZE
+        self.embed = embed
+        self.index = index
+
+    async def _upsert(self, rows: List[Dict]) -> List:
+        stmt = pg_insert(Material)
+        columns = UPDATE_COLUMNS + ("updated_at",) + (("embedding",) if self.embed else ())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Material.supplier, Material.purchase_url],
+            set_={column: stmt.excluded[column] for column in columns}
+        ).returning(Material.id, Material.embedding, sort_by_parameter_order=True)
+        async with self.session_factory() as db:
+            # executemany: SQLAlchemy batches these into multi-row VALUES statements
+            result = await db.execute(stmt, rows)
+            written = result.all()
+            await db.commit()
+        return written
+
+    async def run(
+        self,
+        path: str,
+        fmt: Optional[str] = None,
+        supplier: Optional[str] = None,
+        resume: bool = True,
+        progress: Optional[Callable[[Dict], None]] = None
+    ) -> Dict:
+        checkpoint = IngestCheckpoint(path, settings.MATERIAL_INGEST_DIR)
+        skipped = checkpoint.load() if resume else 0
+        stats = {"records": skipped, "resumed_from": skipped, "upserted": 0, "rejected": 0,
+                 "duplicates": 0, "chunks": 0, "elapsed_seconds": 0.0, "rows_per_second": 0.0}
+        started = time.monotonic()
+        records = read_records(path, fmt)
+        if skipped:
+            await asyncio.to_thread(_consume, records, skipped)
+
+        try:
+            while True:
+                # Parsing is CPU-bound; keep it off the event loop
+                chunk = await asyncio.to_thread(_take, records, self.chunk_size)
+                if not chunk:
+                    break
+                by_key = {}
+                for raw in chunk:
+                    row = normalize_record(raw, supplier) if isinstance(raw, dict) else None
+                    if row is None:
+                        stats["rejected"] += 1
+                        continue
+                    key = (row["supplier"], row["purchase_url"])
+                    if key in by_key:
+                        stats["duplicates"] += 1
+                    by_key[key] = row
+                rows = list(by_key.values())
+
+                if rows:
+                    if self.embed:
+                        for row, vector in zip(rows, await embed_rows(rows)):
+                            row["embedding"] = vector
+                    written = await self._upsert(rows)
+                    if material_result_cache is not None:
+                        await material_result_cache.bump_version()
+                    if self.index:
+                        # Without embed the stored embedding is kept, so index that one
+                        index_materials(
+                            SimpleNamespace(**{**row, "id": material_id, "embedding": embedding})
+                            for (material_id, embedding), row in zip(written, rows)
+                        )
+                    stats["upserted"] += len(written)
+
+                stats["records"] += len(chunk)
+                stats["chunks"] += 1
+                stats["elapsed_seconds"] = round(time.monotonic() - started, 1)
+                processed = stats["records"] - stats["resumed_from"]
+                stats["rows_per_second"] = round(processed / max(time.monotonic() - started, 1e-6), 1)
+                checkpoint.save(stats["records"], stats)
+                if progress is not None:
+                    progress(dict(stats))
+        finally:
+            # Also after a failure: the chunks committed so far are live
+            if stats["upserted"] and material_catalog_events is not None:
+                await material_catalog_events.publish()
+
+        checkpoint.clear()
+        return stats
+
+
+def _take(records: Iterator[Dict], n: int) -> List[Dict]:
+    return list(itertools.islice(records, n))
+
+
+def _consume(records: Iterator[Dict], n: int):
+    collections.deque(itertools.islice(records, n), maxlen=0)
+
+
+_ingest_jobs: Dict[str, Dict] = {}
+_ingest_tasks = set()
+
+
+def start_ingest_job(session_factory, path: str, fmt: Optional[str] = None, supplier: Optional[str] = None,
+                     embed: bool = True, remove_source: bool = False) -> str:
+    """
+    Run an ingest in the background of this worker; poll with get_ingest_job.
+    A failed job keeps its source file, so the CLI can resume it.
+    """
+    job_id = uuid.uuid4().hex
+    job = _ingest_jobs[job_id] = {"id": job_id, "status": "running", "source": os.path.basename(path),
+                                  "stats": {}, "error": None}
+
+    def on_progress(stats: Dict):
+        job["stats"] = stats
+
+    async def run():
+        try:
+            job["stats"] = await MaterialIngestService(session_factory, embed=embed).run(
+                path, fmt, supplier, progress=on_progress
+            )
+            job["status"] = "completed"
+            if remove_source:
+                os.remove(path)
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+
+    task = asyncio.ensure_future(run())
+    _ingest_tasks.add(task)
+    task.add_done_callback(_ingest_tasks.discard)
+    return job_id
+
+
+def get_ingest_job(job_id: str) -> Optional[Dict]:
+    return _ingest_jobs.get(job_id)
@@ -0,0 +1,175 @@
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from app.core.facet_index import FacetIndex
+from app.core.knapsack import pareto_frontier, solve_multiple_choice_knapsack
+from app.core.material_tags import COLOR_ALIASES, STYLE_ALIASES, normalize_tags
+
+# Budget group (allocation keys of MaterialService.get_budget_options) ->
+# (material categories, ㎡ bought per ㎡ of floor area for per-area prices,
+#  pieces per ㎡ of floor area for per-piece prices)
+MATCH_GROUPS = {
+    "floor": (("floor", "tile"), 1.0, 0.0),
+    "wall": (("wall", "paint"), 2.7, 0.0),
+    "ceiling": (("ceiling",), 1.0, 0.0),
+    "door": (("door",), 0.0, 1 / 15),
+    "bathroom": (("bathroom",), 0.0, 1 / 45),
+    "kitchen": (("cabinet",), 0.0, 1 / 90),
+    "lighting": (("lighting",), 0.0, 1 / 8),
+    "furniture": (("furniture",), 0.0, 1 / 10),
+    "soft": (("curtain",), 0.4, 1 / 20)
+}
+
+GROUP_NAMES = {
+    "floor": "地板/瓷砖", "wall": "墙面", "ceiling": "吊顶", "door": "门窗", "bathroom": "卫浴",
+    "kitchen": "橱柜", "lighting": "灯具", "furniture": "家具", "soft": "软装"
+}
+
+AREA_UNIT_MARKERS = ("㎡", "m2", "m²", "sqm", "平米", "平方")
+
+# Project.budget_min/max are entered in 万元 (ProjectCreate); matching works in yuan
+PROJECT_BUDGET_UNIT = 10000.0
+
+# Score weights: style fit dominates, colors and price nudge between close options
+STYLE_WEIGHT = 0.6
+LIKED_COLOR_WEIGHT = 0.15
+DISLIKED_COLOR_WEIGHT = 0.3
+PRICE_WEIGHT = 0.25
+PRICE_SIGMA = 0.5  # in log(cost / allocation); 0.5 ~ a factor of 1.65 scores 0.6
+
+
+def is_area_unit(unit: Optional[str]) -> bool:
+    unit = (unit or "").lower()
+    return any(marker in unit for marker in AREA_UNIT_MARKERS)
+
+
+def project_budget(budget_min: Optional[float], budget_max: Optional[float], area_sqm: float,
+                   default_per_sqm: float) -> float:
+    """Project budget in yuan; without one, default_per_sqm (yuan per ㎡) times the area"""
+    budget = budget_max or budget_min
+    if budget:
+        return budget * PROJECT_BUDGET_UNIT
+    return area_sqm * default_per_sqm
+
+
+def style_weights(style_preferences: Dict) -> Dict[str, float]:
+    """
+    Weight per canonical style tag from a project's style_preferences
+    ({"primary": ..., "secondary": [...], "mix_ratio": 0.7}); weights sum to 1.
+    """
+    primary = normalize_tags(style_preferences.get("primary"), STYLE_ALIASES)
+    secondary = [s for s in normalize_tags(style_preferences.get("secondary"), STYLE_ALIASES) if s not in primary]
+    if not secondary:
+        return {style: 1.0 / len(primary) for style in primary}
+    mix_ratio = float(style_preferences.get("mix_ratio") or 0.7) if primary else 0.0
+    weights = {style: mix_ratio / len(primary) for style in primary}
+    weights.update({style: (1.0 - mix_ratio) / len(secondary) for style in secondary})
+    return weights
+
+
+class BudgetMatcher:
+    """
+    Whole-house material selection under a budget.
+
+    Every live material in a group's categories is scored in one vectorized
+    pass over the facet index: style fit against the project's weighted
+    styles, liked/disliked colors, and how close its cost (price times the
+    quantity the floor area needs) is to the group's share of the budget.
+    The best `candidates` per group, cut down to their cost/value Pareto
+    frontier, go into a multiple-choice knapsack that picks one material per
+    group maximizing the total score within the budget.
+    """
+
+    def __init__(self, index: FacetIndex, candidates: int = 256, steps: int = 2000):
+        self.index = index
+        self.candidates = candidates
+        self.steps = steps
+
+    def match(
+        self,
+        allocations: Dict[str, float],
+        budget: float,
+        area_sqm: float,
+        styles: Dict[str, float],
+        likes: Iterable[str] = (),
+        dislikes: Iterable[str] = (),
+        alternatives: int = 3
+    ) -> Dict:
+        ids, prices, live = self.index.arrays()
+        fit = np.zeros(len(ids), dtype=np.float32)
+        for style, weight in styles.items():
+            fit += STYLE_WEIGHT * weight * self.index.flags("styles", [style])
+        fit += LIKED_COLOR_WEIGHT * self.index.flags("colors", normalize_tags(list(likes), COLOR_ALIASES))
+        fit -= DISLIKED_COLOR_WEIGHT * self.index.flags("colors", normalize_tags(list(dislikes), COLOR_ALIASES))
+        area_priced = self.index.flags(
+            "price_unit", [unit for unit in self.index.values("price_unit") if is_area_unit(unit)]
+        )
+        usable = live & (prices > 0)
+
+        groups = []
+        for group, allocation in allocations.items():
+            if group not in MATCH_GROUPS:
+                continue
+            categories, sqm_per_sqm, pieces_per_sqm = MATCH_GROUPS[group]
+            rows = np.flatnonzero(usable & self.index.flags("category", categories))
+            pieces = max(1.0, round(area_sqm * pieces_per_sqm))
+            quantity = np.where(area_priced[rows] & (sqm_per_sqm > 0), area_sqm * sqm_per_sqm, pieces)
+            cost = prices[rows].astype(np.float64) * quantity
+            keep = cost <= budget
+            rows, quantity, cost = rows[keep], quantity[keep], cost[keep]
+            if not len(rows):
+                groups.append({"group": group, "allocation": allocation, "options": None})
+                continue
+            price_fit = np.exp(-0.5 * (np.log(cost / max(allocation, 1.0)) / PRICE_SIGMA) ** 2)
+            value = fit[rows] + PRICE_WEIGHT * price_fit
+
+            if len(rows) > self.candidates:
+                # Keep the cheapest option too, so a tight budget stays feasible
+                top = np.argpartition(-value, self.candidates)[:self.candidates]
+                top = np.union1d(top, [np.argmin(cost)])
+                rows, quantity, cost, value = rows[top], quantity[top], cost[top], value[top]
+            groups.append({
+                "group": group,
+                "allocation": allocation,
+                "options": {"ids": ids[rows], "quantity": quantity, "cost": cost, "value": value},
+                "frontier": pareto_frontier(cost, value)
+            })
+
+        solvable = [g for g in groups if g["options"] is not None]
+        picks = solve_multiple_choice_knapsack(
+            [g["options"]["cost"][g["frontier"]] for g in solvable],
+            [g["options"]["value"][g["frontier"]] for g in solvable],
+            budget,
+            self.steps
+        )
+        over_budget = picks is None
+        for g, pick in zip(solvable, picks or [None] * len(solvable)):
+            g["pick"] = int(np.argmin(g["options"]["cost"])) if pick is None else int(g["frontier"][pick])
+        total_cost = float(sum(g["options"]["cost"][g["pick"]] for g in solvable))
+
+        result = []
+        for g in groups:
+            item = {"group": g["group"], "allocation": g["allocation"], "selected": None, "alternatives": []}
+            options = g["options"]
+            if options is not None:
+                chosen = g["pick"]
+                item["selected"] = self._option(options, chosen)
+                # Swaps that still fit the budget, best scoring first
+                slack = budget - total_cost
+                fits = options["cost"] - options["cost"][chosen] <= slack
+                fits[chosen] = False
+                ranked = np.flatnonzero(fits)
+                ranked = ranked[np.argsort(-options["value"][ranked], kind="stable")][:alternatives]
+                item["alternatives"] = [self._option(options, i) for i in ranked]
+            result.append(item)
+        return {"total_cost": round(total_cost, 2), "over_budget": over_budget, "groups": result}
+
+    @staticmethod
+    def _option(options: Dict, i: int) -> Dict:
+        return {
+            "id": int(options["ids"][i]),
+            "quantity": round(float(options["quantity"][i]), 2),
+            "cost": round(float(options["cost"][i]), 2),
+            "score": round(float(options["value"][i]), 3)
+        }
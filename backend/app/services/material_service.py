@@ -1,8 +1,25 @@
+import math
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
-from typing import List, Optional
+from sqlalchemy import select, and_, or_, func, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from typing import Dict, List, Optional, Tuple
 
-from app.models.models import Material
+from app.models.models import Material, Project, Design
+from app.core.color_features import parse_color
+from app.core.config import settings
+from app.core.facet_index import FacetIndex, price_bucket_range
+from app.services.material_index import (
+    material_vectors, material_text, material_facets, material_prices, material_colors
+)
+from app.services.material_matcher import BudgetMatcher, GROUP_NAMES, MATCH_GROUPS, project_budget, style_weights
+
+
+def tag_filter(column, tags: List[str], match: str = "any"):
+    """JSONB containment on a tag array column, served by its GIN index"""
+    if match == "all":
+        return column.contains(tags)  # @>
+    return column.has_any(array(tags))  # ?|
 
 
 class MaterialService:
@@ -18,24 +35,36 @@ class MaterialService:
         max_price: Optional[float] = None,
         supplier: Optional[str] = None,
         skip: int = 0,
-        limit: int = 50
+        limit: int = 50,
+        styles: Optional[List[str]] = None,
+        colors: Optional[List[str]] = None,
+        style_match: str = "any",
+        color_match: str = "any",
+        categories: Optional[List[str]] = None,
+        suppliers: Optional[List[str]] = None,
+        price_ranges: Optional[List[Tuple[Optional[float], Optional[float]]]] = None
     ) -> List[Material]:
-        """Search materials with filters"""
+        """
+        Search materials with filters
+        
+        `styles`/`colors` match any (default) or all of the given tags;
+        `style` is the single-tag form and is added to `styles`.
+        `categories`/`suppliers` match any of the values and extend
+        `category`/`supplier`. `price_ranges` are [low, high) pairs (None for
+        an open end) of which the price must fall in at least one.
+        """
         stmt = select(Material)
         
-        if query:
-            stmt = stmt.where(
-                or_(
-                    Material.name.ilike(f"%{query}%"),
-                    Material.brand.ilike(f"%{query}%")
-                )
-            )
+        categories = list(dict.fromkeys((categories or []) + ([category] if category else [])))
+        if categories:
+            stmt = stmt.where(Material.category.in_(categories))
         
-        if category:
-            stmt = stmt.where(Material.category == category)
+        styles = list(dict.fromkeys((styles or []) + ([style] if style else [])))
+        if styles:
+            stmt = stmt.where(tag_filter(Material.styles, styles, style_match))
         
-        if style:
-            stmt = stmt.where(Material.styles.contains([style]))
+        if colors:
+            stmt = stmt.where(tag_filter(Material.colors, list(dict.fromkeys(colors)), color_match))
         
         if min_price is not None:
             stmt = stmt.where(Material.price >= min_price)
@@ -43,13 +72,166 @@ class MaterialService:
         if max_price is not None:
             stmt = stmt.where(Material.price <= max_price)
         
-        if supplier:
-            stmt = stmt.where(Material.supplier == supplier)
+        suppliers = list(dict.fromkeys((suppliers or []) + ([supplier] if supplier else [])))
+        if suppliers:
+            stmt = stmt.where(Material.supplier.in_(suppliers))
+        
+        if price_ranges is not None:
+            bounds = []
+            for low, high in price_ranges:
+                bound = [Material.price >= low] if low is not None else []
+                bound += [Material.price < high] if high is not None else []
+                bounds.append(and_(*bound))
+            # Only unknown bucket labels: nothing can match
+            stmt = stmt.where(or_(*bounds) if bounds else Material.id.is_(None))
+        
+        if query and material_text is not None and material_text.ready:
+            # Relevance order and paging come from the text index, which only
+            # ranks as many matches as the page needs
+            wanted = skip + limit
+            if stmt.whereclause is None:
+                ids, _ = material_text.search(query, wanted)
+                return await self.get_by_ids(ids[skip:].tolist())
+            if material_facets is not None and material_facets.ready:
+                allowed = self._facet_filter(
+                    categories, styles, style_match, colors, color_match,
+                    min_price, max_price, suppliers, price_ranges
+                )
+                ids, _ = material_text.search(query, wanted, candidate_ids=allowed)
+                return await self.get_by_ids(ids[skip:].tolist())
+            # Filters in SQL over the best-ranked matches only
+            ids, _ = material_text.search(query, max(wanted, settings.MATERIAL_TEXT_SEARCH_CANDIDATES))
+            ranked_ids = ids.tolist()
+            result = await self.db.execute(
+                stmt.with_only_columns(Material.id)
+                .where(Material.id == any_(bindparam("candidate_ids", ranked_ids, type_=ARRAY(Integer))))
+            )
+            allowed_ids = set(result.scalars())
+            matched = [material_id for material_id in ranked_ids if material_id in allowed_ids]
+            return await self.get_by_ids(matched[skip:wanted])
+        
+        if query:
+            stmt = stmt.where(
+                or_(
+                    Material.name.ilike(f"%{query}%"),
+                    Material.brand.ilike(f"%{query}%")
+                )
+            )
         
         stmt = stmt.offset(skip).limit(limit)
         result = await self.db.execute(stmt)
         return result.scalars().all()
     
+    def _facet_filter(
+        self,
+        categories: List[str],
+        styles: List[str],
+        style_match: str,
+        colors: Optional[List[str]],
+        color_match: str,
+        min_price: Optional[float],
+        max_price: Optional[float],
+        suppliers: List[str],
+        price_ranges: Optional[List[Tuple[Optional[float], Optional[float]]]]
+    ) -> np.ndarray:
+        """Ids passing the search_materials filters, from the facet bitsets"""
+        index = material_facets.index
+        ids, prices, flags = index.arrays()
+        for field, values, match in (
+            ("category", categories, "any"),
+            ("styles", styles, style_match),
+            ("colors", list(dict.fromkeys(colors or [])), color_match),
+            ("supplier", suppliers, "any")
+        ):
+            if not values:
+                continue
+            if match == "all":
+                for value in values:
+                    flags = flags & index.flags(field, [value])
+            else:
+                flags = flags & index.flags(field, values)
+        # NaN (no price) fails every comparison, as NULL does in SQL
+        if min_price is not None:
+            flags = flags & (prices >= min_price)
+        if max_price is not None:
+            flags = flags & (prices <= max_price)
+        if price_ranges is not None:
+            in_range = np.zeros(len(prices), dtype=bool)
+            for low, high in price_ranges:
+                bound = ~np.isnan(prices)
+                if low is not None:
+                    bound &= prices >= low
+                if high is not None:
+                    bound &= prices < high
+                in_range |= bound
+            flags = flags & in_range
+        return ids[flags]
+    
+    async def faceted_search(
+        self,
+        query: Optional[str] = None,
+        filters: Optional[Dict[str, List[str]]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        skip: int = 0,
+        limit: int = 50
+    ) -> Dict:
+        """
+        One page of results plus counts per category, style, color,
+        supplier and price bucket, from the in-memory facet bitsets.
+        
+        `filters` maps a facet field to allowed values (any-of within a
+        field, all fields must match). Before the facet index has loaded,
+        results come from search_materials and facets are empty.
+        """
+        filters = {field: values for field, values in (filters or {}).items() if values}
+        if material_facets is None or not material_facets.ready:
+            price_ranges = None
+            if "price" in filters:
+                ranges = (price_bucket_range(settings.MATERIAL_PRICE_BUCKETS, label) for label in filters["price"])
+                price_ranges = [r for r in ranges if r is not None]
+            items = await self.search_materials(
+                query=query,
+                min_price=min_price,
+                max_price=max_price,
+                skip=skip,
+                limit=limit,
+                styles=filters.get("styles"),
+                colors=filters.get("colors"),
+                categories=filters.get("category"),
+                suppliers=filters.get("supplier"),
+                price_ranges=price_ranges
+            )
+            return {"items": items, "total": None, "facets": {}}
+        
+        ranked_ids = None
+        if query:
+            if material_text is not None and material_text.ready:
+                ids, _ = material_text.search(query, None)
+                ranked_ids = ids.tolist()
+            else:
+                result = await self.db.execute(
+                    select(Material.id).where(
+                        or_(
+                            Material.name.ilike(f"%{query}%"),
+                            Material.brand.ilike(f"%{query}%")
+                        )
+                    )
+                )
+                ranked_ids = list(result.scalars())
+        
+        ids, facets = material_facets.query(filters, min_price, max_price, candidate_ids=ranked_ids)
+        if ranked_ids is not None:
+            matched = set(ids.tolist())
+            ordered = [material_id for material_id in ranked_ids if material_id in matched]
+        else:
+            ordered = ids.tolist()
+        return {
+            "items": await self.get_by_ids(ordered[skip:skip + limit]),
+            "total": len(ordered),
+            "facets": facets
+        }
+    
     async def get_categories(self) -> List[dict]:
         """Get all material categories"""
         return [
@@ -120,41 +302,140 @@ class MaterialService:
         
         return results
     
-    async def match_materials(self, project_id: int, budget_tier: str = "standard") -> List[dict]:
-        """Match materials for a project based on style and budget"""
-        # TODO: Get project style and budget, then match materials
+    async def match_materials(
+        self,
+        project_id: int,
+        budget_tier: str = "standard",
+        alternatives: int = 3
+    ) -> Dict:
+        """
+        Pick one material per budget category for a project.
         
-        # Mock result
-        return [
-            {
-                "category": "地板",
-                "selected": {
-                    "name": "圣象实木复合地板",
-                    "brand": "圣象",
-                    "price": 189,
-                    "unit": "元/㎡",
-                    "purchase_url": "https://jd.com/product/xxx"
-                },
-                "alternatives": [
-                    {"name": "大自然地板", "price": 159},
-                    {"name": "德尔地板", "price": 219}
-                ]
-            },
-            {
-                "category": "瓷砖",
-                "selected": {
-                    "name": "马可波罗通体砖",
-                    "brand": "马可波罗",
-                    "price": 128,
-                    "unit": "元/㎡",
-                    "purchase_url": "https://tmall.com/product/xxx"
-                },
-                "alternatives": []
-            }
+        Uses the project's style preferences, color likes/dislikes, budget
+        and total room area (see BudgetMatcher); the tier's allocations from
+        get_budget_options steer prices per category. Project budgets are in
+        万元 and converted to yuan (project_budget); missing area or budget
+        fall back to the MATERIAL_MATCH_DEFAULT_* settings.
+        """
+        project = await self.db.get(Project, project_id)
+        if not project:
+            return {"error": "Project not found"}
+        
+        area = await self.db.scalar(
+            select(func.sum(Design.area)).where(Design.project_id == project_id)
+        ) or settings.MATERIAL_MATCH_DEFAULT_AREA_SQM
+        budget = project_budget(
+            project.budget_min, project.budget_max, area, settings.MATERIAL_MATCH_DEFAULT_BUDGET_PER_SQM
+        )
+        options = await self.get_budget_options(budget, area)
+        if budget_tier not in options:
+            return {"error": f"Unknown budget tier: {budget_tier}"}
+        tier = options[budget_tier]
+        
+        if material_facets is not None and material_facets.ready:
+            index = material_facets.index
+        else:
+            index = await self._match_candidates()
+        preferences = project.preferences or {}
+        matched = BudgetMatcher(
+            index, settings.MATERIAL_MATCH_CANDIDATES, settings.MATERIAL_MATCH_BUDGET_STEPS
+        ).match(
+            tier["allocations"],
+            tier["total_budget"],
+            area,
+            style_weights(project.style_preferences or {}),
+            likes=preferences.get("likes") or [],
+            dislikes=preferences.get("dislikes") or [],
+            alternatives=alternatives
+        )
+        
+        material_ids = [
+            option["id"]
+            for group in matched["groups"] if group["selected"]
+            for option in [group["selected"]] + group["alternatives"]
         ]
+        materials = {m.id: m for m in await self.get_by_ids(material_ids)}
+        
+        def describe(option: Dict) -> Optional[Dict]:
+            material = materials.get(option["id"])
+            if material is None:
+                return None
+            return {
+                "id": material.id,
+                "name": material.name,
+                "brand": material.brand,
+                "price": material.price,
+                "unit": material.price_unit,
+                "styles": material.styles,
+                "colors": material.colors,
+                "purchase_url": material.purchase_url,
+                "image_url": material.image_url,
+                **option
+            }
+        
+        items = []
+        for group in matched["groups"]:
+            items.append({
+                "category": GROUP_NAMES.get(group["group"], group["group"]),
+                "group": group["group"],
+                "allocation": group["allocation"],
+                "selected": describe(group["selected"]) if group["selected"] else None,
+                "alternatives": [a for a in map(describe, group["alternatives"]) if a]
+            })
+        return {
+            "project_id": project_id,
+            "budget_tier": budget_tier,
+            "budget": tier["total_budget"],
+            "area_sqm": area,
+            "total_cost": matched["total_cost"],
+            "over_budget": matched["over_budget"],
+            "items": items
+        }
+    
+    async def _match_candidates(self) -> FacetIndex:
+        """Facet index over matchable materials, built from SQL while the shared one loads"""
+        categories = [c for spec in MATCH_GROUPS.values() for c in spec[0]]
+        result = await self.db.execute(
+            select(
+                Material.id, Material.category, Material.styles, Material.colors,
+                Material.price_unit, Material.price
+            ).where(Material.category.in_(categories), Material.price > 0)
+        )
+        index = FacetIndex(("category", "styles", "colors", "price_unit"))
+        index.add(
+            (row.id, {"category": row.category, "styles": row.styles, "colors": row.colors,
+                      "price_unit": row.price_unit}, row.price)
+            for row in result
+        )
+        return index
     
-    async def get_alternatives(self, material_id: int, same_price_range: bool = True) -> List[Material]:
-        """Get alternative materials"""
+    async def get_alternatives(
+        self,
+        material_id: int,
+        same_price_range: bool = True,
+        style: Optional[str] = None,
+        k: int = 5,
+        tolerance: float = 0.2
+    ) -> List[Material]:
+        """
+        Get alternative materials from the same category
+        
+        With same_price_range, candidates cost within price * (1 ± tolerance).
+        The in-memory price index ranks them by price proximity and style/
+        color overlap, and its best MATERIAL_ALTERNATIVES_POOL * k are
+        re-ranked with embedding similarity when the vector index has the
+        material. Until the price index has loaded, embedding similarity and
+        then plain price distance in SQL are used.
+        """
+        if material_prices is not None and material_prices.ready:
+            ranked = material_prices.alternatives(
+                material_id, k * settings.MATERIAL_ALTERNATIVES_POOL,
+                tolerance if same_price_range else None, [style] if style else None
+            )
+            if ranked is not None:
+                ranked = self._rerank(material_id, ranked, k)
+                return await self.get_by_ids([alternative_id for alternative_id, _ in ranked])
+        
         # Get original material
         result = await self.db.execute(
             select(Material).where(Material.id == material_id)
@@ -164,6 +445,22 @@ class MaterialService:
         if not original:
             return []
         
+        min_price = max_price = None
+        if same_price_range and original.price is not None:
+            price_range = original.price * tolerance
+            min_price, max_price = original.price - price_range, original.price + price_range
+        
+        if material_vectors is not None:
+            neighbours = material_vectors.similar(
+                material_id, k,
+                category=original.category,
+                min_price=min_price,
+                max_price=max_price,
+                styles=[style] if style else None
+            )
+            if neighbours is not None:
+                return await self.get_by_ids([neighbour_id for neighbour_id, _ in neighbours])
+        
         # Find alternatives
         stmt = select(Material).where(
             and_(
@@ -172,15 +469,96 @@ class MaterialService:
             )
         )
         
-        if same_price_range:
-            price_range = original.price * 0.2  # 20% range
+        if min_price is not None:
             stmt = stmt.where(
                 and_(
-                    Material.price >= original.price - price_range,
-                    Material.price <= original.price + price_range
+                    Material.price >= min_price,
+                    Material.price <= max_price
                 )
             )
         
-        stmt = stmt.limit(5)
+        if style:
+            stmt = stmt.where(tag_filter(Material.styles, [style]))
+        
+        if original.price is not None:
+            stmt = stmt.order_by(func.abs(Material.price - original.price), Material.id)
+        else:
+            stmt = stmt.order_by(Material.id)
+        stmt = stmt.limit(k)
         result = await self.db.execute(stmt)
-        return result.scalars().all()
\ No newline at end of file
+        return result.scalars().all()
+    
+    def _rerank(self, material_id: int, ranked: List[Tuple[int, float]], k: int) -> List[Tuple[int, float]]:
+        """Blend price-index scores with embedding similarity (0 for candidates without one)"""
+        if material_vectors is None or not ranked:
+            return ranked[:k]
+        similarity = material_vectors.similarities(material_id, [alternative_id for alternative_id, _ in ranked])
+        if similarity is None:
+            return ranked[:k]
+        weight = settings.MATERIAL_ALTERNATIVES_VECTOR_WEIGHT
+        blended = [
+            (alternative_id, (1 - weight) * score + weight * (0.0 if math.isnan(sim) else float(sim)))
+            for (alternative_id, score), sim in zip(ranked, similarity)
+        ]
+        # Stable: equal scores keep the price index's order and tie-break
+        return sorted(blended, key=lambda pair: -pair[1])[:k]
+    
+    async def search_by_color(
+        self,
+        color: str,
+        category: Optional[str] = None,
+        k: int = 20,
+        min_share: float = 0.15,
+        max_distance: Optional[float] = None
+    ) -> Dict:
+        """
+        Materials whose image has a dominant color close to `color` (a color
+        tag such as "walnut", "#rrggbb" or "r,g,b"), nearest first, with the
+        delta E distance and the share of the image that color covers.
+        """
+        lab = parse_color(color)
+        if lab is None:
+            return {"error": f"Unrecognized color: {color}"}
+        if material_colors is not None:
+            await material_colors.refresh()
+        if material_colors is None or material_colors.store is None:
+            return {"error": "Color features are not available"}
+        
+        candidate_ids = None
+        if category:
+            result = await self.db.execute(select(Material.id).where(Material.category == category))
+            candidate_ids = result.scalars().all()
+        matches = material_colors.nearest(lab, k, min_share, candidate_ids, max_distance)
+        materials = {m.id: m for m in await self.get_by_ids([material_id for material_id, _, _ in matches])}
+        return {
+            "color": color,
+            "items": [
+                {"material": materials[material_id], "distance": distance, "share": share}
+                for material_id, distance, share in matches if material_id in materials
+            ]
+        }
+    
+    async def get_similar_colors(self, material_id: int, k: int = 20) -> Dict:
+        """Materials whose image color histogram overlaps most with this material's"""
+        if material_colors is not None:
+            await material_colors.refresh()
+        if material_colors is None or material_colors.store is None:
+            return {"error": "Color features are not available"}
+        matches = material_colors.similar(material_id, k)
+        if matches is None:
+            return {"error": "Material has no color features"}
+        materials = {m.id: m for m in await self.get_by_ids([other_id for other_id, _ in matches])}
+        return {
+            "items": [
+                {"material": materials[other_id], "overlap": overlap}
+                for other_id, overlap in matches if other_id in materials
+            ]
+        }
+    
+    async def get_by_ids(self, material_ids: List[int]) -> List[Material]:
+        """Load materials keeping the order of material_ids"""
+        if not material_ids:
+            return []
+        result = await self.db.execute(select(Material).where(Material.id.in_(material_ids)))
+        by_id = {material.id: material for material in result.scalars()}
+        return [by_id[material_id] for material_id in material_ids if material_id in by_id]
@@ -0,0 +1,155 @@
+import itertools
+import json
+import os
+from typing import Dict, Iterator, List, Optional
+
+from app.core.config import settings
+from app.services.ai_service import kimi_ai
+
+
+# Option ids per quiz step, in the order the steps are asked
+QUIZ_OPTIONS: Dict[int, List[str]] = {
+    1: ["bright", "warm", "minimal", "luxury"],   # overall atmosphere
+    2: ["couple", "family3", "family4", "multigen"],  # household
+    3: ["dog", "cat", "other", "none"],           # pets
+    4: ["minimal", "normal", "lots", "hoarder"]   # storage needs
+}
+
+_ATMOSPHERE_LIKES = {
+    "bright": ["明亮", "通透", "自然光"],
+    "warm": ["温馨", "暖色调", "原木"],
+    "minimal": ["简约", "干净", "留白"],
+    "luxury": ["精致", "品质感", "大理石与金属"]
+}
+_HOUSEHOLD = {
+    "couple": {"family_members": 2, "children": 0},
+    "family3": {"family_members": 3, "children": 1},
+    "family4": {"family_members": 4, "children": 2},
+    "multigen": {"family_members": 6, "children": 1, "special_requirements": "三代同堂，需考虑老人的安全与便利"}
+}
+_PETS = {"dog": "狗", "cat": "猫", "other": "其他宠物", "none": "无"}
+_STORAGE = {"minimal": "少（断舍离）", "normal": "普通", "lots": "较多", "hoarder": "大量（囤货）"}
+
+
+def all_answer_combinations() -> Iterator[Dict[int, str]]:
+    steps = sorted(QUIZ_OPTIONS)
+    for combo in itertools.product(*(QUIZ_OPTIONS[step] for step in steps)):
+        yield dict(zip(steps, combo))
+
+
+def outcome_key(answers: Dict[int, str]) -> Optional[str]:
+    """Table key for a full set of answers, or None if any answer is missing/unknown"""
+    values = []
+    for step, options in sorted(QUIZ_OPTIONS.items()):
+        answer = answers.get(step)
+        if answer not in options:
+            return None
+        values.append(answer)
+    return "|".join(values)
+
+
+def quiz_context(answers: Dict[int, str]) -> Dict:
+    """Translate quiz answers into analyze_style_preferences input"""
+    context = {
+        "likes": _ATMOSPHERE_LIKES.get(answers.get(1), []),
+        "has_pets": _PETS.get(answers.get(3), "无"),
+        "storage_needs": _STORAGE.get(answers.get(4), "普通"),
+        "brightness_preference": answers.get(1, "bright")
+    }
+    context.update(_HOUSEHOLD.get(answers.get(2), {"family_members": 3}))
+    return context
+
+
+def rule_based_outcome(answers: Dict[int, str]) -> Dict:
+    """Deterministic recommendation used when the table has no entry"""
+    primary = {
+        "bright": "北欧风",
+        "warm": "日式原木",
+        "minimal": "现代简约",
+        "luxury": "轻奢"
+    }.get(answers.get(1), "现代简约")
+    styles = [primary]
+    if answers.get(2) == "multigen" and primary != "新中式":
+        styles.append("新中式")
+    elif answers.get(2) in ("family3", "family4") and primary == "轻奢":
+        styles.append("现代简约")
+
+    key_elements = {
+        "北欧风": ["浅色木地板", "白色墙面", "布艺软装"],
+        "日式原木": ["原木家具", "暖光照明", "棉麻织物"],
+        "现代简约": ["无主灯设计", "隐藏式收纳", "中性色墙面"],
+        "轻奢": ["大理石元素", "金属线条", "丝绒家具"]
+    }[primary]
+    tips = []
+    if answers.get(3) in ("dog", "cat", "other"):
+        tips.append("选择耐抓、易清洁的科技布或皮质沙发，地面优先考虑耐磨材料")
+    if answers.get(4) in ("lots", "hoarder"):
+        tips.append("墙面做到顶的定制柜，利用床底和卡座增加收纳")
+    if answers.get(2) == "multigen":
+        tips.append("卫生间做防滑地面并加装扶手，老人房靠近卫生间")
+    if answers.get(2) in ("family3", "family4"):
+        tips.append("客厅预留儿童活动区，家具选择圆角设计")
+
+    return {
+        "recommended_styles": styles,
+        "style_reasoning": f"根据您偏好的整体氛围和家庭情况，推荐以{primary}为主的设计方向。",
+        "key_elements": key_elements,
+        "budget_allocation": {"硬装": "60%", "软装": "30%", "其他": "10%"},
+        "material_suggestions": ["实木复合地板", "环保乳胶漆"],
+        "design_tips": tips or ["保持动线简洁，控制家具数量"]
+    }
+
+
+class QuizOutcomeTable:
+    """
+    Precomputed quiz results for every answer combination.
+
+    The table is a JSON file produced by scripts/build_quiz_outcomes.py and
+    loaded into memory once. It records the style prompt fingerprint it was
+    built with; a table built from an older prompt is still served but is
+    reported as stale so the batch job can be re-run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version: Optional[int] = None
+        self.prompt_fingerprint: Optional[str] = None
+        self.outcomes: Dict[str, Dict] = {}
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.version = data.get("version")
+        self.prompt_fingerprint = data.get("prompt_fingerprint")
+        self.outcomes = data.get("outcomes", {})
+
+    def get(self, answers: Dict[int, str]) -> Optional[Dict]:
+        if not self._loaded:
+            self.load()
+        key = outcome_key(answers)
+        outcome = self.outcomes.get(key) if key else None
+        if outcome is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return outcome
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "version": self.version,
+            "entries": len(self.outcomes),
+            "stale": self.prompt_fingerprint is not None
+                and self.prompt_fingerprint != kimi_ai.style_prompt_fingerprint(),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+quiz_outcome_table = QuizOutcomeTable(settings.QUIZ_OUTCOMES_PATH)
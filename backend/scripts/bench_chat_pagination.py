@@ -0,0 +1,119 @@
+"""
+Benchmark chat history paging: OFFSET/LIMIT vs keyset cursors.
+
+Seeds one chat session with N messages (timestamps deliberately collide)
+and times fetching a page at increasing depths both ways. Requires the
+PostgreSQL database from settings.DATABASE_URL with migrations applied.
+
+    cd backend
+    python -m scripts.bench_chat_pagination --messages 20000 --page-size 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, delete
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.models.models import Base, ChatSession, ChatMessage
+from app.services.chat_service import ChatService, encode_cursor
+
+
+async def seed(db: AsyncSession, count: int) -> int:
+    session = ChatSession(session_type="benchmark")
+    db.add(session)
+    await db.flush()
+
+    start = datetime.utcnow() - timedelta(days=30)
+    batch = []
+    for i in range(count):
+        batch.append({
+            "session_id": session.id,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"benchmark message {i}",
+            "message_type": "text",
+            # Three messages share each timestamp to exercise the id tie-breaker
+            "created_at": start + timedelta(seconds=i // 3)
+        })
+        if len(batch) == 5000:
+            await db.execute(insert(ChatMessage), batch)
+            batch = []
+    if batch:
+        await db.execute(insert(ChatMessage), batch)
+    await db.commit()
+    return session.id
+
+
+async def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded session")
+    args = parser.parse_args()
+
+    engine = create_async_engine(
+        settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with Session() as db:
+        session_id = await seed(db, args.messages)
+        service = ChatService(db)
+
+        print(f"session {session_id}: {args.messages} messages, page size {args.page_size}")
+        print(f"{'depth':>8} {'offset ms':>10} {'keyset ms':>10}")
+        for fraction in (0.0, 0.25, 0.5, 0.75, 0.99):
+            depth = int((args.messages - args.page_size) * fraction)
+
+            async def offset_page():
+                result = await db.execute(
+                    select(ChatMessage)
+                    .where(ChatMessage.session_id == session_id)
+                    .order_by(ChatMessage.created_at)
+                    .offset(depth)
+                    .limit(args.page_size)
+                )
+                result.scalars().all()
+
+            anchor = (await db.execute(
+                select(ChatMessage)
+                .where(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.created_at, ChatMessage.id)
+                .offset(depth)
+                .limit(1)
+            )).scalar_one()
+            cursor = encode_cursor(anchor)
+
+            async def keyset_page():
+                await service.get_messages(session_id, limit=args.page_size, after=cursor)
+
+            offset_ms = await timed(offset_page, args.repeat)
+            keyset_ms = await timed(keyset_page, args.repeat)
+            print(f"{depth:>8} {offset_ms:>10.2f} {keyset_ms:>10.2f}")
+
+        if not args.keep:
+            await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session_id))
+            await db.execute(delete(ChatSession).where(ChatSession.id == session_id))
+            await db.commit()
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
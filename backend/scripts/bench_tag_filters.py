@@ -0,0 +1,109 @@
+"""
+Benchmark material style/color filters: plain JSON vs JSONB with GIN.
+
+Generates N catalog-like rows (skewed tag frequencies, two styles and two
+colors each) into two temporary tables with identical data: one with the
+old JSON columns, filtered by casting every row to jsonb, and one with
+JSONB columns and GIN indexes, filtered with the same tag_filter() the
+service uses. Times a first page and a count for any/all filters over
+common and rare tags. Requires the PostgreSQL database from
+settings.DATABASE_URL; nothing is left behind.
+
+    cd backend
+    python -m scripts.bench_tag_filters --rows 500000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import cast, column, func, select, table, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import settings
+from app.services.material_service import tag_filter
+
+STYLES = ["modern", "nordic", "japanese", "chinese", "luxury", "industrial", "american", "french"]
+COLORS = ["white", "grey", "beige", "wood", "black", "walnut", "gold", "green"]
+
+CASES = [
+    ("styles", ["modern"], "any"),
+    ("styles", ["french"], "any"),
+    ("styles", ["industrial", "french"], "any"),
+    ("styles", ["modern", "nordic"], "all"),
+    ("colors", ["gold", "green"], "all"),
+]
+
+
+def tag_sql(tags) -> str:
+    # Squaring a uniform draw skews picks towards the front of the list
+    values = ", ".join(f"'{tag}'" for tag in tags)
+    return f"(ARRAY[{values}])[1 + floor(power(random(), 2) * {len(tags)})::int]"
+
+
+async def seed(conn, rows: int):
+    await conn.execute(text(
+        "CREATE TEMP TABLE tag_bench_src AS "
+        "SELECT g AS id, "
+        f"jsonb_build_array({tag_sql(STYLES)}, {tag_sql(STYLES)}) AS styles, "
+        f"jsonb_build_array({tag_sql(COLORS)}, {tag_sql(COLORS)}) AS colors "
+        f"FROM generate_series(1, {rows}) g"
+    ))
+    await conn.execute(text(
+        "CREATE TEMP TABLE tag_bench_json AS SELECT id, styles::json AS styles, colors::json AS colors FROM tag_bench_src"
+    ))
+    await conn.execute(text("ALTER TABLE tag_bench_src RENAME TO tag_bench_jsonb"))
+    for name in ("styles", "colors"):
+        await conn.execute(text(f"CREATE INDEX ON tag_bench_jsonb USING gin ({name})"))
+    await conn.execute(text("ANALYZE tag_bench_json"))
+    await conn.execute(text("ANALYZE tag_bench_jsonb"))
+
+
+async def timed(conn, stmt, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await conn.execute(stmt)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    engine = create_async_engine(
+        settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+    )
+    async with engine.connect() as conn:
+        started = time.perf_counter()
+        await seed(conn, args.rows)
+        print(f"seeded {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+        before = table("tag_bench_json", column("id"), column("styles"), column("colors"))
+        after = table("tag_bench_jsonb", column("id"), column("styles", JSONB), column("colors", JSONB))
+
+        print(f"{'filter ms':<32} {'matches':>8} {'json page':>11} {'jsonb page':>11} {'json count':>11} {'jsonb count':>11}")
+        for field, tags, match in CASES:
+            old = tag_filter(cast(before.c[field], JSONB), tags, match)
+            new = tag_filter(after.c[field], tags, match)
+            matches = await conn.scalar(select(func.count()).select_from(after).where(new))
+            timings = [
+                await timed(conn, select(before.c.id).where(old).order_by(before.c.id).limit(args.page_size), args.repeat),
+                await timed(conn, select(after.c.id).where(new).order_by(after.c.id).limit(args.page_size), args.repeat),
+                await timed(conn, select(func.count()).select_from(before).where(old), args.repeat),
+                await timed(conn, select(func.count()).select_from(after).where(new), args.repeat),
+            ]
+            label = f"{field} {match} {'+'.join(tags)}"
+            print(f"{label:<32} {matches:>8} " + " ".join(f"{ms:>11.2f}" for ms in timings))
+
+        await conn.rollback()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Precompute the style quiz outcome table.
+
+Runs the style analysis prompt for every combination of quiz answers and
+writes the results to settings.QUIZ_OUTCOMES_PATH with a bumped version and
+the current prompt fingerprint. Re-run whenever the prompt or model changes
+(/metrics reports the table as stale). Combinations where Kimi fails fall
+back to the rule-based outcome and are listed at the end.
+
+    cd backend
+    python -m scripts.build_quiz_outcomes --concurrency 4
+    python -m scripts.build_quiz_outcomes --rules-only
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+from app.core.config import settings
+from app.core.rate_limit import Priority
+from app.services.ai_service import kimi_ai
+from app.services.quiz_outcomes import (
+    all_answer_combinations, outcome_key, quiz_context, rule_based_outcome
+)
+
+
+def previous_version(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("version", 0)
+
+
+async def build(concurrency: int, rules_only: bool) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes, fallbacks = {}, []
+    combinations = list(all_answer_combinations())
+
+    async def one(answers):
+        key = outcome_key(answers)
+        result = None
+        if not rules_only:
+            async with semaphore:
+                result = await kimi_ai.analyze_style_preferences(
+                    quiz_context(answers), bypass_cache=True, priority=Priority.BATCH
+                )
+            if "error" in result or "analysis_text" in result:
+                result = None
+        if result is None:
+            result = rule_based_outcome(answers)
+            fallbacks.append(key)
+        outcomes[key] = result
+        print(f"[{len(outcomes)}/{len(combinations)}] {key}")
+
+    await asyncio.gather(*(one(answers) for answers in combinations))
+    if fallbacks and not rules_only:
+        print(f"{len(fallbacks)} combinations fell back to rules: {', '.join(sorted(fallbacks))}")
+    return outcomes
+
+
+def write_table(path: str, outcomes: dict, rules_only: bool) -> int:
+    version = previous_version(path) + 1
+    table = {
+        "version": version,
+        "prompt_fingerprint": None if rules_only else kimi_ai.style_prompt_fingerprint(),
+        "model": None if rules_only else kimi_ai.model,
+        "generated_at": datetime.utcnow().isoformat(),
+        "outcomes": dict(sorted(outcomes.items()))
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=1)
+    # Workers reading the old table never see a half-written file
+    os.replace(tmp_path, path)
+    return version
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default=settings.QUIZ_OUTCOMES_PATH)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rules-only", action="store_true", help="skip Kimi and use the rule-based outcomes")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    await kimi_ai.startup()
+    try:
+        outcomes = await build(args.concurrency, args.rules_only)
+    finally:
+        await kimi_ai.shutdown()
+    version = write_table(args.output, outcomes, args.rules_only)
+    print(f"wrote {len(outcomes)} outcomes to {args.output} (version {version}) in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
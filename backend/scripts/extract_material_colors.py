@@ -0,0 +1,50 @@
+"""
+Extract dominant colors and color histograms from material images.
+
+Downloads every material's image_url with bounded concurrency, clusters
+colors in Lab space in a process pool and writes the features to
+MATERIAL_COLOR_FEATURES_PATH for GET /materials/by-color. Safe to stop and
+rerun: materials whose image was already processed are skipped, and a
+running app picks up the new file on its next color query.
+
+    cd backend
+    python -m scripts.extract_material_colors
+    python -m scripts.extract_material_colors --concurrency 64 --workers 8 --retry-failed
+"""
+import argparse
+import asyncio
+
+from app.core.database import async_session, engine
+from app.services.material_colors import MaterialColorJob
+
+
+def report(stats: dict):
+    print(
+        f"{stats['processed']}/{stats['todo']} extracted, {stats['failed']} failed, "
+        f"{stats['transient']} to retry, {stats['images_per_second']:.1f} images/s",
+        flush=True
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, help="parallel downloads")
+    parser.add_argument("--workers", type=int, help="extraction processes (default: one per core)")
+    parser.add_argument("--limit", type=int, help="process at most this many images")
+    parser.add_argument("--retry-failed", action="store_true", help="retry images that failed permanently before")
+    parser.add_argument("--path", help="feature store (default: MATERIAL_COLOR_FEATURES_PATH)")
+    args = parser.parse_args()
+
+    engine.echo = False
+    job = MaterialColorJob(async_session, args.path, args.concurrency, args.workers)
+    try:
+        stats = await job.run(retry_failed=args.retry_failed, limit=args.limit, progress=report)
+    finally:
+        await engine.dispose()
+    report(stats)
+    print(f"{stats['skipped']} already done; store: {stats['store']}")
+    print(f"done in {stats['elapsed_seconds']}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
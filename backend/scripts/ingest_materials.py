@@ -0,0 +1,61 @@
+"""
+Bulk load a supplier catalog (CSV or JSONL) into materials.
+
+Streams the file in chunks, upserting on (supplier, purchase_url). An
+interrupted run resumes after the last committed chunk when started again
+on the same, unchanged file; pass --restart to ignore the checkpoint. The
+run is announced over Redis when it ends, and running app workers then
+rebuild their in-memory indexes in the background.
+
+    cd backend
+    python -m scripts.ingest_materials data/jd_catalog.csv --supplier jd
+    python -m scripts.ingest_materials data/tmall.jsonl --supplier tmall --no-embeddings
+"""
+import argparse
+import asyncio
+
+from app.core.database import async_session, engine
+from app.services.ai_service import kimi_ai
+from app.services.material_cache import material_result_cache
+from app.services.material_ingest import MaterialIngestService
+
+
+def report(stats: dict):
+    print(
+        f"{stats['records']} records, {stats['upserted']} upserted, {stats['rejected']} rejected, "
+        f"{stats['duplicates']} duplicates, {stats['rows_per_second']:.0f} rows/s",
+        flush=True
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--supplier", help="for records without a supplier column")
+    parser.add_argument("--chunk-size", type=int)
+    parser.add_argument("--no-embeddings", action="store_true", help="keep stored embeddings as they are")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    # SQL echo would print every batch
+    engine.echo = False
+    service = MaterialIngestService(
+        async_session, chunk_size=args.chunk_size, embed=not args.no_embeddings, index=False
+    )
+    try:
+        stats = await service.run(
+            args.path, args.format, args.supplier, resume=not args.restart, progress=report
+        )
+    finally:
+        await kimi_ai.shutdown()
+        if material_result_cache is not None:
+            await material_result_cache.close()
+        await engine.dispose()
+    if stats["resumed_from"]:
+        print(f"resumed after {stats['resumed_from']} records")
+    print(f"done in {stats['elapsed_seconds']}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+from app.services.faq_index import build_faq_index
+
+
+def test_personal_questions_go_to_the_model():
+    index = build_faq_index()
+    assert index.match("我家有猫，装修风格推荐哪种？") is None
+    assert index.match("卧室装修风格推荐一下") is None
+
+
+def test_paraphrases_still_match():
+    index = build_faq_index()
+    assert index.match("装修风格有哪些？") is not None
+    assert index.match("新房甲醛多久散完") is not None
+
+
+def test_reapproving_replaces_phrasings():
+    index = build_faq_index()
+    index.add_approved(5, "阳台怎么封比较好", "封阳台建议用断桥铝。")
+    docs = len(index._docs)
+    index.add_approved(5, "阳台怎么封比较好", "封阳台建议用断桥铝。")
+    assert len(index._docs) == docs
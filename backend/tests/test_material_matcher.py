@@ -0,0 +1,50 @@
+import asyncio
+
+from app.core.facet_index import FacetIndex
+from app.services.material_matcher import BudgetMatcher, MATCH_GROUPS, project_budget
+from app.services.material_service import MaterialService
+
+AREA = 90.0
+
+# (category, price_unit, cheapest price, typical price) in yuan
+CATALOG = {
+    "floor": ("per_sqm", 40, 300),
+    "wall": ("per_sqm", 10, 60),
+    "ceiling": ("per_sqm", 30, 150),
+    "door": ("per_piece", 300, 2500),
+    "bathroom": ("per_piece", 500, 4000),
+    "cabinet": ("per_piece", 800, 8000),
+    "lighting": ("per_piece", 50, 600),
+    "furniture": ("per_piece", 300, 5000),
+    "curtain": ("per_sqm", 20, 120),
+}
+
+
+def catalog_index() -> FacetIndex:
+    index = FacetIndex(("category", "styles", "colors", "price_unit"))
+    docs = []
+    for n, (category, (unit, cheap, typical)) in enumerate(CATALOG.items()):
+        for k, price in enumerate((cheap, typical)):
+            styles = ["modern"] if price == typical else []
+            docs.append((n * 10 + k, {"category": category, "styles": styles, "colors": [], "price_unit": unit},
+                         float(price)))
+    index.add(docs)
+    return index
+
+
+def test_project_budget_is_in_wan_yuan():
+    assert project_budget(30, 50, AREA, 1500) == 500000
+    assert project_budget(30, None, AREA, 1500) == 300000
+    assert project_budget(None, None, AREA, 1500) == AREA * 1500
+
+
+def test_realistic_project_budget_affords_typical_materials():
+    budget = project_budget(30, 50, AREA, 1500)
+    tier = asyncio.run(MaterialService(None).get_budget_options(budget, AREA))["standard"]
+    matched = BudgetMatcher(catalog_index()).match(tier["allocations"], tier["total_budget"], AREA, {"modern": 1.0})
+
+    assert not matched["over_budget"]
+    assert matched["total_cost"] <= tier["total_budget"]
+    assert len(matched["groups"]) == len(MATCH_GROUPS)
+    # Room in the budget: every group gets the styled, typical-priced option, not the cheapest
+    assert all(group["selected"]["id"] % 10 == 1 for group in matched["groups"])
@@ -0,0 +1,262 @@
+# Mock Kimi (OpenAI-compatible) API server - 零依赖
+# 用于离线压测/基准测试: 在 backend/.env 中设置 KIMI_API_BASE=http://localhost:8001/v1
+#
+#   python mock_kimi_server.py --ttft 0.3 --token-latency 0.02 --error-rate 0.01 --rate-limit-rate 0.02
+import argparse
+import http.server
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import uuid
+
+parser = argparse.ArgumentParser(description="Mock Kimi chat completions server")
+parser.add_argument("--port", type=int, default=8001)
+parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first token")
+parser.add_argument("--token-latency", type=float, default=0.02, help="seconds between streamed tokens")
+parser.add_argument("--chars-per-token", type=int, default=2, help="characters per streamed token")
+parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+parser.add_argument("--seed", type=int, default=None, help="random seed for repeatable runs")
+args = parser.parse_args()
+
+rng = random.Random(args.seed)
+rng_lock = threading.Lock()
+
+stats = {"requests": 0, "streamed": 0, "errors_injected": 0, "rate_limited": 0}
+stats_lock = threading.Lock()
+
+
+def count(key):
+    with stats_lock:
+        stats[key] += 1
+
+
+def roll(rate):
+    with rng_lock:
+        return rng.random() < rate
+
+
+# Canned replies
+STYLE_REPLY = {
+    "recommended_styles": ["现代简约", "北欧风"],
+    "style_reasoning": "家中有孩子和宠物，推荐耐脏、易打理、动线简洁的现代简约风，搭配北欧风的原木与浅色调营造温馨感。",
+    "key_elements": ["原木色地板", "浅灰色布艺沙发", "隐藏式收纳"],
+    "budget_allocation": {"硬装": "60%", "软装": "30%", "其他": "10%"},
+    "material_suggestions": ["实木复合地板", "乳胶漆", "石英石台面"],
+    "design_tips": ["客厅预留儿童活动区", "选择耐抓的科技布沙发"]
+}
+
+MATERIAL_REPLY = [
+    {
+        "name": "实木复合地板",
+        "brand": "圣象",
+        "price_range": "150-250元/㎡",
+        "pros": ["脚感好", "稳定性强"],
+        "cons": ["怕水泡"],
+        "suitable_for": "客厅、卧室"
+    },
+    {
+        "name": "强化复合地板",
+        "brand": "大自然",
+        "price_range": "80-150元/㎡",
+        "pros": ["耐磨", "性价比高"],
+        "cons": ["脚感偏硬"],
+        "suitable_for": "有宠物家庭"
+    },
+    {
+        "name": "SPC石塑地板",
+        "brand": "德尔",
+        "price_range": "100-180元/㎡",
+        "pros": ["防水", "安装快"],
+        "cons": ["质感一般"],
+        "suitable_for": "厨房、阳台"
+    }
+]
+
+ROOM_DESCRIPTION = (
+    "整体以{style}为基调，墙面采用温润的米白色乳胶漆，地面铺设浅橡木色实木复合地板，"
+    "营造明亮通透的空间感。家具选择线条简洁的布艺与原木组合，主灯采用无主灯设计，"
+    "以筒灯和灯带提供均匀照明，局部点缀绿植与装饰画，兼顾美观与实用。"
+)
+
+TEXT_REPLY = (
+    "根据您的描述，建议优先确定整体风格和预算分配。一般来说硬装约占60%，软装约占30%，"
+    "其余10%用于家电和应急。地面材料可以考虑实木复合地板，兼顾脚感和耐用性；"
+    "墙面推荐环保乳胶漆，颜色以浅色为主，可以让空间显得更宽敞。"
+)
+
+SUMMARY_REPLY = "用户一家三口，有一只狗，偏好明亮简约的风格，预算约30万，正在比较地板材料。"
+
+
+def fenced(obj):
+    body = json.dumps(obj, ensure_ascii=False, indent=2)
+    return f"好的，以下是推荐结果：\n```json\n{body}\n```\n以上建议仅供参考，可以根据实际情况调整。"
+
+
+def build_reply(messages):
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    if "房间列表" in prompt:
+        style = re.search(r"设计风格：(\S+)", prompt)
+        style = style.group(1) if style else "现代简约"
+        rooms = re.findall(r"^(\d+)\. (\S+?)（", prompt, re.M)
+        return fenced([
+            {"index": int(i), "room_type": room, "description": ROOM_DESCRIPTION.format(style=style)}
+            for i, room in rooms
+        ])
+    if "recommended_styles" in prompt:
+        return fenced(STYLE_REPLY)
+    if "price_range" in prompt:
+        return fenced(MATERIAL_REPLY)
+    if "【新增对话】" in prompt:
+        return SUMMARY_REPLY
+    if "设计风格：" in prompt:
+        style = re.search(r"设计风格：(\S+)", prompt)
+        return ROOM_DESCRIPTION.format(style=style.group(1) if style else "现代简约")
+    return TEXT_REPLY
+
+
+def tokenize(text):
+    n = max(1, args.chars_per_token)
+    return [text[i:i + n] for i in range(0, len(text), n)]
+
+
+def usage(messages, completion):
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 2
+    completion_tokens = len(tokenize(completion))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+class KimiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "mock-kimi", "object": "model"}]})
+        elif path.endswith("/stats"):
+            with stats_lock:
+                self.send_json(200, dict(stats))
+        else:
+            self.send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length > 0 else b"{}"
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self.send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+
+        count("requests")
+        if roll(args.rate_limit_rate):
+            count("rate_limited")
+            self.send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_reached_error"}},
+                {"Retry-After": str(args.retry_after)}
+            )
+            return
+        if roll(args.error_rate):
+            count("errors_injected")
+            time.sleep(args.ttft)
+            self.send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return
+
+        messages = request.get("messages", [])
+        model = request.get("model", "mock-kimi")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        reply = build_reply(messages)
+
+        if request.get("stream"):
+            count("streamed")
+            self.stream_reply(completion_id, model, reply)
+        else:
+            time.sleep(args.ttft + args.token_latency * len(tokenize(reply)))
+            self.send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage(messages, reply)
+            })
+
+    def stream_reply(self, completion_id, model, reply):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+
+        try:
+            time.sleep(args.ttft)
+            self.write_chunk(event({"role": "assistant"}))
+            for token in tokenize(reply):
+                self.write_chunk(event({"content": token}))
+                time.sleep(args.token_latency)
+            self.write_chunk(event({}, "stop"))
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client stopped reading early (e.g. JSON already extracted)
+            self.close_connection = True
+
+
+class ThreadingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+print("🤖 Mock Kimi API server")
+print(f"   TTFT={args.ttft}s  token latency={args.token_latency}s  "
+      f"errors={args.error_rate:.0%}  429s={args.rate_limit_rate:.0%}")
+print(f"🌐 KIMI_API_BASE=http://localhost:{args.port}/v1")
+print(f"📊 Stats: http://localhost:{args.port}/v1/stats")
+print("Press Ctrl+C to stop")
+
+with ThreadingServer(("", args.port), KimiHandler) as httpd:
+    httpd.serve_forever()